@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import dj_database_url
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'finances.metrics.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,12 +88,43 @@ WSGI_APPLICATION = 'budget_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_URL (the Postgres connection string in render.yaml) selects the
+# database; without it the SQLite file next to manage.py is used.
+# Connections persist for DB_CONN_MAX_AGE seconds (0 closes them after every
+# request) and are checked before they're reused. Behind a transaction-pooling
+# proxy such as PgBouncer set DB_DISABLE_SERVER_SIDE_CURSORS=True, since the
+# server-side cursors of QuerySet.iterator() don't survive between
+# transactions there.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') != 'False'
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL:
+    DATABASES = {
+        'default': dj_database_url.parse(
+            DATABASE_URL,
+            conn_max_age=DB_CONN_MAX_AGE,
+            conn_health_checks=DB_CONN_HEALTH_CHECKS,
+            ssl_require=os.environ.get('DB_SSL_REQUIRE', 'False') == 'True',
+        ),
     }
-}
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = (
+            os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True'
+        )
+        DATABASES['default'].setdefault('OPTIONS', {})['connect_timeout'] = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        }
+    }
+
+# SQLite connections switch to WAL mode with synchronous=NORMAL and wait up to
+# this many milliseconds for the write lock (finances.db.configure_sqlite)
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
 
 
 # Password validation
@@ -146,3 +179,81 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'home'
+
+# Scheduled transactions worker (python manage.py run_scheduler)
+SCHEDULER_BATCH_SIZE = int(os.environ.get('SCHEDULER_BATCH_SIZE', 100))
+SCHEDULER_POLL_INTERVAL = float(os.environ.get('SCHEDULER_POLL_INTERVAL', 60))
+
+# Transaction imports are inserted in chunks of this many rows
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+
+# Transaction exports are read from the database in chunks of this many rows
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Per-view wall time, query count, query time and response size histograms,
+# served to staff at /api/metrics/ (finances.metrics.RequestMetricsMiddleware)
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', 'True') != 'False'
+
+# Logging. Every module logs on its own logger (finances.views,
+# finances.models, finances.metrics, ...). LOG_LEVEL sets the level of the
+# finances loggers; debug output is off unless it's set to DEBUG. With
+# LOG_QUEUE=True the records are written by a background thread, so requests
+# don't wait on the log stream (finances.log_handlers.QueueLogHandler).
+# The per-request line of the metrics middleware is logged at INFO on
+# finances.metrics, which only logs warnings unless METRICS_LOG_LEVEL=INFO.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+METRICS_LOG_LEVEL = os.environ.get('METRICS_LOG_LEVEL', 'WARNING').upper()
+LOG_QUEUE = os.environ.get('LOG_QUEUE', 'False') == 'True'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': 'time=%(asctime)s level=%(levelname)s logger=%(name)s pid=%(process)d %(message)s',
+        },
+    },
+    'handlers': {
+        'console': (
+            {'()': 'finances.log_handlers.QueueLogHandler', 'formatter': 'structured'}
+            if LOG_QUEUE else
+            {'class': 'logging.StreamHandler', 'formatter': 'structured'}
+        ),
+    },
+    'loggers': {
+        'finances': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'finances.metrics': {
+            'level': METRICS_LOG_LEVEL,
+        },
+    },
+}
+
+# Percentages of a budget's amount at which the dashboard warns about its spend
+BUDGET_WARNING_THRESHOLDS = [int(value) for value in os.environ.get('BUDGET_WARNING_THRESHOLDS', '80,100').split(',')]
+
+# Cache for the chart and summary aggregates. It holds the per-user versions
+# that writes bump, so every process that writes (the web workers and
+# run_scheduler) must share it. CACHE_URL selects the backend:
+# db://table (a table in the database; create it with
+# `manage.py createcachetable`), redis://host:port/db (needs the redis
+# package), file:///path/to/dir (one host only), dummy:// to disable caching,
+# or locmem:// (per process). The default is db://finances_cache, or
+# locmem:// with DEBUG on; set CACHE_URL=db://finances_cache when running
+# run_scheduler next to the development server.
+CACHE_URL = os.environ.get('CACHE_URL', 'locmem://' if DEBUG else 'db://finances_cache')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('file://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_URL[len('file://'):]}}
+elif CACHE_URL.startswith('dummy://') or (CACHE_URL.startswith('locmem://') and not DEBUG):
+    # A per-process cache would keep serving aggregates that another worker
+    # invalidated, so outside DEBUG locmem:// turns caching off instead
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+elif CACHE_URL.startswith('locmem://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budget-tracker'}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': CACHE_URL[len('db://'):] or 'finances_cache'}}
+AGGREGATE_CACHE_TIMEOUT = int(os.environ.get('AGGREGATE_CACHE_TIMEOUT', 60 * 60))
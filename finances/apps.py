@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class FinancesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'finances'
+
+    def ready(self):
+        # Invalidate cached aggregates when the underlying data changes
+        from . import signals  # noqa: F401
+
+        from django.db.backends.signals import connection_created
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite)
@@ -0,0 +1,132 @@
+"""
+Per-user cache for the chart and summary aggregates.
+
+Every cached value is stored under the user's current cache version. Any write
+to the user's data bumps the version (see signals.py), so stale entries are
+never read again and simply expire. The backend is whatever CACHES['default']
+is configured to, and hit/miss counters are kept in the same cache. The
+versions and counters are only shared between processes when the backend is
+(the database or redis, not locmem; see CACHE_URL in the settings).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+
+# Aggregates cached by the views, used to report hit/miss counters
+AGGREGATE_NAMES = (
+    'charts',
+    'charts_time',
+    'charts_future',
+    'monthly_summary',
+    'dashboard',
+    'categories',
+    'schedule_failures',
+)
+
+KEY_PREFIX = 'finances:aggregates'
+
+_MISSING = object()
+
+def get_cache():
+    return caches[getattr(settings, 'AGGREGATE_CACHE_ALIAS', 'default')]
+
+def _version_key(user_id):
+    return f'{KEY_PREFIX}:version:{user_id}'
+
+def _stats_key(name, outcome):
+    return f'{KEY_PREFIX}:stats:{name}:{outcome}'
+
+def _new_version():
+    # Time based, so a version key that was evicted never restarts at a value
+    # that older entries are still stored under
+    return time.time_ns()
+
+def get_user_cache_version(user_id):
+    """Return the current cache version of a user, creating it if needed."""
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = _new_version()
+        if not cache.add(_version_key(user_id), version, None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+def _bump_user_cache_version(user_id):
+    cache = get_cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), _new_version(), None)
+
+def invalidate_user_cache(user_id):
+    """
+    Drop every cached aggregate of a user.
+
+    The version is bumped right away, so the current request sees its own
+    writes, and again once the database transaction commits, so a concurrent
+    request can't keep a value it computed from the uncommitted state.
+    """
+    _bump_user_cache_version(user_id)
+    db_transaction.on_commit(lambda: _bump_user_cache_version(user_id))
+
+def _record(name, outcome):
+    cache = get_cache()
+    key = _stats_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+def cached_aggregate(user, name, params, compute):
+    """
+    Return a cached aggregate of a user, computing and storing it on a miss.
+
+    Args:
+        user: The user the aggregate belongs to
+        name: Name of the aggregate (one of AGGREGATE_NAMES)
+        params: Values the result depends on, e.g. the date range or today's date
+        compute: Callable without arguments that computes the value
+
+    Returns:
+        The cached or freshly computed value
+    """
+    cache = get_cache()
+    params_hash = hashlib.md5(repr(params).encode()).hexdigest()
+    key = f'{KEY_PREFIX}:{user.pk}:{get_user_cache_version(user.pk)}:{name}:{params_hash}'
+
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _record(name, 'hits')
+        return value
+
+    _record(name, 'misses')
+    value = compute()
+    cache.set(key, value, settings.AGGREGATE_CACHE_TIMEOUT)
+    return value
+
+def get_cache_stats():
+    """Return hit/miss counters and the hit rate of every cached aggregate."""
+    cache = get_cache()
+    counters = cache.get_many([
+        _stats_key(name, outcome) for name in AGGREGATE_NAMES for outcome in ('hits', 'misses')
+    ])
+    stats = {}
+    for name in AGGREGATE_NAMES:
+        hits = counters.get(_stats_key(name, 'hits'), 0)
+        misses = counters.get(_stats_key(name, 'misses'), 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
+
+def reset_cache_stats():
+    """Reset the hit/miss counters of every cached aggregate."""
+    get_cache().delete_many([
+        _stats_key(name, outcome) for name in AGGREGATE_NAMES for outcome in ('hits', 'misses')
+    ])
@@ -0,0 +1,20 @@
+"""
+Per-connection database setup.
+
+configure_sqlite() runs on the connection_created signal for every new SQLite
+connection. It turns on write-ahead logging, so readers and the writer don't
+block each other, lowers the fsyncs to synchronous=NORMAL, which is still
+crash-safe in WAL mode, and sets a busy timeout, so a connection waits for the
+write lock held by another worker instead of failing with "database is locked".
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # On the raw connection, so the pragmas stay out of the query log
+    raw = connection.connection
+    raw.execute('PRAGMA journal_mode=WAL')
+    raw.execute('PRAGMA synchronous=NORMAL')
+    raw.execute(f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}')
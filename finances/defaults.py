@@ -0,0 +1,79 @@
+"""
+Default categories every new user starts with.
+
+The templates are plain data: each category has a name, icon and type, and may
+list subcategories with a name and icon. provision_default_categories() creates
+them for any number of users with bulk inserts.
+"""
+from django.db import transaction as db_transaction
+
+from .cache import invalidate_user_cache
+from .models import Category, SubCategory
+
+DEFAULT_CATEGORIES = [
+    # Income
+    {'name': 'Salary/Wages', 'icon': 'bi-cash-coin', 'type': 'income'},
+    {'name': 'Business Income', 'icon': 'bi-shop', 'type': 'income'},
+    {'name': 'Investments', 'icon': 'bi-graph-up-arrow', 'type': 'income'},
+    {'name': 'Other Income', 'icon': 'bi-wallet2', 'type': 'income'},
+    # Expenses
+    {'name': 'Housing', 'icon': 'bi-house', 'type': 'expense'},
+    {'name': 'Utilities', 'icon': 'bi-lightning', 'type': 'expense'},
+    {'name': 'Food', 'icon': 'bi-cup-hot', 'type': 'expense'},
+    {'name': 'Transportation', 'icon': 'bi-truck', 'type': 'expense'},
+    {'name': 'Insurance', 'icon': 'bi-shield', 'type': 'expense'},
+    {'name': 'Entertainment', 'icon': 'bi-music-note-beamed', 'type': 'expense'},
+    {'name': 'Healthcare', 'icon': 'bi-heart-pulse', 'type': 'expense'},
+    {'name': 'Debt Payments', 'icon': 'bi-credit-card', 'type': 'expense'},
+    {'name': 'Savings/Investments', 'icon': 'bi-piggy-bank', 'type': 'expense'},
+    {'name': 'Miscellaneous', 'icon': 'bi-three-dots', 'type': 'expense'},
+]
+
+PROVISION_BATCH_SIZE = 1000
+
+def provision_default_categories(users, templates=None):
+    """
+    Create the default categories, and their subcategories, for users.
+
+    All categories are inserted with one bulk_create (per batch of
+    PROVISION_BATCH_SIZE rows), and all subcategories with another.
+
+    Args:
+        users: The users to create the categories for
+        templates: Category templates, DEFAULT_CATEGORIES by default
+
+    Returns:
+        The number of categories created
+    """
+    templates = DEFAULT_CATEGORIES if templates is None else templates
+    users = list(users)
+
+    with db_transaction.atomic():
+        categories = Category.objects.bulk_create([
+            Category(user=user, name=template['name'], icon=template['icon'], type=template['type'])
+            for user in users
+            for template in templates
+        ], batch_size=PROVISION_BATCH_SIZE)
+
+        if any(template.get('subcategories') for template in templates):
+            if any(category.pk is None for category in categories):
+                # The database doesn't return the ids of bulk inserted rows
+                categories = list(Category.objects.filter(
+                    user__in=users, name__in=[template['name'] for template in templates]
+                ).order_by('user_id', 'pk'))
+            category_ids = {(category.user_id, category.name): category.pk for category in categories}
+            SubCategory.objects.bulk_create([
+                SubCategory(
+                    parent_category_id=category_ids[(user.pk, template['name'])],
+                    name=subcategory['name'],
+                    icon=subcategory.get('icon', 'bi-tag-fill'),
+                )
+                for user in users
+                for template in templates
+                for subcategory in template.get('subcategories', ())
+            ], batch_size=PROVISION_BATCH_SIZE)
+
+    # bulk_create sends no signals
+    for user in users:
+        invalidate_user_cache(user.pk)
+    return len(categories)
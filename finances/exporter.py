@@ -0,0 +1,169 @@
+"""
+Streaming transaction export.
+
+Exports are read from the database with values_list() in chunks and written
+to the response as they are produced, so memory use doesn't grow with the size
+of the export and the first bytes reach the client right away. XLSX files
+can't be written front to back, so they are built in temporary files instead.
+"""
+import csv
+import io
+import json
+import pickle
+import tempfile
+from datetime import date, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+# Text is sent to the client in pieces of about this many characters
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# Exportable transaction fields and the values_list() lookups they're read from
+TRANSACTION_EXPORT_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'amount': 'amount',
+    'currency': 'currency',
+    'date': 'date',
+    'time': 'time',
+    'type': 'type',
+    'category': 'category__name',
+    'subcategory': 'subcategory__name',
+    'account': 'transaction_account__name',
+    'notes': 'notes',
+    'photo': 'photo',
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Rows are spooled to disk in batches of this many rows while building an XLSX file
+XLSX_SPOOL_BATCH_SIZE = 1000
+
+def iter_values(queryset, lookups):
+    """Iterate over the rows of a queryset as tuples, fetched in chunks."""
+    return queryset.values_list(*lookups).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+def iter_csv(header, rows, delimiter=','):
+    """Yield a CSV file with the given header and rows piece by piece."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, time):
+        return value.strftime('%H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def iter_json(records, ndjson=False):
+    """
+    Yield a JSON array of the records piece by piece.
+
+    With ndjson the records are written one per line instead (JSON Lines),
+    which clients can parse without reading the whole file.
+    """
+    pieces = [] if ndjson else ['[\n']
+    size = 0
+    separator = '' if ndjson else ',\n'
+    first = True
+    for record in records:
+        piece = json.dumps(record, default=_json_default)
+        if ndjson:
+            piece += '\n'
+        elif not first:
+            piece = separator + piece
+        first = False
+        pieces.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(pieces)
+            pieces = []
+            size = 0
+    if not ndjson:
+        pieces.append('\n]\n' if not first else ']\n')
+    yield ''.join(pieces)
+
+def write_xlsx(header, rows, title='Transactions', header_font=None, header_fill=None):
+    """
+    Write the header and rows to an XLSX workbook in a temporary file.
+
+    The workbook is written in openpyxl's write-only mode, which keeps only
+    the current row in memory. Column widths have to be set before the first
+    row in that mode, so the rows are first spooled to disk while the widest
+    value of every column is tracked, and then replayed into the sheet.
+
+    Returns:
+        The temporary file, positioned at its start
+    """
+    widths = [len(str(name)) for name in header]
+    with tempfile.TemporaryFile() as spool:
+        batch = []
+        for row in rows:
+            for index, value in enumerate(row):
+                if value is not None:
+                    widths[index] = max(widths[index], len(str(value)))
+            batch.append(row)
+            if len(batch) >= XLSX_SPOOL_BATCH_SIZE:
+                pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+        spool.seek(0)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title)
+        for index, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(index)].width = width + 2
+
+        header_cells = []
+        for name in header:
+            cell = WriteOnlyCell(ws, value=name)
+            if header_font:
+                cell.font = header_font
+            if header_fill:
+                cell.fill = header_fill
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        while True:
+            try:
+                batch = pickle.load(spool)
+            except EOFError:
+                break
+            for row in batch:
+                ws.append(row)
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def xlsx_attachment(file, filename):
+    """Return a FileResponse that streams an XLSX file built by write_xlsx and closes it."""
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=CONTENT_TYPES['xlsx'])
+
+def streaming_attachment(content, file_format, filename):
+    """Return a StreamingHttpResponse that downloads the content as a file."""
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
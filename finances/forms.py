@@ -2,6 +2,9 @@ from django import forms
 from .models import Transaction, Category, Budget, Account, DebitAccount, CreditAccount, Wallet, Debt, SubCategory, ScheduledTransaction
 from django.utils import timezone
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class TransactionForm(forms.ModelForm):
     class Meta:
@@ -65,15 +68,15 @@ class ScheduledTransactionForm(forms.ModelForm):
             if 'transaction_type' in self.data:
                 transaction_type = self.data.get('transaction_type')
                 if transaction_type == 'income':
-                    self.fields['account'].queryset = Account.objects.filter(
+                    self.fields['account'].queryset = Account.objects.with_subtypes().filter(
                         user=self.user
                     ).exclude(
-                        creditaccount__isnull=False
+                        account_type='credit'
                     )
                 else:
-                    self.fields['account'].queryset = Account.objects.filter(user=self.user)
+                    self.fields['account'].queryset = Account.objects.with_subtypes().filter(user=self.user)
             else:
-                self.fields['account'].queryset = Account.objects.filter(user=self.user)
+                self.fields['account'].queryset = Account.objects.with_subtypes().filter(user=self.user)
 
             # Initialize repeats field based on repeat_type
             if 'repeat_type' in self.data:
@@ -115,17 +118,19 @@ class ScheduledTransactionForm(forms.ModelForm):
         repeats = cleaned_data.get('repeats')
 
         if account and amount and transaction_type == 'expense':  # Only validate balance for expenses
-            if hasattr(account, 'creditaccount'):
-                available_balance = account.creditaccount.credit_limit - account.creditaccount.current_usage
+            account_type = account.get_account_type()
+            account_instance = account.concrete
+            if account_type == 'credit':
+                available_balance = account_instance.credit_limit - account_instance.current_usage
                 if amount > available_balance:
                     raise forms.ValidationError(f"The scheduled amount exceeds the available balance in your credit account. Available balance: {available_balance} USD.")
-            elif hasattr(account, 'debitaccount'):
-                available_balance = account.debitaccount.balance - (account.debitaccount.maintaining_balance or 0)
+            elif account_type == 'debit':
+                available_balance = account_instance.balance - (account_instance.maintaining_balance or 0)
                 if amount > available_balance:
                     raise forms.ValidationError(f"The scheduled amount exceeds the available balance in your debit account. Available balance: {available_balance} USD.")
-            elif hasattr(account, 'wallet'):
-                if amount > account.wallet.balance:
-                    raise forms.ValidationError(f"The scheduled amount exceeds the available balance in your wallet. Available balance: {account.wallet.balance} USD.")
+            elif account_type == 'wallet':
+                if amount > account_instance.balance:
+                    raise forms.ValidationError(f"The scheduled amount exceeds the available balance in your wallet. Available balance: {account_instance.balance} USD.")
         return cleaned_data
 
 class DebtForm(forms.ModelForm):
@@ -186,20 +191,17 @@ class CategoryForm(forms.ModelForm):
         Ensure the type field is properly formatted
         """
         type_value = self.cleaned_data.get('type')
-        print(f"Cleaning type value: {type_value}")
         
         # If type is 'expenses', convert to 'expense'
         if type_value == 'expenses':
             type_value = 'expense'
-            print(f"Converted 'expenses' to 'expense'")
         
         # Ensure it's one of the valid choices
         valid_types = dict(Category.CATEGORY_TYPES).keys()
         if type_value not in valid_types:
-            print(f"Invalid type '{type_value}', defaulting to 'expense'")
+            logger.debug("Invalid category type %r, defaulting to 'expense'", type_value)
             return 'expense'  # Default to expense if invalid
             
-        print(f"Final type value: {type_value}")
         return type_value
 
 class SubCategoryForm(forms.ModelForm):
@@ -288,7 +290,9 @@ class ExportForm(forms.Form):
     format = forms.ChoiceField(
         choices=[
             ('csv', 'CSV'),
-            ('xlsx', 'Excel')
+            ('xlsx', 'Excel'),
+            ('json', 'JSON'),
+            ('ndjson', 'JSON Lines')
         ],
         initial='csv',
         widget=forms.Select(attrs={'class': 'form-control'})
@@ -0,0 +1,344 @@
+"""
+Bulk transaction import.
+
+Rows are streamed through three stages: parsing, resolving (categories,
+accounts and duplicates from in-memory maps loaded once per import) and
+inserting with bulk_create in chunks. The whole import runs in one database
+transaction, so a file is either imported completely or not at all; rows that
+can't be parsed are skipped and listed in the report.
+"""
+import csv
+import hashlib
+import io
+import time
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from .cache import invalidate_user_cache
+from .models import Account, Category, Transaction
+from .rollups import new_deltas, add_transaction_delta, get_stored_values, add_stored_delta, apply_rollup_deltas
+
+# Columns of the files exported by import_export_data, and the row keys they map to
+EXPORT_COLUMNS = {
+    'Date': 'date',
+    'Title': 'title',
+    'Amount': 'amount',
+    'Type': 'type',
+    'Category': 'category',
+    'Account': 'account',
+    'Notes': 'notes',
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S')
+
+# Errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+class ImportFileError(ValueError):
+    """Raised when a file can't be imported at all."""
+
+class ImportReport:
+    """Outcome of an import: row counts, errors and throughput."""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.unknown_accounts = set()
+        self.seconds = 0.0
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'unknown_accounts': sorted(self.unknown_accounts),
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+def iter_csv_rows(file, columns=EXPORT_COLUMNS):
+    """
+    Stream the rows of an uploaded CSV file as dicts keyed by row key.
+
+    The delimiter is detected from the header, so files exported with any
+    separator can be imported back.
+
+    Raises ImportFileError when a column is missing.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    header_line = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    header = next(csv.reader([header_line], dialect))
+    yield from _iter_mapped_rows(header, csv.reader(text, dialect), columns)
+
+def iter_xlsx_rows(file, columns=EXPORT_COLUMNS):
+    """
+    Stream the rows of the active sheet of an uploaded XLSX file as dicts.
+
+    The workbook is opened in read-only mode, which parses the sheet while it
+    is iterated instead of loading every cell first.
+
+    Raises ImportFileError when a column is missing.
+    """
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        yield from _iter_mapped_rows(header, rows, columns)
+    finally:
+        wb.close()
+
+def iter_file_rows(file):
+    """Stream the rows of an uploaded CSV or XLSX file, chosen by its extension."""
+    file_format = file.name.split('.')[-1].lower()
+    if file_format == 'csv':
+        return iter_csv_rows(file)
+    if file_format == 'xlsx':
+        return iter_xlsx_rows(file)
+    raise ImportFileError('Only CSV and Excel files exported from this system are supported.')
+
+def _iter_mapped_rows(header, rows, columns):
+    header = [str(name).strip() if name is not None else '' for name in header]
+    missing = [name for name in columns if name not in header]
+    if missing:
+        raise ImportFileError('Invalid file format. This file does not match the export format from this system.')
+    positions = [(header.index(name), key) for name, key in columns.items()]
+    for row in rows:
+        yield {key: row[position] if position < len(row) else None for position, key in positions}
+
+def parse_date(value, date_formats=DATE_FORMATS):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date '{value}'")
+
+def parse_amount(value):
+    try:
+        return Decimal(str(value).strip().replace(',', '.')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount '{value}'")
+
+def duplicate_key(title, amount, date):
+    """Compact hash of the fields that identify a duplicate transaction."""
+    return hashlib.blake2b(f'{title}\x1f{amount}\x1f{date.isoformat()}'.encode(), digest_size=16).digest()
+
+class TransactionImporter:
+    """
+    Import transactions for a user from an iterable of row dicts.
+
+    Each row has the keys title, amount, date, type and optionally category,
+    account and notes. duplicate_handling decides what happens to a row with
+    the same title, amount and date as an existing transaction: 'skip' it,
+    'update' the existing one or 'create_new' anyway.
+    """
+
+    def __init__(self, user, duplicate_handling='skip', chunk_size=None, date_formats=DATE_FORMATS):
+        self.user = user
+        self.duplicate_handling = duplicate_handling
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.date_formats = date_formats
+
+    def run(self, rows):
+        """Import the rows and return an ImportReport."""
+        report = ImportReport()
+        started = time.perf_counter()
+
+        with db_transaction.atomic():
+            self._load_maps()
+            chunk = []
+            for row_number, row in enumerate(rows, start=2):  # row 1 is the header
+                # Blank lines, and the empty rows a sheet can end with
+                if all(value in (None, '') for value in row.values()):
+                    continue
+                report.rows += 1
+                try:
+                    chunk.append(self._parse_row(row))
+                except (KeyError, ValueError) as e:
+                    report.add_error(row_number, str(e))
+                    continue
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(chunk, report)
+                    chunk = []
+            if chunk:
+                self._import_chunk(chunk, report)
+            apply_rollup_deltas(self.rollup_deltas)
+
+        # bulk_create and bulk_update send no signals
+        invalidate_user_cache(self.user.pk)
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def _load_maps(self):
+        self.categories = {}
+        for category in Category.objects.filter(user=self.user):
+            self.categories.setdefault(category.name, category)
+        self.accounts = {}
+        for account in Account.objects.filter(user=self.user):
+            self.accounts.setdefault(account.name, account)
+        # Duplicate keys are loaded per date range the first time it's needed
+        self.existing = {}
+        self.loaded_range = None
+        # Rollup changes of every chunk, applied once at the end
+        self.rollup_deltas = new_deltas()
+
+    def _parse_row(self, row):
+        title = str(row['title'] or '').strip()
+        if not title:
+            raise ValueError('Missing title')
+        transaction_type = str(row['type'] or '').strip().lower()
+        if transaction_type not in ('income', 'expense'):
+            raise ValueError(f"Invalid type '{row['type']}'")
+        return {
+            'title': title,
+            'amount': parse_amount(row['amount']),
+            'date': parse_date(row['date'], self.date_formats),
+            'type': transaction_type,
+            'category': str(row.get('category') or '').strip(),
+            'account': str(row.get('account') or '').strip(),
+            'notes': str(row.get('notes') or ''),
+        }
+
+    def _load_existing(self, start, end):
+        """Make sure the duplicate keys of every transaction from start to end are loaded."""
+        if self.loaded_range is None:
+            missing = [(start, end)]
+            self.loaded_range = (start, end)
+        else:
+            loaded_start, loaded_end = self.loaded_range
+            missing = []
+            if start < loaded_start:
+                missing.append((start, loaded_start))
+            if end > loaded_end:
+                missing.append((loaded_end, end))
+            self.loaded_range = (min(start, loaded_start), max(end, loaded_end))
+
+        for range_start, range_end in missing:
+            # Range edges may already be loaded, setdefault keeps the first match
+            existing = Transaction.objects.filter(
+                user=self.user, date__range=(range_start, range_end)
+            ).values_list('id', 'title', 'amount', 'date')
+            for pk, title, amount, date in existing.iterator(chunk_size=self.chunk_size):
+                self.existing.setdefault(duplicate_key(title, amount, date), pk)
+
+    def _resolve_categories(self, chunk):
+        """Create the categories the chunk mentions that don't exist yet."""
+        new_categories = {}
+        for row in chunk:
+            name = row['category']
+            if name and name not in self.categories and name not in new_categories:
+                new_categories[name] = Category(user=self.user, name=name, type=row['type'])
+        if new_categories:
+            # Categories are created with their ids on every supported database
+            created = Category.objects.bulk_create(new_categories.values())
+            if any(category.pk is None for category in created):
+                created = Category.objects.filter(user=self.user, name__in=new_categories)
+            for category in created:
+                self.categories.setdefault(category.name, category)
+
+    def _import_chunk(self, chunk, report):
+        if self.duplicate_handling != 'create_new':
+            self._load_existing(min(row['date'] for row in chunk), max(row['date'] for row in chunk))
+        self._resolve_categories(chunk)
+
+        new_transactions = []
+        # Existing transactions to update by id, so later rows change the same object
+        updated = {}
+        # Unsaved transactions of this chunk by duplicate key, their ids are known after the insert
+        pending = {}
+        for row in chunk:
+            category = self.categories.get(row['category']) if row['category'] else None
+            account = self.accounts.get(row['account']) if row['account'] else None
+            if row['account'] and account is None:
+                report.unknown_accounts.add(row['account'])
+
+            if self.duplicate_handling != 'create_new':
+                key = duplicate_key(row['title'], row['amount'], row['date'])
+                duplicate = pending.get(key)
+                existing_id = self.existing.get(key)
+                if duplicate is not None or existing_id is not None:
+                    if self.duplicate_handling == 'skip':
+                        report.skipped += 1
+                        continue
+                    if duplicate is None:
+                        duplicate = updated.get(existing_id)
+                    if duplicate is None:
+                        duplicate = updated[existing_id] = Transaction(id=existing_id)
+                    duplicate.type = row['type']
+                    duplicate.category = category
+                    duplicate.transaction_account = account
+                    duplicate.notes = row['notes']
+                    report.updated += 1
+                    continue
+
+            transaction = Transaction(
+                user=self.user,
+                title=row['title'],
+                amount=row['amount'],
+                date=row['date'],
+                type=row['type'],
+                category=category,
+                transaction_account=account,
+                notes=row['notes'],
+            )
+            new_transactions.append(transaction)
+            # Rows repeated later in the file are duplicates of this one
+            if self.duplicate_handling != 'create_new':
+                pending[key] = transaction
+
+        Transaction.objects.bulk_create(new_transactions, batch_size=self.chunk_size)
+        report.created += len(new_transactions)
+        for key, transaction in pending.items():
+            self.existing[key] = transaction.pk
+
+        deltas = self.rollup_deltas
+        for transaction in new_transactions:
+            add_transaction_delta(deltas, transaction)
+
+        updated_transactions = list(updated.values())
+        if updated_transactions:
+            # Move the rollups of the updated transactions from their stored values to the new ones
+            stored = get_stored_values([transaction.pk for transaction in updated_transactions])
+            for transaction in updated_transactions:
+                values = stored[transaction.pk]
+                add_stored_delta(deltas, values, sign=-1)
+                add_stored_delta(deltas, {
+                    **values,
+                    'type': transaction.type,
+                    'category_id': transaction.category_id,
+                    'transaction_account_id': transaction.transaction_account_id,
+                })
+            Transaction.objects.bulk_update(
+                updated_transactions,
+                ['type', 'category', 'transaction_account', 'notes'],
+                batch_size=self.chunk_size,
+            )
@@ -0,0 +1,39 @@
+"""
+Logging handlers.
+
+QueueLogHandler makes logging non-blocking: the logging call only puts the
+record on a queue, and a background thread writes it to the stream. It's used
+by the LOGGING configuration in the settings when LOG_QUEUE is on.
+"""
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    A QueueHandler that starts its own listener thread writing to a stream.
+
+    The record is formatted by this handler, in the thread that logs it, so the
+    message arguments are resolved before it's queued; the listener only writes
+    the formatted line.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        target = logging.StreamHandler(stream if stream is not None else sys.stderr)
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+        # Write the queued records before the process exits
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write the queued records and stop the listener thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
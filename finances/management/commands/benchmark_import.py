@@ -0,0 +1,111 @@
+import io
+import random
+import resource
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+
+from finances.exporter import iter_csv, write_xlsx
+from finances.importer import TransactionImporter, iter_csv_rows, iter_xlsx_rows, EXPORT_COLUMNS
+
+
+class Rollback(Exception):
+    pass
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput and memory use of the transaction import on a generated file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=20000,
+            help='Number of rows in the generated file (default: 20000)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'xlsx'],
+            default='csv',
+            help='Format of the generated file (default: csv)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Rows per bulk insert (default: IMPORT_CHUNK_SIZE)',
+        )
+        parser.add_argument(
+            '--duplicates',
+            type=float,
+            default=0.1,
+            help='Share of rows imported twice to exercise the duplicate check (default: 0.1)',
+        )
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def handle(self, *args, **options):
+        self.queries = 0
+        rows = self.generate_rows(options['rows'], options['duplicates'])
+        if options['format'] == 'csv':
+            file = io.BytesIO(''.join(iter_csv(list(EXPORT_COLUMNS), rows, delimiter=';')).encode())
+            read_rows = iter_csv_rows
+        else:
+            file = write_xlsx(list(EXPORT_COLUMNS), rows)
+            read_rows = iter_xlsx_rows
+        rss_before = peak_rss_mb()
+
+        # Everything runs for a throwaway user and is rolled back afterwards
+        try:
+            with db_transaction.atomic():
+                user = User.objects.create_user(username='benchmark-import')
+                importer = TransactionImporter(user, chunk_size=options['chunk_size'])
+                with connection.execute_wrapper(self.count_query):
+                    report = importer.run(read_rows(file))
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            file.close()
+
+        self.stdout.write(
+            f"{report.rows} {options['format']} rows in {report.seconds:.2f}s: "
+            f"{report.rows_per_second:,.0f} rows/s, {self.queries} queries, "
+            f"{report.created} created, {report.skipped} skipped, {report.error_count} errors"
+        )
+        self.stdout.write(
+            f"Peak RSS {peak_rss_mb():.1f} MB ({peak_rss_mb() - rss_before:+.1f} MB during the import)"
+        )
+
+    def generate_rows(self, rows, duplicates):
+        rng = random.Random(0)
+        categories = [f'Category {i}' for i in range(20)]
+        start = date.today() - timedelta(days=730)
+
+        written = []
+        for i in range(rows):
+            if written and rng.random() < duplicates:
+                yield rng.choice(written)
+                continue
+            row = (
+                start + timedelta(days=rng.randrange(730)),
+                f'Transaction {i}',
+                Decimal(rng.randrange(100, 50000)) / 100,
+                rng.choice(('income', 'expense')),
+                rng.choice(categories),
+                '',
+                '',
+            )
+            written.append(row)
+            yield row
@@ -0,0 +1,86 @@
+import logging
+import statistics
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.test import Client
+from django.urls import reverse
+
+from finances.models import Category
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure the latency of create_transaction_api at a log level of the finances loggers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Number of timed requests (default: 500)',
+        )
+        parser.add_argument(
+            '--log-level',
+            help='Level of the finances loggers during the run, e.g. DEBUG (default: LOG_LEVEL)',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+
+        finances_logger = logging.getLogger('finances')
+        configured_level = finances_logger.level
+        if options['log_level']:
+            finances_logger.setLevel(options['log_level'].upper())
+        level = logging.getLevelName(finances_logger.getEffectiveLevel())
+
+        # Everything runs for a throwaway user and is rolled back afterwards
+        try:
+            with db_transaction.atomic():
+                timings = self.run_requests(options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            finances_logger.setLevel(configured_level)
+
+        timings.sort()
+        self.stdout.write(
+            f"{len(timings)} requests at {level}: mean {statistics.fmean(timings):.2f} ms, "
+            f"p50 {timings[len(timings) // 2]:.2f} ms, p95 {timings[int(len(timings) * 0.95)]:.2f} ms"
+        )
+
+    def run_requests(self, count):
+        user = User.objects.create_user(username='benchmark-logging')
+        category = Category.objects.create(user=user, name='Food', type='expense')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        url = reverse('create_transaction_api')
+        data = {
+            'title': 'Groceries',
+            'amount': '123.45',
+            'date': date.today().isoformat(),
+            'type': 'expense',
+            'category': category.pk,
+            'notes': 'Weekly shopping',
+        }
+
+        # The first requests warm up the URL resolver and the connection
+        for _ in range(20):
+            client.post(url, data)
+
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.post(url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200 or not response.json().get('success'):
+                raise CommandError(f'create_transaction_api failed: {response.status_code} {response.content[:200]!r}')
+        return timings
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from finances.cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the cached chart and summary aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the counters as JSON',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after printing them',
+        )
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            for name, counters in stats.items():
+                hit_rate = f"{counters['hit_rate']:.1%}" if counters['hit_rate'] is not None else '-'
+                self.stdout.write(f"{name:<16} hits={counters['hits']:<8} misses={counters['misses']:<8} hit rate={hit_rate}")
+
+        if options['reset']:
+            reset_cache_stats()
+            self.stdout.write('Counters reset')
@@ -0,0 +1,71 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+
+from finances.defaults import provision_default_categories
+
+# Users are provisioned in batches of this many users
+USER_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Create the default categories for users who have none, or for newly seeded test users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create-users',
+            type=int,
+            default=0,
+            metavar='COUNT',
+            help='Create this many test users first, named PREFIX-1, PREFIX-2, ...',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='loadtest',
+            help='Username prefix of the created test users (default: loadtest)',
+        )
+        parser.add_argument(
+            '--password',
+            help='Password of the created test users (default: unusable password)',
+        )
+
+    def handle(self, *args, **options):
+        if options['create_users'] < 0:
+            raise CommandError('--create-users must not be negative')
+
+        if options['create_users']:
+            created = self.create_users(options['create_users'], options['prefix'], options['password'])
+            self.stdout.write(f'Created {created} users')
+
+        users = User.objects.filter(category__isnull=True).order_by('pk')
+        provisioned = 0
+        categories = 0
+        while True:
+            # Provisioned users drop out of the queryset, so always take the first batch
+            batch = list(users[:USER_BATCH_SIZE])
+            if not batch:
+                break
+            categories += provision_default_categories(batch)
+            provisioned += len(batch)
+
+        self.stdout.write(f'Created {categories} categories for {provisioned} users')
+
+    def create_users(self, count, prefix, password):
+        # Hashing is slow by design, so every user gets the same hash
+        password = make_password(password)
+        existing = set(User.objects.filter(username__startswith=f'{prefix}-').values_list('username', flat=True))
+        usernames = []
+        number = 0
+        while len(usernames) < count:
+            number += 1
+            username = f'{prefix}-{number}'
+            if username not in existing:
+                usernames.append(username)
+
+        with db_transaction.atomic():
+            users = User.objects.bulk_create(
+                [User(username=username, password=password) for username in usernames],
+                batch_size=USER_BATCH_SIZE,
+            )
+        return len(users)
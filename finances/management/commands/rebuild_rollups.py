@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from finances.cache import invalidate_user_cache
+from finances.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily transaction rollups from the transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            metavar='USERNAME',
+            help='Only rebuild the rollups of this user (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = list(User.objects.filter(username__in=options['usernames']))
+            missing = set(options['usernames']) - {user.username for user in users}
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        written = rebuild_rollups(users)
+
+        for user_id in (user.pk for user in users) if users is not None else User.objects.values_list('pk', flat=True):
+            invalidate_user_cache(user_id)
+
+        self.stdout.write(f'Wrote {written} rollup rows')
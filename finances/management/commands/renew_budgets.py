@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from finances.models import Budget
+
+
+class Command(BaseCommand):
+    help = 'Start the current period of every budget whose latest period has expired (for cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of budgets per insert (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        created = Budget.renew_expired_budgets(batch_size=options['batch_size'])
+        self.stdout.write(f'Renewed {created} budget(s)')
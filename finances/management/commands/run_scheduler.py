@@ -0,0 +1,53 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from finances.utils import process_due_scheduled_transactions
+
+
+class Command(BaseCommand):
+    help = 'Process due scheduled transactions for all users, once or in a polling loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.SCHEDULER_BATCH_SIZE,
+            help='Number of scheduled transactions claimed per database transaction',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.SCHEDULER_POLL_INTERVAL,
+            help='Seconds to sleep between polls when running as a worker',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the currently due transactions and exit (for cron)',
+        )
+
+    def handle(self, *args, **options):
+        # Every Render service has its own disk, so a SQLite file there is
+        # never the one the web service writes to
+        if os.environ.get('RENDER') and connection.vendor == 'sqlite':
+            raise CommandError(
+                'run_scheduler must share the database of the web service; set DATABASE_URL'
+            )
+
+        batch_size = options['batch_size']
+        interval = options['interval']
+
+        while True:
+            processed = process_due_scheduled_transactions(batch_size=batch_size)
+            if processed:
+                self.stdout.write(f'Processed {processed} scheduled transaction(s)')
+            if options['once']:
+                break
+            try:
+                time.sleep(interval)
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,179 @@
+"""
+Per-view request metrics.
+
+RequestMetricsMiddleware times every request and counts its database queries
+and their time with a connection.execute_wrapper(). The measurements are added
+to in-process histograms per resolved URL name, which get_request_metrics()
+returns, and each request is logged on the finances.metrics logger.
+
+The histograms live in the memory of each worker process and start empty when
+it starts, like the locmem cache. Queries run while a streaming response is
+being sent happen after the middleware returns and aren't counted.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets of every metric; one more bucket
+# collects everything above the last bound
+HISTOGRAM_BOUNDS = {
+    'wall_ms': (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+    'queries': (0, 1, 2, 5, 10, 20, 50, 100, 200),
+    'db_ms': (1, 5, 10, 25, 50, 100, 250, 500, 1000),
+    'response_bytes': (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024),
+}
+
+# Name of the requests that didn't resolve to a URL pattern
+UNRESOLVED = '<unresolved>'
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum and maximum."""
+
+    __slots__ = ('bounds', 'counts', 'total', 'maximum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.maximum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction of the values (or the maximum for the last one)."""
+        rank = fraction * sum(self.counts)
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def as_dict(self):
+        observed = sum(self.counts)
+        labels = [f'<={bound}' for bound in self.bounds] + [f'>{self.bounds[-1]}']
+        return {
+            'count': observed,
+            'mean': round(self.total / observed, 2) if observed else None,
+            'p50': self.percentile(0.5) if observed else None,
+            'p95': self.percentile(0.95) if observed else None,
+            'max': self.maximum if observed else None,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+class ViewMetrics:
+    """The histograms of the requests to one URL name."""
+
+    __slots__ = ('requests', 'errors', 'histograms')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.histograms = {name: Histogram(bounds) for name, bounds in HISTOGRAM_BOUNDS.items()}
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            **{name: histogram.as_dict() for name, histogram in self.histograms.items()},
+        }
+
+_lock = threading.Lock()
+_views = {}
+_since = timezone.now()
+
+def record_request(view_name, status_code, wall_ms, queries, db_ms, response_bytes=None):
+    """Add the measurements of one request to the histograms of its URL name."""
+    with _lock:
+        metrics = _views.get(view_name)
+        if metrics is None:
+            metrics = _views[view_name] = ViewMetrics()
+        metrics.requests += 1
+        if status_code >= 500:
+            metrics.errors += 1
+        histograms = metrics.histograms
+        histograms['wall_ms'].observe(wall_ms)
+        histograms['queries'].observe(queries)
+        histograms['db_ms'].observe(db_ms)
+        if response_bytes is not None:
+            histograms['response_bytes'].observe(response_bytes)
+
+def get_request_metrics():
+    """
+    Return the request metrics of this process.
+
+    Returns:
+        Dictionary with 'since' (when the metrics started) and 'views', the
+        number of requests and server errors and the histograms of wall_ms,
+        queries, db_ms and response_bytes per URL name
+    """
+    with _lock:
+        views = {name: metrics.as_dict() for name, metrics in sorted(_views.items())}
+        since = _since
+    return {'since': since.isoformat(), 'views': views}
+
+def reset_request_metrics():
+    global _since
+    with _lock:
+        _views.clear()
+        _since = timezone.now()
+
+class QueryTimer:
+    """A connection.execute_wrapper() that counts queries and adds up their time."""
+
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+class RequestMetricsMiddleware:
+    """Record the wall time, query count, query time and response size of every request."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else UNRESOLVED
+        if response.streaming:
+            response_bytes = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            response_bytes = len(response.content)
+        db_ms = timer.seconds * 1000
+
+        record_request(view_name, response.status_code, wall_ms, timer.queries, db_ms, response_bytes)
+        logger.info(
+            '%s %s %s %d %.1fms %d queries %.1fms db %s bytes',
+            request.method, request.path, view_name, response.status_code,
+            wall_ms, timer.queries, db_ms, response_bytes if response_bytes is not None else '-',
+        )
+        return response
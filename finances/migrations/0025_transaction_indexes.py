@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0024_scheduledtransaction_subcategory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'date', 'time'], name='finances_tr_user_id_fc3d8c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'type', 'date'], name='finances_tr_user_id_58b9b9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'category', 'date'], name='finances_tr_user_id_18793e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'subcategory', 'date'], name='finances_tr_user_id_71a21c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_account', 'date'], name='finances_tr_transac_ecaafa_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0025_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduledtransaction',
+            index=models.Index(fields=['status', 'date_scheduled'], name='finances_sc_status_ec1209_idx'),
+        ),
+    ]
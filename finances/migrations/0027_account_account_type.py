@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+def backfill_account_type(apps, schema_editor):
+    Account = apps.get_model('finances', 'Account')
+    Account.objects.filter(debitaccount__isnull=False).update(account_type='debit')
+    Account.objects.filter(creditaccount__isnull=False).update(account_type='credit')
+    Account.objects.filter(wallet__isnull=False).update(account_type='wallet')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0026_scheduledtransaction_due_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='account_type',
+            field=models.CharField(choices=[('debit', 'Debit'), ('credit', 'Credit'), ('wallet', 'Wallet')], default='', editable=False, max_length=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_account_type, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:32
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    Transaction = apps.get_model('finances', 'Transaction')
+    DailyRollup = apps.get_model('finances', 'DailyRollup')
+    grouped = Transaction.objects.order_by().values(
+        'user_id', 'date', 'type', 'category_id', 'subcategory_id', 'transaction_account_id'
+    ).annotate(total=models.Sum('amount'), transactions=models.Count('id'))
+    batch = []
+    for row in grouped.iterator(chunk_size=1000):
+        batch.append(DailyRollup(
+            user_id=row['user_id'], date=row['date'], type=row['type'], category_id=row['category_id'],
+            subcategory_id=row['subcategory_id'], account_id=row['transaction_account_id'],
+            amount=row['total'], count=row['transactions'],
+        ))
+        if len(batch) >= 1000:
+            DailyRollup.objects.bulk_create(batch)
+            batch = []
+    DailyRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('finances', '0027_account_account_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense')], max_length=7)),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='finances.account')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='finances.category')),
+                ('subcategory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='finances.subcategory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'date'], name='finances_da_user_id_ca9ca5_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from datetime import timedelta, datetime
 from django.db import models
+from django.db import transaction as db_transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -9,6 +10,10 @@ from django.urls import reverse
 import uuid
 from decimal import Decimal
 import json
+import logging
+from django.db.models.functions import Coalesce, RowNumber
+
+logger = logging.getLogger(__name__)
 
 class Debt(models.Model):
     DEBT_TYPES = (
@@ -34,34 +39,74 @@ class Debt(models.Model):
     def residual_amount(self):
         return self.amount - self.paid
 
+class AccountQuerySet(models.QuerySet):
+    def with_subtypes(self):
+        """
+        Join the concrete account tables, so `account.concrete` needs no extra
+        queries. Loads any number of accounts with their subtype in one query.
+        """
+        return self.select_related(*Account.SUBTYPE_RELATIONS.values())
+
 class Account(models.Model):
+    ACCOUNT_TYPES = (
+        ('debit', 'Debit'),
+        ('credit', 'Credit'),
+        ('wallet', 'Wallet'),
+    )
+    
+    # Reverse one-to-one accessor of the concrete table for each account type
+    SUBTYPE_RELATIONS = {
+        'debit': 'debitaccount',
+        'credit': 'creditaccount',
+        'wallet': 'wallet',
+    }
+    
+    # Set by each concrete account class
+    ACCOUNT_TYPE = ''
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=50, blank=True)
+    account_type = models.CharField(max_length=10, choices=ACCOUNT_TYPES, editable=False)
+
+    objects = AccountQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.__class__.__name__}: {self.name}"
 
+    def save(self, *args, **kwargs):
+        if self.ACCOUNT_TYPE:
+            self.account_type = self.ACCOUNT_TYPE
+        super().save(*args, **kwargs)
+
     def get_account_type(self):
-        if hasattr(self, 'creditaccount'):
-            return 'credit'
-        elif hasattr(self, 'debitaccount'):
-            return 'debit'
-        elif hasattr(self, 'wallet'):
-            return 'wallet'
-        return 'unknown'
+        return self.account_type or 'unknown'
+
+    @property
+    def concrete(self):
+        """The DebitAccount, CreditAccount or Wallet behind this account."""
+        if self.ACCOUNT_TYPE:
+            return self
+        relation = self.SUBTYPE_RELATIONS.get(self.account_type)
+        return getattr(self, relation) if relation else None
 
 class DebitAccount(Account):
+    ACCOUNT_TYPE = 'debit'
+
     balance = models.DecimalField(max_digits=10, decimal_places=2)
     maintaining_balance = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
 class CreditAccount(Account):
+    ACCOUNT_TYPE = 'credit'
+
     current_usage = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     credit_limit = models.DecimalField(max_digits=10, decimal_places=2)
     payment_due_date = models.DateField(null=True, blank=True)
     minimum_payment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
 class Wallet(Account):
+    ACCOUNT_TYPE = 'wallet'
+
     balance = models.DecimalField(max_digits=10, decimal_places=2)
 
 class Category(models.Model):
@@ -128,6 +173,39 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-date', '-time']
+        indexes = [
+            models.Index(fields=['user', 'date', 'time']),
+            models.Index(fields=['user', 'type', 'date']),
+            models.Index(fields=['user', 'category', 'date']),
+            models.Index(fields=['user', 'subcategory', 'date']),
+            models.Index(fields=['transaction_account', 'date']),
+        ]
+
+class DailyRollup(models.Model):
+    """
+    Sum and count of a user's transactions per day, type, category, subcategory
+    and account, kept up to date as transactions are written (see rollups.py).
+
+    Period totals are read from these rows instead of from every transaction.
+    A key may be spread over more than one row, so rows are always summed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    type = models.CharField(max_length=7, choices=Transaction.TRANSACTION_TYPES)
+    # Cleared together with the same field of the transactions when the target is deleted
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    subcategory = models.ForeignKey(SubCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    account = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'))
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.type} - {self.amount}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
 
 class ScheduledTransaction(models.Model):
     TRANSACTION_TYPES = (
@@ -182,81 +260,59 @@ class ScheduledTransaction(models.Model):
         self.calculate_next_occurrence()
 
     def calculate_next_occurrence(self):
-        print(f"\n=== Calculating next occurrence for transaction: {self.name} ===")
-        print(f"Current state - Last occurrence: {self.last_occurrence}, Repeat type: {self.repeat_type}, Repeats: {self.repeats}")
+        logger.debug(
+            "Calculating next occurrence of scheduled transaction %s: last occurrence %s, repeat type %s, repeats %s",
+            self.pk, self.last_occurrence, self.repeat_type, self.repeats,
+        )
         
         if self.status == 'completed':
-            print("Transaction is completed, no next occurrence")
             self.next_occurrence = None
             return
 
         # If no last_occurrence, use date_scheduled as the last occurrence
         if not self.last_occurrence:
-            print("No last occurrence, using scheduled date as last occurrence")
             self.last_occurrence = self.date_scheduled
 
         if self.repeats == 0 or self.is_recurring:  # Infinite repeats
-            print("Infinite repeats or recurring transaction")
             if self.repeat_type == 'daily':
-                print("Daily repeat - adding 1 day")
                 self.next_occurrence = self.last_occurrence + timedelta(days=1)
             elif self.repeat_type == 'weekly':
-                print("Weekly repeat - adding 1 week")
                 self.next_occurrence = self.last_occurrence + timedelta(weeks=1)
             elif self.repeat_type == 'monthly':
-                print("\nMonthly repeat calculation:")
-                print(f"Current date: {self.last_occurrence}")
-                print(f"Current day: {self.last_occurrence.day}")
-                
                 next_month = self.last_occurrence.month + 1
                 next_year = self.last_occurrence.year
                 if next_month > 12:
                     next_month = 1
                     next_year += 1
-                print(f"Next month/year: {next_month}/{next_year}")
                 
                 # Get the last day of the next month
                 if next_month == 12:
                     last_day_next_month = (datetime(next_year + 1, 1, 1) - timedelta(days=1)).day
                 else:
                     last_day_next_month = (datetime(next_year, next_month + 1, 1) - timedelta(days=1)).day
-                print(f"Last day of next month: {last_day_next_month}")
                 
                 # Use the same day of month, but not exceeding the last day of the next month
                 day = min(self.last_occurrence.day, last_day_next_month)
-                print(f"Selected day: {day}")
                 
                 self.next_occurrence = self.last_occurrence.replace(month=next_month, year=next_year, day=day)
-                print(f"Calculated next occurrence: {self.next_occurrence}")
             elif self.repeat_type == 'yearly':
-                print("\nYearly repeat calculation:")
-                print(f"Current date: {self.last_occurrence}")
-                print(f"Current day: {self.last_occurrence.day}")
-                
                 next_year = self.last_occurrence.year + 1
-                print(f"Next year: {next_year}")
                 
                 # Get the last day of the month in the next year
                 if self.last_occurrence.month == 12:
                     last_day_next_month = (datetime(next_year + 1, 1, 1) - timedelta(days=1)).day
                 else:
                     last_day_next_month = (datetime(next_year, self.last_occurrence.month + 1, 1) - timedelta(days=1)).day
-                print(f"Last day of month in next year: {last_day_next_month}")
                 
                 # Use the same day of month, but not exceeding the last day of the month
                 day = min(self.last_occurrence.day, last_day_next_month)
-                print(f"Selected day: {day}")
                 
                 self.next_occurrence = self.last_occurrence.replace(year=next_year, day=day)
-                print(f"Calculated next occurrence: {self.next_occurrence}")
         else:
-            print(f"Finite repeats - occurrence number: {self.occurrence_number}, total repeats: {self.repeats}")
             # For finite repeats, check if we've reached the limit
             if self.occurrence_number >= self.repeats:
-                print("Reached repeat limit, no next occurrence")
                 self.next_occurrence = None
             else:
-                print("Still have repeats remaining")
                 # Calculate next occurrence based on repeat type
                 if self.repeat_type == 'daily':
                     self.next_occurrence = self.last_occurrence + timedelta(days=1)
@@ -276,8 +332,8 @@ class ScheduledTransaction(models.Model):
                     last_day_next_month = (datetime(next_year, self.last_occurrence.month + 1, 1) - timedelta(days=1)).day
                     day = min(self.last_occurrence.day, last_day_next_month)
                     self.next_occurrence = self.last_occurrence.replace(year=next_year, day=day)
-        
-        print(f"Final next occurrence: {self.next_occurrence}\n")
+
+        logger.debug("Next occurrence of scheduled transaction %s: %s", self.pk, self.next_occurrence)
 
     def mark_as_processed(self):
         """Mark this transaction as processed and update last_occurrence"""
@@ -324,6 +380,51 @@ class ScheduledTransaction(models.Model):
 
     class Meta:
         ordering = ['date_scheduled']
+        indexes = [
+            # Due-time lookups of the scheduler worker
+            models.Index(fields=['status', 'date_scheduled']),
+        ]
+
+class BudgetQuerySet(models.QuerySet):
+    def with_spent(self):
+        """
+        Annotate each budget with spent_amount, remaining_amount and percentage_spent.
+        The spend for every budget is computed from the daily rollups by the same
+        query that loads the budgets.
+        """
+        expenses = DailyRollup.objects.filter(
+            user=models.OuterRef('user'),
+            type='expense',
+            account=models.OuterRef('account'),
+            date__gte=models.OuterRef('start_date'),
+            date__lte=models.OuterRef('end_date')
+        ).order_by()
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+
+        def total(queryset):
+            return models.Subquery(
+                queryset.values('user').annotate(total=models.Sum('amount')).values('total'),
+                output_field=money
+            )
+
+        return self.annotate(
+            spent_amount=Coalesce(
+                models.Case(
+                    models.When(subcategory__isnull=False, then=total(expenses.filter(subcategory=models.OuterRef('subcategory')))),
+                    models.When(category__isnull=False, then=total(expenses.filter(category=models.OuterRef('category')))),
+                    output_field=money
+                ),
+                models.Value(Decimal('0')),
+                output_field=money
+            )
+        ).annotate(
+            remaining_amount=models.ExpressionWrapper(models.F('amount') - models.F('spent_amount'), output_field=money),
+            percentage_spent=models.Case(
+                models.When(amount__gt=0, then=models.F('spent_amount') * 100 / models.F('amount')),
+                default=models.Value(Decimal('0')),
+                output_field=money
+            )
+        )
 
 class Budget(models.Model):
     DURATION_CHOICES = [
@@ -340,6 +441,8 @@ class Budget(models.Model):
     start_date = models.DateField(default=timezone.now, db_index=True)
     end_date = models.DateField(db_index=True)
 
+    objects = BudgetQuerySet.as_manager()
+
     def __str__(self):
         if self.subcategory:
             return f"{self.subcategory.name} - {self.amount} ({self.duration})"
@@ -351,6 +454,10 @@ class Budget(models.Model):
         """Calculate the amount spent in this budget's subcategory for the current period"""
         from django.db.models import Sum
         
+        # Budgets loaded through Budget.objects.with_spent() already carry the amount
+        if hasattr(self, 'spent_amount'):
+            return self.spent_amount
+        
         # If this budget is for a subcategory
         if self.subcategory:
             spent = Transaction.objects.filter(
@@ -383,6 +490,8 @@ class Budget(models.Model):
         
     def get_percentage_spent(self):
         """Calculate the percentage of budget used"""
+        if hasattr(self, 'percentage_spent'):
+            return round(self.percentage_spent)
         if self.amount > 0:
             return round((self.get_spent_amount() / self.amount) * 100)
         return 0
@@ -429,63 +538,108 @@ class Budget(models.Model):
             end_date = next_month - timedelta(days=1)
         return start_date, end_date
 
+    # Budgets of the same user, category, subcategory, account and duration form a
+    # series that renew_expired_budgets() continues period after period
+    SERIES_FIELDS = ('user', 'category', 'subcategory', 'account', 'duration')
+
     @classmethod
-    def renew_expired_budgets(cls):
-        """Automatically renew expired budgets"""
-        today = timezone.now().date()
-        expired_budgets = cls.objects.filter(end_date__lt=today)
-        
-        for budget in expired_budgets:
-            # Calculate new start and end dates based on duration
-            if budget.duration == '1 week':
-                new_start_date = today - timedelta(days=today.weekday())  # Start of current week
-                new_end_date = new_start_date + timedelta(days=6)
-            else:  # month
-                new_start_date = today.replace(day=1)  # Start of current month
-                if today.month == 12:
-                    next_month = today.replace(year=today.year + 1, month=1, day=1)
-                else:
-                    next_month = today.replace(month=today.month + 1, day=1)
-                new_end_date = next_month - timedelta(days=1)
-            
-            # Check if a budget already exists for this period
-            existing_budget = cls.objects.filter(
-                user=budget.user,
-                subcategory=budget.subcategory,
-                start_date=new_start_date,
-                account=budget.account
-            ).first()
-            
-            if not existing_budget:
-                # Create new budget with same amount but new dates
-                cls.objects.create(
-                    user=budget.user,
-                    subcategory=budget.subcategory,
-                    amount=budget.amount,
-                    account=budget.account,
-                    duration=budget.duration,
-                    start_date=new_start_date,
-                    end_date=new_end_date
-                )
+    def renew_expired_budgets(cls, batch_size=1000):
+        """
+        Start a budget for the current period of every series whose latest budget has expired.
+
+        The latest budget of every series is found with one query, and the new
+        budgets copy its amount and are inserted with bulk_create. Both category
+        and subcategory budgets are renewed. Inserts that hit the unique_together
+        constraint are skipped instead of failing the whole run.
+
+        The budgets renewed from are locked, so overlapping runs wait for each
+        other. Series that got a current budget in the meantime are skipped,
+        and the current budgets of the renewed series are counted before and
+        after the insert. A budget a user adds to one of those series while
+        the insert runs is the only one that can be counted too.
+
+        Returns:
+            The number of budgets created
+        """
+        from .cache import invalidate_user_cache
+
+        periods = {duration: cls.get_current_period_dates(duration) for duration, _ in cls.DURATION_CHOICES}
+        # The expiry is checked on the window value: a filter on end_date itself
+        # would drop the running budgets before the series are ranked
+        series = [models.F(field) for field in cls.SERIES_FIELDS]
+        latest = cls.objects.annotate(
+            series_rank=models.Window(
+                RowNumber(),
+                partition_by=series,
+                order_by=[models.F('end_date').desc(), models.F('pk').desc()],
+            ),
+            series_end=models.Window(models.Max('end_date'), partition_by=series),
+        ).filter(series_rank=1, series_end__lt=timezone.now().date())
+
+        renewed_ids = []
+        renewals = []
+        for values in latest.values('pk', 'user_id', 'category_id', 'subcategory_id', 'account_id', 'duration', 'amount'):
+            start_date, end_date = periods[values['duration']]
+            renewed_ids.append(values['pk'])
+            renewals.append(cls(
+                user_id=values['user_id'],
+                category_id=values['category_id'],
+                subcategory_id=values['subcategory_id'],
+                account_id=values['account_id'],
+                duration=values['duration'],
+                amount=values['amount'],
+                start_date=start_date,
+                end_date=end_date,
+            ))
+        if not renewals:
+            return 0
+
+        current = cls.objects.none()
+        for duration, (start_date, _) in periods.items():
+            current |= cls.objects.filter(duration=duration, start_date=start_date)
+
+        with db_transaction.atomic():
+            # Window queries can't be locked, so the rows are locked by id
+            for offset in range(0, len(renewed_ids), batch_size):
+                list(cls.objects.select_for_update().filter(
+                    pk__in=renewed_ids[offset:offset + batch_size]
+                ).values_list('pk', flat=True))
+            # Skip the series another run renewed since they were ranked; the
+            # NULL category or subcategory of a budget keeps unique_together
+            # from catching those
+            series_fields = ('user_id', 'category_id', 'subcategory_id', 'account_id', 'duration')
+            existing = set(current.values_list(*series_fields))
+            renewals = [
+                budget for budget in renewals
+                if tuple(getattr(budget, field) for field in series_fields) not in existing
+            ]
+            attempted = {tuple(getattr(budget, field) for field in series_fields) for budget in renewals}
+            cls.objects.bulk_create(renewals, batch_size=batch_size, ignore_conflicts=True)
+            # None of the attempted series had a current budget before the
+            # insert; other series can hold several or get one meanwhile, so
+            # only the attempted ones are counted
+            created = sum(key in attempted for key in current.values_list(*series_fields))
+
+        # bulk_create sends no signals
+        for user_id in {budget.user_id for budget in renewals}:
+            invalidate_user_cache(user_id)
+        return created
 
     @property
     def spent(self):
         """Calculate total spent from transactions within the budget period"""
-        return Transaction.objects.filter(
-            user=self.user,
-            type='expense',
-            subcategory=self.subcategory,
-            date__gte=self.start_date,
-            date__lte=self.end_date,
-            transaction_account=self.account
-        ).aggregate(total=models.Sum('amount'))['total'] or 0
+        return self.get_spent_amount()
 
     @property
     def remaining(self):
+        if hasattr(self, 'remaining_amount'):
+            return self.remaining_amount
         return self.amount - self.spent
 
     @property
     def percentage_used(self):
+        if hasattr(self, 'percentage_spent'):
+            return round(self.percentage_spent, 2)
         if self.amount > 0:
             return round((self.spent / self.amount) * 100, 2)
         return 0
@@ -0,0 +1,324 @@
+"""
+Cash-flow projections.
+
+Pending scheduled transactions are expanded into NumPy arrays of day offsets
+and signed amounts in cents, with one entry per occurrence. The occurrences are
+added up per account and day, and a cumulative sum over the days turns today's
+balances into the projected balance of every account on every day. The daily
+balances are then sampled at the end of every day, week or month.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Account, ScheduledTransaction
+from .utils import get_bucket_start, get_next_bucket_start, get_first_occurrence_index
+
+PROJECTION_INTERVALS = ('day', 'week', 'month')
+
+# Days between two occurrences of daily and weekly schedules, and months between
+# two occurrences of monthly and yearly ones
+DAY_STEPS = {'daily': 1, 'weekly': 7}
+MONTH_STEPS = {'monthly': 1, 'yearly': 12}
+
+def get_occurrence_offsets(anchor, repeat_type, start, end, limit=None, first_index=0):
+    """
+    Return the occurrences of a schedule between two dates (both inclusive) as
+    an array of day offsets from start.
+
+    Monthly and yearly occurrences keep the anchor's day and are clamped to
+    the end of shorter months, like get_occurrence_date().
+
+    Args:
+        anchor: The date of the schedule's first occurrence
+        repeat_type: One of ScheduledTransaction.REPEAT_TYPES
+        start: The first date of the range
+        end: The last date of the range
+        limit: The number of occurrences of the schedule, None if it repeats forever
+        first_index: The index of the schedule's first occurrence in the series
+            that starts at anchor
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if repeat_type not in DAY_STEPS and repeat_type not in MONTH_STEPS:
+        if start <= anchor <= end and limit != 0:
+            return np.array([(anchor - start).days], dtype=np.int64)
+        return empty
+
+    first = max(get_first_occurrence_index(anchor, repeat_type, start), first_index)
+    # Index of the last occurrence that can fall on or before end
+    if repeat_type in DAY_STEPS:
+        last = (end - anchor).days // DAY_STEPS[repeat_type]
+    else:
+        last = ((end.year - anchor.year) * 12 + end.month - anchor.month) // MONTH_STEPS[repeat_type]
+    if limit is not None:
+        last = min(last, first_index + limit - 1)
+    if last < first:
+        return empty
+
+    indexes = np.arange(first, last + 1, dtype=np.int64)
+    if repeat_type in DAY_STEPS:
+        return (anchor - start).days + indexes * DAY_STEPS[repeat_type]
+
+    months = np.datetime64(anchor.replace(day=1), 'M') + indexes * MONTH_STEPS[repeat_type]
+    month_starts = months.astype('datetime64[D]')
+    month_lengths = ((months + 1).astype('datetime64[D]') - month_starts).astype(np.int64)
+    dates = month_starts + (np.minimum(anchor.day, month_lengths) - 1)
+    offsets = (dates - np.datetime64(start, 'D')).astype(np.int64)
+    return offsets[offsets <= (end - start).days]
+
+def get_net_balance(account):
+    """Return the net balance of an account row loaded with the balance columns of all subtypes."""
+    if account['account_type'] == 'credit':
+        return -(account['creditaccount__current_usage'] or Decimal('0'))
+    if account['account_type'] == 'wallet':
+        return account['wallet__balance'] or Decimal('0')
+    return account['debitaccount__balance'] or Decimal('0')
+
+def to_cents(amount):
+    """Return an amount as a whole number of cents."""
+    return int((Decimal(amount) * 100).to_integral_value())
+
+def get_pending_schedules(user, end_date):
+    """Return the pending scheduled transactions of a user that start on or before end_date, as dictionaries ordered by id."""
+    return list(ScheduledTransaction.objects.filter(
+        user=user,
+        status='scheduled',
+        date_scheduled__date__lte=end_date,
+    ).annotate(
+        completed_count=Count(
+            'child_transactions',
+            filter=Q(child_transactions__status__in=['completed', 'failed'])
+        )
+    ).values(
+        'id', 'name', 'date_scheduled', 'repeat_type', 'repeats', 'completed_count',
+        'transaction_type', 'amount', 'account_id', 'occurrence_number',
+        'parent_transaction__date_scheduled',
+    ).order_by('id'))
+
+def expand_schedules(schedules, start_date, end_date):
+    """
+    Merge the occurrences of schedules between two dates into one event stream.
+
+    Args:
+        schedules: Schedules returned by get_pending_schedules()
+        start_date: The first date of the range
+        end_date: The last date of the range, inclusive
+
+    Returns:
+        Tuple of arrays with the position of the schedule in schedules and the
+        day offset from start_date of every occurrence, sorted in the order the
+        worker posts them: by date and time, then by schedule id
+    """
+    empty = np.empty(0, dtype=np.int64)
+    positions, offsets, seconds = [empty], [empty], [empty]
+    for position, schedule in enumerate(schedules):
+        if schedule['repeat_type'] == 'once':
+            limit = 1
+        elif schedule['repeats'] > 0:
+            limit = max(schedule['repeats'] - schedule['completed_count'], 0)
+        else:
+            limit = None
+        scheduled_at = timezone.localtime(schedule['date_scheduled'])
+        # Later occurrences of a series count from the series' first occurrence,
+        # like get_schedule_anchor()
+        if schedule['parent_transaction__date_scheduled'] is None:
+            anchor, first_index = scheduled_at, 0
+        else:
+            anchor = timezone.localtime(schedule['parent_transaction__date_scheduled'])
+            first_index = schedule['occurrence_number'] - 1
+        occurrences = get_occurrence_offsets(
+            anchor.date(), schedule['repeat_type'], start_date, end_date, limit, first_index
+        )
+        time_of_day = scheduled_at.hour * 3600 + scheduled_at.minute * 60 + scheduled_at.second
+        positions.append(np.full(len(occurrences), position, dtype=np.int64))
+        offsets.append(occurrences)
+        seconds.append(np.full(len(occurrences), time_of_day, dtype=np.int64))
+
+    positions, offsets, seconds = np.concatenate(positions), np.concatenate(offsets), np.concatenate(seconds)
+    # Positions follow the schedule ids, so they break ties in the worker's order
+    order = np.lexsort((positions, seconds, offsets))
+    return positions[order], offsets[order]
+
+def get_balance_projection(user, start_date, end_date, interval='day'):
+    """
+    Project the balances of a user's accounts from their current balances and
+    the pending scheduled transactions.
+
+    Occurrences before start_date are left out, as are occurrences of
+    schedules without an account in the per-account balances (they still
+    count towards the total).
+
+    Args:
+        user: The user to project the balances of
+        start_date: The first projected day, normally today (date)
+        end_date: The last projected day, inclusive (date)
+        interval: 'day', 'week' (starting Monday) or 'month'
+
+    Returns:
+        Dictionary with 'periods' (the first day of every bucket), 'total' (the
+        net balance of all accounts at the end of every bucket), 'flows' (the
+        net scheduled amount of every bucket) and 'accounts' (dictionaries with
+        'id', 'name', 'type' and 'balances'), amounts as floats
+    """
+    if interval not in PROJECTION_INTERVALS:
+        raise ValueError(f"Unsupported interval: {interval}")
+    days = (end_date - start_date).days + 1
+
+    accounts = list(Account.objects.filter(user=user).values(
+        'id', 'name', 'account_type',
+        'debitaccount__balance', 'wallet__balance', 'creditaccount__current_usage',
+    ).order_by('name', 'id'))
+    account_rows = {account['id']: row for row, account in enumerate(accounts)}
+    # The last row collects the occurrences of schedules without an account
+    unassigned = len(accounts)
+    opening = np.array([to_cents(get_net_balance(account)) for account in accounts] + [0], dtype=np.int64)
+
+    schedules = get_pending_schedules(user, end_date)
+    positions, offsets = expand_schedules(schedules, start_date, end_date)
+    rows = np.array([account_rows.get(schedule['account_id'], unassigned) for schedule in schedules], dtype=np.int64)
+    cents = np.array([
+        to_cents(schedule['amount']) * (1 if schedule['transaction_type'] == 'income' else -1)
+        for schedule in schedules
+    ], dtype=np.int64)
+
+    daily = np.zeros((len(accounts) + 1, days), dtype=np.int64)
+    if len(positions):
+        np.add.at(daily, (rows[positions], offsets), cents[positions])
+    balances = opening[:, np.newaxis] + np.cumsum(daily, axis=1)
+
+    periods = []
+    bucket_starts = []
+    bucket_ends = []
+    period = get_bucket_start(start_date, interval)
+    while period <= end_date:
+        next_period = get_next_bucket_start(period, interval)
+        periods.append(period)
+        bucket_starts.append(max((period - start_date).days, 0))
+        bucket_ends.append(min((next_period - start_date).days, days) - 1)
+        period = next_period
+
+    sampled = balances[:, bucket_ends] / 100
+    total = balances.sum(axis=0)[bucket_ends] / 100
+    flows = np.add.reduceat(daily.sum(axis=0), bucket_starts) / 100
+    return {
+        'periods': periods,
+        'total': total.tolist(),
+        'flows': flows.tolist(),
+        'accounts': [
+            {'id': account['id'], 'name': account['name'], 'type': account['account_type'], 'balances': sampled[row].tolist()}
+            for row, account in enumerate(accounts)
+        ],
+    }
+
+def predict_schedule_failures(user, end_date, today=None):
+    """
+    Predict which pending scheduled transactions of a user would fail when
+    the worker posts them, and when.
+
+    The occurrences of all schedules, including overdue ones, are replayed
+    once in posting order against the accounts' balances, with the funds
+    checks of apply_balance_change(): debit accounts keep their maintaining
+    balance, credit accounts stay within their limit and wallets don't go
+    below zero. Schedules without an account fail too. A schedule stops at
+    its first failure, as the worker marks it failed.
+
+    Args:
+        user: The user whose schedules to simulate
+        end_date: The last day to simulate, inclusive (date)
+        today: The current date, timezone.localdate() by default
+
+    Returns:
+        Dictionary with 'failures' (dictionaries with 'scheduled_id', 'name',
+        'account_id', 'date', 'amount' and 'reason', which is
+        'insufficient_funds' or 'no_account', earliest first) and 'accounts'
+        (dictionaries with 'id', 'name', 'type', 'balance' and
+        'lowest_balance', the net balance at end_date and the lowest on the
+        way, and 'first_failure', the date of the account's first failure or
+        None)
+    """
+    today = today or timezone.localdate()
+    accounts = list(Account.objects.filter(user=user).values(
+        'id', 'name', 'account_type',
+        'debitaccount__balance', 'debitaccount__maintaining_balance',
+        'creditaccount__credit_limit', 'creditaccount__current_usage', 'wallet__balance',
+    ).order_by('name', 'id'))
+    account_rows = {account['id']: row for row, account in enumerate(accounts)}
+
+    # Every account is tracked by the amount that can still go out of it; its
+    # net balance is that amount plus a fixed offset
+    available, ceilings, net_offsets = [], [], []
+    for account in accounts:
+        if account['account_type'] == 'credit':
+            limit = to_cents(account['creditaccount__credit_limit'] or 0)
+            available.append(limit - to_cents(account['creditaccount__current_usage'] or 0))
+            # Payments never bring the usage below zero
+            ceilings.append(limit)
+            net_offsets.append(-limit)
+        elif account['account_type'] == 'wallet':
+            available.append(to_cents(account['wallet__balance'] or 0))
+            ceilings.append(None)
+            net_offsets.append(0)
+        else:
+            maintaining = to_cents(account['debitaccount__maintaining_balance'] or 0)
+            available.append(to_cents(account['debitaccount__balance'] or 0) - maintaining)
+            ceilings.append(None)
+            net_offsets.append(maintaining)
+    lowest = list(available)
+
+    schedules = get_pending_schedules(user, end_date)
+    # Overdue occurrences are posted first, on the worker's next run
+    start_date = min([today] + [timezone.localdate(schedule['date_scheduled']) for schedule in schedules])
+    positions, offsets = expand_schedules(schedules, start_date, end_date)
+
+    failed = [False] * len(schedules)
+    failures = []
+    amounts = [to_cents(schedule['amount']) for schedule in schedules]
+    for position, offset in zip(positions.tolist(), offsets.tolist()):
+        if failed[position]:
+            continue
+        schedule = schedules[position]
+        row = account_rows.get(schedule['account_id'])
+        amount = amounts[position]
+        if row is None:
+            reason = 'no_account'
+        elif schedule['transaction_type'] == 'income':
+            available[row] += amount
+            if ceilings[row] is not None:
+                available[row] = min(available[row], ceilings[row])
+            continue
+        elif amount > available[row]:
+            reason = 'insufficient_funds'
+        else:
+            available[row] -= amount
+            lowest[row] = min(lowest[row], available[row])
+            continue
+        failed[position] = True
+        failures.append({
+            'scheduled_id': schedule['id'],
+            'name': schedule['name'],
+            'account_id': schedule['account_id'],
+            'date': max(start_date + timedelta(days=offset), today),
+            'amount': schedule['amount'],
+            'reason': reason,
+        })
+
+    first_failures = {}
+    for failure in failures:
+        first_failures.setdefault(failure['account_id'], failure['date'])
+    return {
+        'failures': failures,
+        'accounts': [
+            {
+                'id': account['id'],
+                'name': account['name'],
+                'type': account['account_type'],
+                'balance': Decimal(available[row] + net_offsets[row]).scaleb(-2),
+                'lowest_balance': Decimal(lowest[row] + net_offsets[row]).scaleb(-2),
+                'first_failure': first_failures.get(account['id']),
+            }
+            for row, account in enumerate(accounts)
+        ],
+    }
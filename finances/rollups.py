@@ -0,0 +1,158 @@
+"""
+Maintenance of the DailyRollup table.
+
+Every change to a transaction is turned into deltas of amount and count per
+rollup key (user, date, type, category, subcategory, account), which are added
+to the matching rows. The transaction signals apply the deltas of single
+writes, bulk writes apply theirs directly, and rebuild_rollups() recomputes the
+table from the transactions.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, Sum
+
+from .models import DailyRollup, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Transaction fields that make up a rollup key, in key order
+ROLLUP_KEY_FIELDS = ('user_id', 'date', 'type', 'category_id', 'subcategory_id', 'transaction_account_id')
+
+REBUILD_BATCH_SIZE = 1000
+
+def new_deltas():
+    """Return an empty mapping of rollup key to [amount, count] deltas."""
+    return defaultdict(lambda: [Decimal('0'), 0])
+
+def get_rollup_key(values):
+    """Return the rollup key of a transaction given as a dict of ROLLUP_KEY_FIELDS."""
+    # Unsaved transactions can still hold the datetime their date defaults to
+    date = Transaction._meta.get_field('date').to_python(values['date'])
+    return (values['user_id'], date, values['type'], values['category_id'], values['subcategory_id'], values['transaction_account_id'])
+
+def add_transaction_delta(deltas, transaction, sign=1):
+    """Add (or with sign=-1, subtract) a Transaction instance to the deltas."""
+    key = get_rollup_key({field: getattr(transaction, field) for field in ROLLUP_KEY_FIELDS})
+    delta = deltas[key]
+    delta[0] += sign * Decimal(str(transaction.amount))
+    delta[1] += sign
+
+def get_stored_values(transaction_ids):
+    """Return the stored rollup key fields and amount of transactions, by id."""
+    rows = Transaction.objects.filter(pk__in=transaction_ids).values('id', 'amount', *ROLLUP_KEY_FIELDS)
+    return {row['id']: row for row in rows}
+
+def add_stored_delta(deltas, values, sign=1):
+    """Add (or subtract) a transaction returned by get_stored_values() to the deltas."""
+    delta = deltas[get_rollup_key(values)]
+    delta[0] += sign * values['amount']
+    delta[1] += sign
+
+def apply_rollup_deltas(deltas):
+    """
+    Add the deltas to the rollup rows of their keys.
+
+    The rows are locked while they are updated. Rows of new keys are
+    inserted, and rows that no longer hold any amount or transaction are
+    deleted. Removals from keys without a row are dropped, which happens when
+    the rollups were deleted together with the transactions (e.g. with the user).
+
+    A key can end up with more than one row: concurrent first writes of a key
+    both insert one, and deleting a category, subcategory or account clears
+    the field on its rows, which can turn them into rows of an existing key.
+    So there is no unique constraint on the key; the rows of a key that gets
+    a delta are merged into one instead, so a removal is never subtracted
+    from a row that doesn't hold the transaction.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta[1] or delta[0]}
+    if not deltas:
+        return
+
+    # No savepoint: a failed rollup update must roll back the write it belongs to
+    with db_transaction.atomic(savepoint=False):
+        users = {key[0] for key in deltas}
+        dates = {key[1] for key in deltas}
+        rows = DailyRollup.objects.select_for_update().filter(
+            user_id__in=users,
+            date__gte=min(dates),
+            date__lte=max(dates),
+        ).order_by('pk')
+
+        merged = {}
+        emptied = []
+        for row in rows:
+            key = (row.user_id, row.date, row.type, row.category_id, row.subcategory_id, row.account_id)
+            if key not in deltas:
+                continue
+            if key in merged:
+                # Merge duplicate rows into the first row of the key
+                merged[key].amount += row.amount
+                merged[key].count += row.count
+                emptied.append(row.pk)
+            else:
+                merged[key] = row
+
+        updated = []
+        for key, row in merged.items():
+            amount, count = deltas.pop(key)
+            row.amount += amount
+            row.count += count
+            if row.count == 0 and row.amount == 0:
+                emptied.append(row.pk)
+                continue
+            if row.count <= 0:
+                # Only a write that bypassed the rollups gets here; the row
+                # keeps its amount so the totals stay right until a rebuild
+                logger.warning(
+                    "Rollup of user %s on %s (%s) counts %s transactions holding %s; run rebuild_rollups",
+                    row.user_id, row.date, row.type, row.count, row.amount,
+                )
+            updated.append(row)
+
+        DailyRollup.objects.bulk_update(updated, ['amount', 'count'], batch_size=REBUILD_BATCH_SIZE)
+        if emptied:
+            DailyRollup.objects.filter(pk__in=emptied).delete()
+        DailyRollup.objects.bulk_create([
+            DailyRollup(
+                user_id=user_id, date=date, type=transaction_type, category_id=category_id,
+                subcategory_id=subcategory_id, account_id=account_id, amount=amount, count=count,
+            )
+            for (user_id, date, transaction_type, category_id, subcategory_id, account_id), (amount, count) in deltas.items()
+            if count > 0
+        ], batch_size=REBUILD_BATCH_SIZE)
+
+def rebuild_rollups(users=None):
+    """
+    Recompute the rollup rows of some users (all users by default) from their transactions.
+
+    Returns:
+        The number of rollup rows written
+    """
+    transactions = Transaction.objects.all()
+    rollups = DailyRollup.objects.all()
+    if users is not None:
+        transactions = transactions.filter(user__in=users)
+        rollups = rollups.filter(user__in=users)
+
+    grouped = transactions.order_by().values(*ROLLUP_KEY_FIELDS).annotate(total=Sum('amount'), transactions=Count('id'))
+
+    written = 0
+    with db_transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(DailyRollup(
+                user_id=row['user_id'], date=row['date'], type=row['type'], category_id=row['category_id'],
+                subcategory_id=row['subcategory_id'], account_id=row['transaction_account_id'],
+                amount=row['total'], count=row['transactions'],
+            ))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                DailyRollup.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        DailyRollup.objects.bulk_create(batch)
+        written += len(batch)
+    return written
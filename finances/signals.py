@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_user_cache
+from .rollups import new_deltas, add_transaction_delta, get_stored_values, add_stored_delta, apply_rollup_deltas
+from .models import (
+    Transaction, ScheduledTransaction, Budget, Category, SubCategory,
+    Account, DebitAccount, CreditAccount, Wallet,
+)
+
+# Models whose rows feed the cached chart and summary aggregates
+CACHED_AGGREGATE_SOURCES = (
+    Transaction, ScheduledTransaction, Budget, Category,
+    Account, DebitAccount, CreditAccount, Wallet,
+)
+
+def invalidate_owner_cache(sender, instance, **kwargs):
+    """Drop the cached aggregates of the user who owns the saved or deleted row."""
+    invalidate_user_cache(instance.user_id)
+
+for model in CACHED_AGGREGATE_SOURCES:
+    post_save.connect(invalidate_owner_cache, sender=model, dispatch_uid=f'invalidate_cache_{model.__name__}_save')
+    post_delete.connect(invalidate_owner_cache, sender=model, dispatch_uid=f'invalidate_cache_{model.__name__}_delete')
+
+@receiver([post_save, post_delete], sender=SubCategory)
+def invalidate_subcategory_owner_cache(sender, instance, **kwargs):
+    invalidate_user_cache(instance.parent_category.user_id)
+
+@receiver(post_save, sender=User)
+def invalidate_new_user_cache(sender, instance, created, **kwargs):
+    # Database ids can be reused, so a new user never inherits cached values
+    if created:
+        invalidate_user_cache(instance.pk)
+
+@receiver(pre_save, sender=Transaction)
+def remember_stored_transaction(sender, instance, **kwargs):
+    # The rollup of the stored values is moved to the new ones after the save
+    instance._rollup_stored = get_stored_values([instance.pk]).get(instance.pk) if instance.pk is not None else None
+
+@receiver(post_save, sender=Transaction)
+def update_rollups_on_save(sender, instance, **kwargs):
+    deltas = new_deltas()
+    stored = getattr(instance, '_rollup_stored', None)
+    if stored is not None:
+        add_stored_delta(deltas, stored, sign=-1)
+    add_transaction_delta(deltas, instance)
+    apply_rollup_deltas(deltas)
+
+@receiver(post_delete, sender=Transaction)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    deltas = new_deltas()
+    add_transaction_delta(deltas, instance, sign=-1)
+    apply_rollup_deltas(deltas)
@@ -1,7 +1,38 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Category, SubCategory
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.conf import settings
+from django.db import connection, connections, OperationalError
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.db.models import Count, QuerySet, Sum
+from django.utils import timezone
+from datetime import date, timedelta
+from decimal import Decimal
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+import openpyxl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from .models import Category, SubCategory, Transaction, DailyRollup, Account, DebitAccount, CreditAccount, Wallet, Budget, ScheduledTransaction
+from .cache import get_cache, get_cache_stats
+from .defaults import DEFAULT_CATEGORIES, provision_default_categories
+from .importer import TransactionImporter, iter_file_rows
+from .log_handlers import QueueLogHandler
+from .metrics import Histogram, get_request_metrics, reset_request_metrics
+from .projections import get_balance_projection, get_occurrence_offsets, predict_schedule_failures
+from .utils import (
+    get_cash_flow_buckets, process_due_scheduled_transactions, apply_balance_change, InsufficientFundsError,
+    generate_scheduled_transactions, get_occurrence_date, add_months, get_period_totals, get_category_breakdown,
+    get_budget_warnings,
+)
 
 # Create your tests here.
 
@@ -53,3 +84,1150 @@ class DefaultCategoriesTest(TestCase):
         self.assertEqual(Category.objects.get(user=user, name='Housing').icon, 'bi-house')
         self.assertEqual(Category.objects.get(user=user, name='Utilities').icon, 'bi-lightning')
         self.assertEqual(Category.objects.get(user=user, name='Food').icon, 'bi-cup-hot')
+
+class CashFlowBucketsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buckets', password='complexpassword123')
+        Transaction.objects.create(user=self.user, title='Pay', amount=Decimal('100.00'), date=date(2024, 3, 4), type='income')
+        Transaction.objects.create(user=self.user, title='Lunch', amount=Decimal('12.50'), date=date(2024, 3, 4), type='expense')
+        Transaction.objects.create(user=self.user, title='Rent', amount=Decimal('40.00'), date=date(2024, 3, 13), type='expense')
+
+    def test_daily_buckets_are_zero_filled(self):
+        """Test that every day in the range gets a bucket, from a single query"""
+        with self.assertNumQueries(1):
+            buckets = get_cash_flow_buckets(self.user, date(2024, 3, 3), date(2024, 3, 5), 'day')
+        
+        self.assertEqual([b['period'] for b in buckets], [date(2024, 3, 3), date(2024, 3, 4), date(2024, 3, 5)])
+        self.assertEqual(buckets[0]['income'], 0)
+        self.assertEqual(buckets[1]['income'], Decimal('100.00'))
+        self.assertEqual(buckets[1]['expenses'], Decimal('12.50'))
+        self.assertEqual(buckets[2]['expenses'], 0)
+
+    def test_weekly_and_monthly_buckets(self):
+        """Test that weeks start on Monday and months on the 1st"""
+        weeks = get_cash_flow_buckets(self.user, date(2024, 3, 1), date(2024, 3, 17), 'week')
+        self.assertEqual([b['period'] for b in weeks], [date(2024, 2, 26), date(2024, 3, 4), date(2024, 3, 11)])
+        self.assertEqual(weeks[1]['expenses'], Decimal('12.50'))
+        self.assertEqual(weeks[2]['expenses'], Decimal('40.00'))
+        
+        months = get_cash_flow_buckets(self.user, date(2024, 2, 1), date(2024, 3, 31), 'month')
+        self.assertEqual([b['period'] for b in months], [date(2024, 2, 1), date(2024, 3, 1)])
+        self.assertEqual(months[1]['income'], Decimal('100.00'))
+        self.assertEqual(months[1]['expenses'], Decimal('52.50'))
+
+class TransactionIndexTest(TestCase):
+    """EXPLAIN the hot Transaction queries and fail if any of them scans the whole table"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='indexes', password='complexpassword123')
+        self.category = Category.objects.create(user=self.user, name='Food')
+        self.subcategory = SubCategory.objects.create(parent_category=self.category, name='Lunch')
+        self.account = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('0'))
+        if connection.vendor == 'sqlite':
+            # Give the planner statistics so it behaves like it would on a real table
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def get_hot_queries(self):
+        start, end = date(2024, 3, 1), date(2024, 3, 31)
+        in_range = Transaction.objects.filter(user=self.user, date__gte=start, date__lte=end)
+        return {
+            'monthly transaction list': in_range.order_by('-date', '-time'),
+            'monthly type totals': in_range.filter(type='expense').values('type').annotate(total=Sum('amount')),
+            'category spend': in_range.filter(category=self.category),
+            'subcategory spend': in_range.filter(subcategory=self.subcategory),
+            'account history': Transaction.objects.filter(transaction_account=self.account, date__gte=start, date__lte=end),
+        }
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Empty test tables are cheaper to scan, only fall back to one if no index applies
+                cursor.execute('SET enable_seqscan = off')
+        return queryset.explain()
+
+    def test_hot_queries_use_composite_indexes(self):
+        table = Transaction._meta.db_table
+        index_names = [index.name for index in Transaction._meta.indexes]
+        
+        for name, queryset in self.get_hot_queries().items():
+            with self.subTest(query=name):
+                plan = self.explain(queryset)
+                self.assertNotRegex(plan, rf'(?m)(^|\s)SCAN {table}\s*$', f'{name} scans {table}:\n{plan}')
+                self.assertNotIn(f'Seq Scan on {table}', plan, f'{name} scans {table}:\n{plan}')
+                self.assertTrue(
+                    any(index_name in plan for index_name in index_names),
+                    f'{name} does not use a composite index on {table}:\n{plan}'
+                )
+
+class BudgetWithSpentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='budgets', password='complexpassword123')
+        self.account = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('0'))
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.lunch = SubCategory.objects.create(parent_category=self.food, name='Lunch')
+        self.category_budget = Budget.objects.create(
+            user=self.user, category=self.food, amount=Decimal('200.00'), account=self.account,
+            duration='1 month', start_date=date(2024, 3, 1)
+        )
+        self.subcategory_budget = Budget.objects.create(
+            user=self.user, subcategory=self.lunch, amount=Decimal('50.00'), account=self.account,
+            duration='1 week', start_date=date(2024, 3, 4)
+        )
+        for day, amount, subcategory in [(4, '20.00', self.lunch), (5, '30.00', None), (20, '100.00', self.lunch)]:
+            Transaction.objects.create(
+                user=self.user, title='Meal', amount=Decimal(amount), date=date(2024, 3, day), type='expense',
+                category=self.food, subcategory=subcategory, transaction_account=self.account
+            )
+        # Not counted: income, and an expense outside both budget periods
+        Transaction.objects.create(user=self.user, title='Refund', amount=Decimal('5.00'), date=date(2024, 3, 4), type='income', category=self.food, transaction_account=self.account)
+        Transaction.objects.create(user=self.user, title='Meal', amount=Decimal('9.00'), date=date(2024, 4, 1), type='expense', category=self.food, transaction_account=self.account)
+
+    def test_with_spent_annotates_all_budgets_in_one_query(self):
+        """Test that spent, remaining and percentage come from a single query"""
+        with self.assertNumQueries(1):
+            budgets = {b.pk: b for b in Budget.objects.with_spent().filter(user=self.user)}
+            category_budget = budgets[self.category_budget.pk]
+            subcategory_budget = budgets[self.subcategory_budget.pk]
+            
+            self.assertEqual(category_budget.spent, Decimal('150.00'))
+            self.assertEqual(category_budget.remaining, Decimal('50.00'))
+            self.assertEqual(category_budget.get_percentage_spent(), 75)
+            self.assertEqual(subcategory_budget.spent, Decimal('20.00'))
+            self.assertEqual(subcategory_budget.remaining, Decimal('30.00'))
+            self.assertEqual(subcategory_budget.percentage_used, 40)
+
+    def test_with_spent_matches_per_budget_computation(self):
+        """Test that the annotation agrees with get_spent_amount() on a plain instance"""
+        for budget in Budget.objects.with_spent().filter(user=self.user):
+            plain = Budget.objects.get(pk=budget.pk)
+            self.assertEqual(budget.spent_amount, plain.get_spent_amount())
+
+class ScheduledTransactionWorkerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='scheduler', password='complexpassword123')
+        self.account = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('1000.00'), maintaining_balance=Decimal('0'))
+
+    def schedule(self, days_ago, **kwargs):
+        """Create a scheduled transaction that became due some days ago"""
+        fields = {
+            'user': self.user, 'name': 'Coffee', 'transaction_type': 'expense', 'account': self.account,
+            'amount': Decimal('10.00'), 'repeat_type': 'daily', 'repeats': 0, 'is_recurring': True,
+        }
+        fields.update(kwargs)
+        # Model validation rejects past dates, so move the date back after saving
+        scheduled = ScheduledTransaction.objects.create(date_scheduled=timezone.now() + timedelta(hours=1), **fields)
+        ScheduledTransaction.objects.filter(pk=scheduled.pk).update(date_scheduled=timezone.now() - timedelta(days=days_ago))
+        return scheduled
+
+    def test_catches_up_missed_daily_occurrences(self):
+        """Test that a weekend of missed daily occurrences is posted in batches"""
+        self.schedule(days_ago=3)
+        
+        processed = process_due_scheduled_transactions(batch_size=2)
+        
+        self.assertEqual(processed, 4)  # 3 days ago, 2 days ago, yesterday and today
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(ScheduledTransaction.objects.filter(status='completed').count(), 4)
+        upcoming = ScheduledTransaction.objects.get(status='scheduled')
+        self.assertGreater(upcoming.date_scheduled, timezone.now())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('960.00'))
+
+    def test_month_end_schedule_keeps_its_day(self):
+        """Test that a monthly schedule on the 31st is posted on the last day of shorter months and back on the 31st"""
+        scheduled = self.schedule(days_ago=0, repeat_type='monthly')
+        first = timezone.make_aware(timezone.datetime(2024, 1, 31, 9, 0))
+        ScheduledTransaction.objects.filter(pk=scheduled.pk).update(date_scheduled=first)
+
+        process_due_scheduled_transactions(now=timezone.make_aware(timezone.datetime(2024, 3, 31, 12, 0)))
+
+        posted = list(Transaction.objects.filter(user=self.user).order_by('date').values_list('date', flat=True))
+        self.assertEqual(posted, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)])
+        upcoming = ScheduledTransaction.objects.get(status='scheduled')
+        self.assertEqual(timezone.localtime(upcoming.date_scheduled).date(), date(2024, 4, 30))
+        self.assertEqual((upcoming.parent_transaction_id, upcoming.occurrence_number), (scheduled.pk, 4))
+
+        # The calendar and projections continue the series on the same days
+        generated = generate_scheduled_transactions(
+            self.user, timezone.make_aware(timezone.datetime(2024, 4, 1)), timezone.make_aware(timezone.datetime(2024, 6, 1)),
+        )
+        self.assertEqual([timezone.localtime(item['date']).date() for item in generated], [date(2024, 4, 30), date(2024, 5, 31)])
+
+    def test_marks_uncovered_transactions_as_failed(self):
+        """Test that an expense the account can't cover fails without posting"""
+        wallet = Wallet.objects.create(user=self.user, name='Cash', balance=Decimal('5.00'))
+        scheduled = self.schedule(days_ago=0, account=wallet, repeat_type='once', repeats=1, is_recurring=False)
+        
+        process_due_scheduled_transactions()
+        
+        scheduled.refresh_from_db()
+        self.assertEqual(scheduled.status, 'failed')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_run_scheduler_command(self):
+        """Test that the management command processes due rows for every user"""
+        other_user = User.objects.create_user(username='other', password='complexpassword123')
+        other_account = DebitAccount.objects.create(user=other_user, name='Bank', balance=Decimal('100.00'))
+        self.schedule(days_ago=0, repeat_type='once', repeats=1, is_recurring=False)
+        self.schedule(days_ago=0, user=other_user, account=other_account, repeat_type='once', repeats=1, is_recurring=False)
+        
+        call_command('run_scheduler', '--once', stdout=StringIO())
+        
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Transaction.objects.filter(user=other_user).count(), 1)
+        self.assertFalse(ScheduledTransaction.objects.filter(status='scheduled').exists())
+
+    def test_run_scheduler_refuses_a_private_sqlite_database_on_render(self):
+        """Test that the worker doesn't post into its own SQLite file when deployed as a separate service"""
+        self.schedule(days_ago=0, repeat_type='once', repeats=1, is_recurring=False)
+
+        with mock.patch.dict(os.environ, {'RENDER': 'true'}):
+            with self.assertRaises(CommandError):
+                call_command('run_scheduler', '--once', stdout=StringIO())
+
+        self.assertFalse(Transaction.objects.exists())
+
+class BalanceLedgerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ledger', password='complexpassword123')
+        self.client.login(username='ledger', password='complexpassword123')
+        self.bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('100.00'), maintaining_balance=Decimal('20.00'))
+        self.card = CreditAccount.objects.create(user=self.user, name='Card', credit_limit=Decimal('50.00'), current_usage=Decimal('0'))
+
+    def post_transaction(self, url, amount, account):
+        return self.client.post(url, {
+            'title': 'Groceries', 'amount': amount, 'date': date.today().isoformat(),
+            'type': 'expense', 'transaction_account': account.pk,
+        }).json()
+
+    def test_update_moves_amount_between_accounts(self):
+        """Test that editing a transaction reverts the old effect and applies the new one"""
+        created = self.post_transaction(reverse('create_transaction_api'), '30', self.bank)
+        self.post_transaction(reverse('update_transaction_api', args=[created['transaction_id']]), '10', self.card)
+        
+        self.bank.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.bank.balance, Decimal('100.00'))
+        self.assertEqual(self.card.current_usage, Decimal('10.00'))
+        
+        self.client.post(reverse('delete_transaction_api', args=[created['transaction_id']]))
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.current_usage, Decimal('0.00'))
+
+    def test_checked_change_refuses_uncovered_amounts(self):
+        """Test that the funds check leaves balances untouched when it fails"""
+        with self.assertRaises(InsufficientFundsError):
+            apply_balance_change(self.bank, 'expense', Decimal('80.01'), check_funds=True)
+        with self.assertRaises(InsufficientFundsError):
+            apply_balance_change(self.card, 'expense', Decimal('50.01'), check_funds=True)
+        apply_balance_change(self.bank, 'expense', Decimal('80.00'), check_funds=True)
+        
+        self.bank.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.bank.balance, Decimal('20.00'))
+        self.assertEqual(self.card.current_usage, Decimal('0.00'))
+
+    def test_batch_delete_reverts_balances(self):
+        """Test that deleting several transactions at once reverts each of them on its account"""
+        ids = [
+            self.post_transaction(reverse('create_transaction_api'), amount, account)['transaction_id']
+            for amount, account in (('10', self.bank), ('15', self.bank), ('20', self.card))
+        ]
+        self.bank.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual((self.bank.balance, self.card.current_usage), (Decimal('75.00'), Decimal('20.00')))
+        
+        response = self.client.post(
+            reverse('batch_delete_transactions_api'),
+            json.dumps({'transaction_ids': ids}),
+            content_type='application/json',
+        )
+        
+        self.assertEqual(response.json()['deleted_count'], 3)
+        self.assertFalse(Transaction.objects.filter(user=self.user).exists())
+        self.bank.refresh_from_db()
+        self.card.refresh_from_db()
+        self.assertEqual(self.bank.balance, Decimal('100.00'))
+        self.assertEqual(self.card.current_usage, Decimal('0.00'))
+
+class AccountSubtypeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='accounts', password='complexpassword123')
+        self.client.login(username='accounts', password='complexpassword123')
+        for i in range(3):
+            DebitAccount.objects.create(user=self.user, name=f'Bank {i}', balance=Decimal('100.00'))
+            CreditAccount.objects.create(user=self.user, name=f'Card {i}', credit_limit=Decimal('50.00'), current_usage=Decimal('20.00'))
+            Wallet.objects.create(user=self.user, name=f'Cash {i}', balance=Decimal('10.00'))
+
+    def test_subtypes_load_in_one_query(self):
+        """Test that accounts resolve their concrete subtype without per-row queries"""
+        with self.assertNumQueries(1):
+            accounts = list(Account.objects.filter(user=self.user).with_subtypes())
+            types = {account.get_account_type(): type(account.concrete) for account in accounts}
+        
+        self.assertEqual(len(accounts), 9)
+        self.assertEqual(types, {'debit': DebitAccount, 'credit': CreditAccount, 'wallet': Wallet})
+
+    def test_api_accounts_query_count_is_constant(self):
+        """Test that the accounts API doesn't grow queries with the number of accounts"""
+        with self.assertNumQueries(3):  # session, user and accounts
+            response = self.client.get(reverse('api_accounts'), {'transaction_type': 'income'})
+        
+        self.assertEqual(len(response.json()), 6)
+
+class TransactionsApiPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='complexpassword123')
+        self.client.login(username='pager', password='complexpassword123')
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        today = date.today()
+        noon = timezone.datetime(2000, 1, 1, 12, 0).time()
+        # Several transactions share a date and time, so pages must break ties on id
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user, title=f'T{i}', amount=Decimal('2.50'), date=today.replace(day=1) + timedelta(days=i % 3),
+                time=noon, type='expense' if i % 5 else 'income', category=self.food,
+            )
+            for i in range(25)
+        ])
+
+    def test_cursor_walks_every_transaction_once(self):
+        """Test that following next_cursor returns every row once, newest first"""
+        url = reverse('transactions_api')
+        response = self.client.get(url, {'limit': 10}).json()
+        self.assertEqual(response['count'], 25)
+        self.assertEqual(response['total_income'], 12.5)
+        self.assertEqual(response['total_expenses'], 50.0)
+        
+        seen = []
+        while True:
+            seen.extend((t['date'], t['id']) for t in response['transactions'])
+            if not response['has_more']:
+                break
+            response = self.client.get(url, {'limit': 10, 'cursor': response['next_cursor']}).json()
+            self.assertNotIn('count', response)
+        
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(response['transactions'][0]['display_name'], 'Food')
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that a malformed cursor is a client error"""
+        response = self.client.get(reverse('transactions_api'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+class AggregateCacheTest(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='cached', password='complexpassword123')
+        self.client.login(username='cached', password='complexpassword123')
+        self.account = Wallet.objects.create(user=self.user, name='Cash', balance=Decimal('100.00'))
+        Transaction.objects.create(user=self.user, title='Salary', amount=Decimal('50.00'), date=date.today(), type='income')
+
+    def get_week(self):
+        return self.client.get(reverse('charts_data_time'), {'range': 'week'}).json()
+
+    def test_repeated_requests_are_served_from_cache(self):
+        """Test that a second request skips the aggregate queries and counts a hit"""
+        first = self.get_week()
+        with self.assertNumQueries(2):  # session and user only
+            second = self.get_week()
+        
+        self.assertEqual(first, second)
+        self.assertEqual(get_cache_stats()['charts_time'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_writes_invalidate_the_users_cache(self):
+        """Test that saving a transaction or moving a balance drops cached aggregates"""
+        self.assertEqual(self.get_week()['income'][-1], 50.0)
+        
+        Transaction.objects.create(user=self.user, title='Bonus', amount=Decimal('25.00'), date=date.today(), type='income')
+        self.assertEqual(self.get_week()['income'][-1], 75.0)
+        
+        self.client.get(reverse('dashboard'))
+        apply_balance_change(self.account, 'expense', Decimal('40.00'))
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['accounts_summary']['wallet']['balance'], Decimal('60.00'))
+        self.assertEqual(get_cache_stats()['dashboard']['hits'], 0)
+
+class RecurrenceExpansionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='recurring', password='complexpassword123')
+        self.account = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('0'))
+
+    def schedule(self, date_scheduled, repeat_type, repeats=0):
+        scheduled = ScheduledTransaction.objects.create(
+            user=self.user, name=f'{repeat_type} bill', transaction_type='expense', account=self.account,
+            amount=Decimal('5.00'), date_scheduled=timezone.now() + timedelta(hours=1),
+            repeat_type=repeat_type, repeats=repeats, is_recurring=True,
+        )
+        # Model validation rejects past dates, so move the date back after saving
+        ScheduledTransaction.objects.filter(pk=scheduled.pk).update(date_scheduled=date_scheduled)
+        return scheduled
+
+    def test_occurrences_match_stepping_from_the_first_one(self):
+        """Test that jumping into the window gives the same dates as stepping from the start"""
+        anchor = timezone.datetime(2021, 1, 31, 9, 30, tzinfo=timezone.utc)
+        start = timezone.datetime(2024, 2, 10, tzinfo=timezone.utc)
+        end = timezone.datetime(2025, 3, 5, tzinfo=timezone.utc)
+        for repeat_type in ('daily', 'weekly', 'monthly', 'yearly'):
+            self.schedule(anchor, repeat_type)
+        
+        generated = generate_scheduled_transactions(self.user, start, end)
+        
+        for repeat_type in ('daily', 'weekly', 'monthly', 'yearly'):
+            expected = []
+            for index in range(2000):
+                occurrence = get_occurrence_date(anchor, repeat_type, index)
+                if occurrence > end:
+                    break
+                if occurrence >= start:
+                    expected.append((occurrence, index + 1))
+            actual = [(t['date'], t['occurrence_number']) for t in generated if t['repeat_type'] == repeat_type]
+            self.assertEqual(actual, expected, repeat_type)
+        
+        # Month-end days are clamped, not skipped
+        monthly = [t['date'].date() for t in generated if t['repeat_type'] == 'monthly']
+        self.assertIn(date(2024, 2, 29), monthly)
+        self.assertEqual(add_months(anchor, 1).date(), date(2021, 2, 28))
+
+    def test_old_schedules_cost_constant_queries(self):
+        """Test that related objects and completed counts don't add per-schedule queries"""
+        ten_years_ago = timezone.now() - timedelta(days=3650)
+        for _ in range(5):
+            parent = self.schedule(ten_years_ago, 'daily', repeats=4000)
+            child = self.schedule(ten_years_ago, 'once', repeats=1)
+            ScheduledTransaction.objects.filter(pk=child.pk).update(parent_transaction=parent, status='completed')
+        
+        start = timezone.now()
+        with self.assertNumQueries(1):
+            generated = generate_scheduled_transactions(self.user, start, start + timedelta(days=180))
+        
+        recurring = [t for t in generated if t['repeat_type'] == 'daily']
+        self.assertEqual(len(recurring), 5 * 180)
+        # Numbering continues after the completed child, from the first occurrence after start
+        first_index = (start - ten_years_ago).days + 1
+        self.assertEqual(recurring[0]['occurrence_number'], 1 + first_index + 1)
+
+class TransactionImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='complexpassword123')
+        self.client.login(username='importer', password='complexpassword123')
+        self.bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('100.00'))
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.rent = Transaction.objects.create(
+            user=self.user, title='Rent', amount=Decimal('500.00'), date=date(2024, 1, 1), type='expense',
+        )
+
+    @override_settings(IMPORT_CHUNK_SIZE=50)
+    def test_import_runs_in_bulk(self):
+        """Test that a CSV import uses a bounded number of queries and reports every row"""
+        lines = ['Date;Title;Amount;Type;Category;Account;Notes']
+        for i in range(200):
+            lines.append(f"2024-02-{i % 28 + 1:02d};Item {i};1.50;expense;{'Food' if i % 2 else 'Travel'};{'Unknown' if i == 0 else 'Bank'};")
+        lines.append('2024-01-01;Rent;500.00;expense;;;')  # already in the database
+        lines.append('2024-02-02;Item 1;1.50;expense;Food;Bank;')  # repeated in the file
+        lines.append('2024-02-03;Broken;abc;expense;Food;Bank;')
+        upload = SimpleUploadedFile('transactions.csv', '\n'.join(lines).encode())
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('import_export_data'),
+                {'operation': 'import', 'duplicate_handling': 'skip', 'file': upload},
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        
+        report = response.json()
+        self.assertLess(len(queries), 30)
+        self.assertEqual(report['rows'], 203)
+        self.assertEqual(report['created'], 200)
+        self.assertEqual(report['skipped'], 2)
+        self.assertEqual(report['errors'], [{'row': 204, 'error': "Invalid amount 'abc'"}])
+        self.assertEqual(report['unknown_accounts'], ['Unknown'])
+        self.assertEqual(Category.objects.filter(user=self.user, name='Travel').count(), 1)
+        self.assertEqual(Transaction.objects.filter(user=self.user, transaction_account=self.bank).count(), 199)
+
+    def test_update_duplicates_from_xlsx(self):
+        """Test that update mode rewrites the matching transaction instead of adding one"""
+        wb = openpyxl.Workbook()
+        wb.active.append(['Date', 'Title', 'Amount', 'Type', 'Category', 'Account', 'Notes'])
+        wb.active.append([date(2024, 1, 1), 'Rent', 500, 'expense', 'Food', 'Bank', 'January'])
+        wb.active.append([date(2024, 1, 2), 'Coffee', 3.2, 'expense', 'Food', 'Bank', ''])
+        wb.active.append(['', None, None, '', None, None, None])
+        wb.active.append([date(2024, 1, 2), 'Coffee', 3.2, 'expense', 'Food', '', 'Twice'])
+        content = BytesIO()
+        wb.save(content)
+        upload = SimpleUploadedFile('transactions.xlsx', content.getvalue())
+        
+        report = TransactionImporter(self.user, duplicate_handling='update').run(iter_file_rows(upload))
+        
+        self.assertEqual((report.rows, report.created, report.updated, report.error_count), (3, 1, 2, 0))
+        self.rent.refresh_from_db()
+        self.assertEqual((self.rent.category, self.rent.transaction_account_id, self.rent.notes), (self.food, self.bank.pk, 'January'))
+        coffee = Transaction.objects.get(title='Coffee')
+        self.assertEqual((coffee.amount, coffee.transaction_account, coffee.notes), (Decimal('3.20'), None, 'Twice'))
+
+    def test_last_row_wins_when_updating_one_transaction_twice(self):
+        """Test that two update rows for the same existing transaction leave it and its rollup on the last row"""
+        report = TransactionImporter(self.user, duplicate_handling='update').run([
+            {'title': 'Rent', 'amount': '500.00', 'date': '2024-01-01', 'type': 'expense', 'category': 'Housing', 'account': '', 'notes': 'First'},
+            {'title': 'Rent', 'amount': '500.00', 'date': '2024-01-01', 'type': 'expense', 'category': 'Food', 'account': 'Bank', 'notes': 'Second'},
+        ])
+        
+        self.assertEqual(report.updated, 2)
+        self.rent.refresh_from_db()
+        self.assertEqual((self.rent.category, self.rent.transaction_account, self.rent.notes), (self.food, self.bank.account_ptr, 'Second'))
+        rollup = DailyRollup.objects.get(user=self.user, date=date(2024, 1, 1))
+        self.assertEqual(
+            (rollup.category_id, rollup.account_id, rollup.amount, rollup.count),
+            (self.rent.category_id, self.rent.transaction_account_id, Decimal('500.00'), 1),
+        )
+
+class StreamingExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='complexpassword123')
+        self.client.login(username='exporter', password='complexpassword123')
+        bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('100.00'))
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user, title=f'Item {i}', amount=Decimal('4.25'), date=date(2024, 3, i % 28 + 1), type='expense',
+                category=food if i % 2 else None, transaction_account=bank, notes='' if i % 3 else None,
+            )
+            for i in range(40)
+        ])
+
+    def export(self, format):
+        return self.client.post(reverse('import_export_data'), {
+            'operation': 'export', 'format': format, 'separator': ';', 'account': 'all',
+            'start_date': '2024-03-01', 'end_date': '2024-03-31', 'include_income': 'on', 'include_expenses': 'on',
+        })
+
+    def test_csv_export_streams_and_imports_back(self):
+        """Test that the CSV export is streamed in one query and reads back as duplicates"""
+        response = self.export('csv')
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content)
+        
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], 'Date;Title;Amount;Type;Category;Account;Notes')
+        self.assertEqual(len(lines), 41)
+        
+        report = TransactionImporter(self.user).run(iter_file_rows(SimpleUploadedFile('export.csv', content)))
+        self.assertEqual((report.created, report.skipped, report.error_count), (0, 40, 0))
+
+    def test_json_export_is_a_valid_array(self):
+        """Test that the streamed JSON export parses as one array of records"""
+        response = self.export('json')
+        records = json.loads(b''.join(response.streaming_content))
+        
+        self.assertEqual(len(records), 40)
+        self.assertEqual(next(record for record in records if record['title'] == 'Item 1'), {
+            'date': '2024-03-02', 'title': 'Item 1', 'amount': 4.25, 'type': 'expense',
+            'category': 'Food', 'account': 'Bank', 'notes': '',
+        })
+        
+        lines = b''.join(self.export('ndjson').streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], [record['title'] for record in records])
+
+    def test_xlsx_export_sizes_columns_and_imports_back(self):
+        """Test that the write-only XLSX export sizes columns from the data and reads back"""
+        response = self.export('xlsx')
+        content = b''.join(response.streaming_content)
+        
+        ws = openpyxl.load_workbook(BytesIO(content)).active
+        self.assertEqual(ws.max_row, 41)
+        self.assertEqual(ws.column_dimensions['B'].width, len('Item 10') + 2)
+        self.assertEqual(ws.column_dimensions['G'].width, len('Notes') + 2)
+        
+        report = TransactionImporter(self.user).run(iter_file_rows(SimpleUploadedFile('export.xlsx', content)))
+        self.assertEqual((report.created, report.skipped, report.error_count), (0, 40, 0))
+
+class DailyRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollups', password='complexpassword123')
+        self.bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('100.00'))
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.travel = Category.objects.create(user=self.user, name='Travel', type='expense')
+
+    def totals_by_key(self, queryset, account_field, amount, count):
+        rows = queryset.filter(user=self.user).order_by().values(
+            'date', 'type', 'category_id', 'subcategory_id', account_field
+        ).annotate(total=Sum(amount), rows=count)
+        return sorted((tuple(row.values()) for row in rows), key=str)
+
+    def assertRollupsMatchTransactions(self):
+        self.assertEqual(
+            self.totals_by_key(DailyRollup.objects, 'account_id', 'amount', Sum('count')),
+            self.totals_by_key(Transaction.objects, 'transaction_account_id', 'amount', Count('id')),
+        )
+
+    def test_rollups_follow_transaction_writes(self):
+        """Test that creating, editing and deleting transactions keeps the rollups exact"""
+        lunch = Transaction.objects.create(user=self.user, title='Lunch', amount=Decimal('12.50'), date=date(2024, 3, 4), type='expense', category=self.food)
+        Transaction.objects.create(user=self.user, title='Dinner', amount=Decimal('20.00'), date=date(2024, 3, 4), type='expense', category=self.food)
+        Transaction.objects.create(user=self.user, title='Pay', amount=Decimal('100.00'), date=date(2024, 3, 5), type='income', transaction_account=self.bank)
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(DailyRollup.objects.filter(user=self.user).count(), 2)
+        
+        lunch.amount = Decimal('15.00')
+        lunch.date = date(2024, 3, 6)
+        lunch.category = self.travel
+        lunch.save()
+        self.assertRollupsMatchTransactions()
+        
+        lunch.delete()
+        self.travel.delete()
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(get_period_totals(self.user, date(2024, 3, 1), date(2024, 3, 31)), (Decimal('100.00'), Decimal('20.00')))
+        
+        TransactionImporter(self.user, duplicate_handling='update').run([
+            {'title': 'Dinner', 'amount': '20.00', 'date': '2024-03-04', 'type': 'expense', 'category': 'Travel', 'account': 'Bank', 'notes': ''},
+            {'title': 'Taxi', 'amount': '7.25', 'date': '2024-03-07', 'type': 'expense', 'category': 'Travel', 'account': '', 'notes': ''},
+        ])
+        self.assertRollupsMatchTransactions()
+
+    def test_duplicate_rows_of_a_key_are_merged(self):
+        """Test that a removal from a key spread over two rows doesn't drop the other transaction's amount"""
+        lunch = Transaction.objects.create(user=self.user, title='Lunch', amount=Decimal('12.50'), date=date(2024, 3, 4), type='expense', category=self.food)
+        dinner = Transaction.objects.create(user=self.user, title='Dinner', amount=Decimal('20.00'), date=date(2024, 3, 4), type='expense', category=self.food)
+        # Two concurrent first writes of the key each insert a row
+        DailyRollup.objects.filter(user=self.user).update(amount=Decimal('12.50'), count=1)
+        DailyRollup.objects.create(user=self.user, date=date(2024, 3, 4), type='expense', category=self.food, amount=Decimal('20.00'), count=1)
+        
+        dinner.delete()
+        
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(DailyRollup.objects.filter(user=self.user).count(), 1)
+        
+        # A row whose count drops below zero keeps its amount and is reported
+        DailyRollup.objects.filter(user=self.user).update(count=0)
+        with self.assertLogs('finances.rollups', 'WARNING'):
+            lunch.delete()
+        self.assertEqual(DailyRollup.objects.get(user=self.user).amount, Decimal('0.00'))
+        self.assertEqual(DailyRollup.objects.get(user=self.user).count, -1)
+
+    def test_rebuild_command_restores_rollups(self):
+        """Test that rebuild_rollups recomputes the rows from the transactions"""
+        for day in range(1, 11):
+            Transaction.objects.create(user=self.user, title='Coffee', amount=Decimal('3.00'), date=date(2024, 5, day), type='expense', category=self.food)
+        DailyRollup.objects.filter(user=self.user, date__lte=date(2024, 5, 5)).delete()
+        self.assertEqual(get_period_totals(self.user)[1], Decimal('15.00'))
+        
+        out = StringIO()
+        call_command('rebuild_rollups', '--user', 'rollups', stdout=out)
+        
+        self.assertIn('Wrote 10 rollup rows', out.getvalue())
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(get_period_totals(self.user)[1], Decimal('30.00'))
+
+class CategoryBreakdownTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='breakdown', password='complexpassword123')
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        self.groceries = SubCategory.objects.create(parent_category=self.food, name='Groceries')
+        day = date(2024, 6, 3)
+        Transaction.objects.create(user=self.user, title='Market', amount=Decimal('30.00'), date=day, type='expense', category=self.food, subcategory=self.groceries)
+        Transaction.objects.create(user=self.user, title='Lunch', amount=Decimal('10.00'), date=day, type='expense', category=self.food)
+        Transaction.objects.create(user=self.user, title='Tip', amount=Decimal('2.00'), date=day, type='expense')
+        Transaction.objects.create(user=self.user, title='Pay', amount=Decimal('500.00'), date=day, type='income')
+        for i in range(6):
+            category = Category.objects.create(user=self.user, name=f'Misc {i}', type='expense')
+            Transaction.objects.create(user=self.user, title='Misc', amount=Decimal(5 + i), date=day, type='expense', category=category)
+
+    def test_top_categories_and_other_in_one_query(self):
+        """Test that the breakdown groups in one query and folds small groups into Other"""
+        with self.assertNumQueries(1):
+            breakdown = get_category_breakdown(self.user, date(2024, 6, 1), date(2024, 6, 30), 'expense', top=3)
+        
+        self.assertEqual(
+            [(row['category'], row['amount'], row['count']) for row in breakdown],
+            [('Food', Decimal('40.00'), 2), ('Misc 5', Decimal('10.00'), 1), ('Misc 4', Decimal('9.00'), 1), ('Other', Decimal('28.00'), 5)],
+        )
+
+    def test_breakdown_by_subcategory(self):
+        """Test that subcategories are split out within their category"""
+        breakdown = get_category_breakdown(self.user, transaction_type='expense', by_subcategory=True, top=3)
+        
+        self.assertEqual(
+            [(row['category'], row['subcategory'], row['amount']) for row in breakdown[:3]],
+            [('Food', 'Groceries', Decimal('30.00')), ('Food', None, Decimal('10.00')), ('Misc 5', None, Decimal('10.00'))],
+        )
+        self.assertEqual(breakdown[3]['subcategory_id'], None)
+
+class CategoryTreeApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tree', password='complexpassword123')
+        self.client.login(username='tree', password='complexpassword123')
+        for i in range(10):
+            category = Category.objects.create(user=self.user, name=f'Category {i}', type='income' if i < 3 else 'expense', order=i)
+            for j in range(3):
+                SubCategory.objects.create(parent_category=category, name=f'Sub {i}.{j}')
+
+    def test_tree_in_one_query_with_etag(self):
+        """Test that the tree loads in one query and revalidates with a 304 until it changes"""
+        url = reverse('api_categories')
+        with self.assertNumQueries(3):  # session, user and categories
+            response = self.client.get(url)
+        
+        data = response.json()
+        self.assertEqual((len(data['income']), len(data['expenses'])), (3, 7))
+        self.assertEqual([sub['name'] for sub in data['expenses'][0]['subcategories']], ['Sub 3.0', 'Sub 3.1', 'Sub 3.2'])
+        etag = response['ETag']
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        SubCategory.objects.create(parent_category=Category.objects.get(name='Category 0'), name='New')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+class ReorderCategoriesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reorder', password='complexpassword123')
+        self.client.login(username='reorder', password='complexpassword123')
+        self.ids = [Category.objects.create(user=self.user, name=f'Category {i:02d}', order=i).id for i in range(50)]
+
+    def reorder(self, **data):
+        return self.client.post(
+            reverse('api_reorder_categories'), json.dumps({'category_type': 'expense', **data}), content_type='application/json'
+        )
+
+    def ordered_ids(self):
+        return list(Category.objects.filter(user=self.user).order_by('order').values_list('id', flat=True))
+
+    def test_move_rewrites_only_the_categories_in_between(self):
+        """Test that a single move is one select and one update touching only the shifted rows"""
+        with self.assertNumQueries(6):  # session, user, savepoint, select, update and release
+            response = self.reorder(move={'category_id': self.ids[10], 'to_index': 13})
+        
+        self.assertEqual(response.json()['updated'], 4)
+        expected = self.ids[:10] + self.ids[11:14] + [self.ids[10]] + self.ids[14:]
+        self.assertEqual(self.ordered_ids(), expected)
+
+    def test_full_list_and_invalid_ids(self):
+        """Test that the complete order is still accepted and foreign ids are rejected"""
+        response = self.reorder(category_ids=list(reversed(self.ids)))
+        self.assertEqual(response.json()['updated'], 50)
+        self.assertEqual(self.ordered_ids(), list(reversed(self.ids)))
+        
+        other = User.objects.create_user(username='other')
+        foreign = Category.objects.create(user=other, name='Foreign')
+        self.assertEqual(self.reorder(move={'category_id': foreign.id, 'to_index': 0}).status_code, 404)
+        self.assertEqual(self.reorder(category_ids=self.ids[:2] + [foreign.id]).status_code, 404)
+        self.assertEqual(self.reorder(move={'category_id': self.ids[0], 'to_index': 50}).status_code, 400)
+
+class ProvisionCategoriesTest(TestCase):
+    def test_provisions_many_users_with_a_few_queries(self):
+        users = [User.objects.create_user(username=f'user{i}') for i in range(30)]
+
+        with CaptureQueriesContext(connection) as queries:
+            created = provision_default_categories(users)
+
+        self.assertEqual(created, 30 * len(DEFAULT_CATEGORIES))
+        self.assertEqual(Category.objects.count(), 30 * len(DEFAULT_CATEGORIES))
+        # A few batched inserts rather than one per category
+        self.assertLess(len(queries), 10)
+
+    def test_creates_subcategories_of_templates(self):
+        user = User.objects.create_user(username='templates')
+        templates = [
+            {'name': 'Food', 'icon': 'bi-cup-hot', 'type': 'expense', 'subcategories': [
+                {'name': 'Groceries', 'icon': 'bi-basket'},
+                {'name': 'Restaurants'},
+            ]},
+            {'name': 'Salary', 'icon': 'bi-cash-coin', 'type': 'income'},
+        ]
+
+        provision_default_categories([user], templates)
+
+        food = Category.objects.get(user=user, name='Food')
+        self.assertEqual(
+            sorted(food.subcategories.values_list('name', 'icon')),
+            [('Groceries', 'bi-basket'), ('Restaurants', 'bi-tag-fill')],
+        )
+        self.assertFalse(SubCategory.objects.filter(parent_category__name='Salary').exists())
+
+    def test_command_backfills_and_seeds_users(self):
+        provisioned = User.objects.create_user(username='provisioned')
+        provision_default_categories([provisioned])
+        User.objects.create_user(username='bare')
+
+        out = StringIO()
+        call_command('provision_categories', '--create-users', '3', stdout=out)
+
+        self.assertEqual(
+            sorted(User.objects.filter(username__startswith='loadtest-').values_list('username', flat=True)),
+            ['loadtest-1', 'loadtest-2', 'loadtest-3'],
+        )
+        for user in User.objects.all():
+            self.assertEqual(Category.objects.filter(user=user).count(), len(DEFAULT_CATEGORIES))
+        self.assertIn('for 4 users', out.getvalue())
+        self.assertFalse(User.objects.get(username='loadtest-1').has_usable_password())
+
+class RenewBudgetsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='renewals', password='complexpassword123')
+        self.account = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('0'))
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.rent = Category.objects.create(user=self.user, name='Rent')
+        self.lunch = SubCategory.objects.create(parent_category=self.food, name='Lunch')
+        self.month_start, self.month_end = Budget.get_current_period_dates('1 month')
+        self.week_start, self.week_end = Budget.get_current_period_dates('1 week')
+
+    def create_budget(self, start_date, amount, duration='1 month', **kwargs):
+        return Budget.objects.create(
+            user=self.user, account=self.account, amount=Decimal(amount), duration=duration,
+            start_date=start_date, **kwargs
+        )
+
+    def test_renews_category_and_subcategory_budgets_from_their_latest_period(self):
+        self.create_budget(date(2024, 1, 1), '200.00', category=self.food)
+        self.create_budget(date(2024, 2, 1), '250.00', category=self.food)
+        self.create_budget(date(2024, 2, 5), '40.00', duration='1 week', subcategory=self.lunch)
+        # Still running, so not renewed
+        self.create_budget(self.month_start, '900.00', category=self.rent)
+
+        # Ranking, lock, current budgets, insert, count and the savepoint
+        with self.assertNumQueries(7):
+            created = Budget.renew_expired_budgets()
+
+        self.assertEqual(created, 2)
+        food = Budget.objects.get(category=self.food, start_date=self.month_start)
+        self.assertEqual((food.amount, food.end_date, food.subcategory), (Decimal('250.00'), self.month_end, None))
+        lunch = Budget.objects.get(subcategory=self.lunch, start_date=self.week_start)
+        self.assertEqual((lunch.amount, lunch.end_date, lunch.duration), (Decimal('40.00'), self.week_end, '1 week'))
+        self.assertEqual(Budget.objects.filter(category=self.rent).count(), 1)
+
+    def test_command_is_idempotent(self):
+        self.create_budget(date(2024, 2, 1), '250.00', category=self.food)
+
+        out = StringIO()
+        call_command('renew_budgets', stdout=out)
+        call_command('renew_budgets', stdout=out)
+
+        self.assertEqual(out.getvalue().splitlines(), ['Renewed 1 budget(s)', 'Renewed 0 budget(s)'])
+        self.assertEqual(Budget.objects.filter(category=self.food).count(), 2)
+
+    def test_counts_only_the_budgets_it_inserted(self):
+        self.create_budget(date(2024, 2, 1), '250.00', category=self.food)
+        self.create_budget(date(2024, 2, 1), '900.00', category=self.rent)
+        select_for_update = QuerySet.select_for_update
+
+        def overlapping_run(queryset, *args, **kwargs):
+            # Another run renewed the food budget after this one ranked the
+            # series, so this run must neither insert nor count it
+            if not Budget.objects.filter(category=self.food, start_date=self.month_start).exists():
+                self.create_budget(self.month_start, '250.00', category=self.food)
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=overlapping_run):
+            created = Budget.renew_expired_budgets()
+
+        self.assertEqual(created, 1)
+        self.assertEqual(Budget.objects.filter(start_date=self.month_start).count(), 2)
+
+    def test_count_ignores_series_with_several_current_budgets(self):
+        self.create_budget(date(2024, 2, 1), '250.00', category=self.food)
+        # Two current budgets of one series, which unique_together lets through
+        self.create_budget(self.month_start, '900.00', category=self.rent)
+        self.create_budget(self.month_start, '950.00', category=self.rent)
+
+        self.assertEqual(Budget.renew_expired_budgets(), 1)
+        self.assertEqual(Budget.objects.filter(start_date=self.month_start).count(), 3)
+
+class BudgetWarningsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='warnings', password='complexpassword123')
+        self.bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('0'))
+        self.cash = Wallet.objects.create(user=self.user, name='Cash', balance=Decimal('0'))
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.rent = Category.objects.create(user=self.user, name='Rent')
+        self.lunch = SubCategory.objects.create(parent_category=self.food, name='Lunch')
+        for category, subcategory, amount, duration, start_date in [
+            (self.food, None, '100.00', '1 month', date(2024, 3, 1)),
+            (None, self.lunch, '50.00', '1 week', date(2024, 3, 4)),
+            (self.rent, None, '1000.00', '1 month', date(2024, 3, 1)),
+        ]:
+            Budget.objects.create(
+                user=self.user, category=category, subcategory=subcategory, amount=Decimal(amount),
+                account=self.bank, duration=duration, start_date=start_date
+            )
+        for day, amount, category, subcategory, account in [
+            (5, '60.00', self.food, self.lunch, self.bank),
+            (20, '30.00', self.food, self.lunch, self.bank),
+            (21, '500.00', self.food, None, self.cash),
+            (2, '100.00', self.rent, None, self.bank),
+        ]:
+            Transaction.objects.create(
+                user=self.user, title='Spend', amount=Decimal(amount), date=date(2024, 3, day), type='expense',
+                category=category, subcategory=subcategory, transaction_account=account
+            )
+
+    def test_warnings_match_each_budget_scope_in_one_query(self):
+        with self.assertNumQueries(1):
+            warnings = get_budget_warnings(self.user, date(2024, 3, 1), date(2024, 3, 31), thresholds=[80, 100])
+
+        self.assertEqual(
+            [(w['category'], w['account'], w['spent'], w['percentage'], w['threshold']) for w in warnings],
+            [
+                ('Food - Lunch', 'Bank', Decimal('60.00'), 120, 100),
+                ('Food', 'Bank', Decimal('90.00'), 90, 80),
+            ],
+        )
+
+    def test_thresholds_are_configurable(self):
+        warnings = get_budget_warnings(self.user, date(2024, 3, 1), date(2024, 3, 31), thresholds=[95])
+        self.assertEqual([w['category'] for w in warnings], ['Food - Lunch'])
+
+        with override_settings(BUDGET_WARNING_THRESHOLDS=[10]):
+            warnings = get_budget_warnings(self.user, date(2024, 3, 1), date(2024, 3, 31))
+        self.assertEqual([(w['category'], w['threshold']) for w in warnings], [('Food - Lunch', 10), ('Food', 10), ('Rent', 10)])
+
+class BalanceProjectionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='projections', password='complexpassword123')
+        self.bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('1000.00'))
+        self.card = CreditAccount.objects.create(user=self.user, name='Card', credit_limit=Decimal('5000.00'), current_usage=Decimal('200.00'))
+
+    def schedule(self, day, repeat_type, transaction_type, amount, account, repeats=0):
+        scheduled = ScheduledTransaction.objects.create(
+            user=self.user, name=f'{repeat_type} {transaction_type}', transaction_type=transaction_type, account=account,
+            amount=Decimal(amount), date_scheduled=timezone.now() + timedelta(hours=1),
+            repeat_type=repeat_type, repeats=repeats, is_recurring=repeat_type != 'once',
+        )
+        # Model validation rejects past dates, so move the date back after saving
+        date_scheduled = timezone.make_aware(timezone.datetime(day.year, day.month, day.day, 9, 30))
+        ScheduledTransaction.objects.filter(pk=scheduled.pk).update(date_scheduled=date_scheduled)
+
+    def test_offsets_match_occurrence_dates(self):
+        anchor = date(2021, 1, 31)
+        start, end = date(2024, 2, 10), date(2025, 3, 5)
+        for repeat_type in ('daily', 'weekly', 'monthly', 'yearly'):
+            expected = []
+            for index in range(2000):
+                occurrence = get_occurrence_date(anchor, repeat_type, index)
+                if occurrence > end:
+                    break
+                if occurrence >= start:
+                    expected.append((occurrence - start).days)
+            self.assertEqual(get_occurrence_offsets(anchor, repeat_type, start, end).tolist(), expected, repeat_type)
+
+        limited = get_occurrence_offsets(anchor, 'monthly', start, end, limit=40)
+        self.assertEqual(len(limited), 40 - 37)
+
+    def test_weekly_projection_per_account_and_in_total(self):
+        self.schedule(date(2024, 3, 1), 'daily', 'expense', '10.00', self.bank)
+        self.schedule(date(2024, 3, 4), 'weekly', 'expense', '100.00', self.bank, repeats=2)
+        self.schedule(date(2024, 2, 15), 'monthly', 'income', '500.00', self.card)
+        self.schedule(date(2024, 3, 20), 'once', 'expense', '50.00', None, repeats=1)
+
+        with self.assertNumQueries(2):
+            projection = get_balance_projection(self.user, date(2024, 3, 1), date(2024, 3, 31), 'week')
+
+        self.assertEqual(projection['periods'], [date(2024, 2, 26) + timedelta(weeks=i) for i in range(5)])
+        self.assertEqual([(a['name'], a['balances']) for a in projection['accounts']], [
+            ('Bank', [970.0, 800.0, 630.0, 560.0, 490.0]),
+            ('Card', [-200.0, -200.0, 300.0, 300.0, 300.0]),
+        ])
+        self.assertEqual(projection['total'], [770.0, 600.0, 930.0, 810.0, 740.0])
+        self.assertEqual(projection['flows'], [-30.0, -170.0, 330.0, -120.0, -70.0])
+
+    def test_future_chart_uses_the_projection(self):
+        self.client.login(username='projections', password='complexpassword123')
+        self.schedule(timezone.localdate(), 'daily', 'expense', '10.00', self.bank)
+
+        response = self.client.get(reverse('charts_data_future'), {'interval': 'month', 'months': '12'})
+
+        data = response.json()
+        self.assertEqual(len(data['labels']), 12)
+        self.assertEqual(len(data['projected']), 12)
+        self.assertEqual(data['projected'][0], 800.0 - 10 * (add_months(timezone.localdate().replace(day=1), 1) - timezone.localdate()).days)
+        self.assertEqual(self.client.get(reverse('charts_data_future'), {'interval': 'hour'}).status_code, 400)
+
+class ScheduleFailurePredictionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='failures', password='complexpassword123')
+        self.bank = DebitAccount.objects.create(user=self.user, name='Bank', balance=Decimal('300.00'), maintaining_balance=Decimal('100.00'))
+        self.card = CreditAccount.objects.create(user=self.user, name='Card', credit_limit=Decimal('100.00'), current_usage=Decimal('90.00'))
+        self.cash = Wallet.objects.create(user=self.user, name='Cash', balance=Decimal('0'))
+
+    def schedule(self, when, repeat_type, transaction_type, amount, account, repeats=0, name=None):
+        scheduled = ScheduledTransaction.objects.create(
+            user=self.user, name=name or f'{repeat_type} {transaction_type}', transaction_type=transaction_type,
+            account=account, amount=Decimal(amount), date_scheduled=timezone.now() + timedelta(hours=1),
+            repeat_type=repeat_type, repeats=repeats, is_recurring=repeat_type != 'once',
+        )
+        # Model validation rejects past dates, so move the date back after saving
+        ScheduledTransaction.objects.filter(pk=scheduled.pk).update(date_scheduled=timezone.make_aware(when))
+        return scheduled
+
+    def test_predicts_first_failure_of_every_schedule_in_posting_order(self):
+        at = timezone.datetime
+        self.schedule(at(2024, 2, 20, 9), 'once', 'expense', '30.00', self.bank, repeats=1, name='Overdue')
+        self.schedule(at(2024, 3, 1, 9), 'daily', 'expense', '60.00', self.bank, name='Rent')
+        self.schedule(at(2024, 3, 1, 9), 'once', 'expense', '20.00', self.card, repeats=1, name='Gadget')
+        self.schedule(at(2024, 3, 2, 8), 'once', 'income', '50.00', self.cash, repeats=1, name='Gift')
+        self.schedule(at(2024, 3, 2, 10), 'once', 'expense', '50.00', self.cash, repeats=1, name='Dinner')
+        self.schedule(at(2024, 3, 2, 11), 'once', 'expense', '1.00', self.cash, repeats=1, name='Tip')
+        self.schedule(at(2024, 3, 5, 9), 'weekly', 'expense', '5.00', None, name='Orphan')
+
+        with self.assertNumQueries(2):
+            prediction = predict_schedule_failures(self.user, date(2024, 3, 31), today=date(2024, 3, 1))
+
+        self.assertEqual([(f['name'], f['date'], f['reason']) for f in prediction['failures']], [
+            ('Gadget', date(2024, 3, 1), 'insufficient_funds'),
+            ('Tip', date(2024, 3, 2), 'insufficient_funds'),
+            ('Rent', date(2024, 3, 3), 'insufficient_funds'),
+            ('Orphan', date(2024, 3, 5), 'no_account'),
+        ])
+        accounts = {a['name']: a for a in prediction['accounts']}
+        self.assertEqual(accounts['Bank']['balance'], Decimal('150.00'))
+        self.assertEqual(accounts['Bank']['first_failure'], date(2024, 3, 3))
+        self.assertEqual(accounts['Card']['balance'], Decimal('-90.00'))
+        self.assertEqual(accounts['Cash']['lowest_balance'], Decimal('0.00'))
+
+    def test_api_is_cached_until_schedules_change(self):
+        self.client.login(username='failures', password='complexpassword123')
+        tomorrow = timezone.localtime().replace(hour=9, minute=0, second=0, microsecond=0, tzinfo=None) + timedelta(days=1)
+        self.schedule(tomorrow, 'daily', 'expense', '80.00', self.bank, name='Rent')
+        url = reverse('api_scheduled_failures')
+
+        data = self.client.get(url, {'days': '30'}).json()
+        self.assertEqual([(f['name'], f['date']) for f in data['failures']], [('Rent', (tomorrow + timedelta(days=2)).date().isoformat())])
+        with self.assertNumQueries(2):
+            # Session and user only
+            self.client.get(url, {'days': '30'})
+
+        DebitAccount.objects.filter(pk=self.bank.pk).update(balance=Decimal('1000.00'))
+        self.bank.refresh_from_db()
+        self.bank.save()
+        data = self.client.get(url, {'days': '30'}).json()
+        self.assertEqual(data['failures'][0]['date'], (tomorrow + timedelta(days=11)).date().isoformat())
+        self.assertEqual(self.client.get(url, {'days': 'soon'}).status_code, 400)
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        reset_request_metrics()
+        self.user = User.objects.create_user(username='metrics', password='complexpassword123')
+        self.client.login(username='metrics', password='complexpassword123')
+
+    def test_records_queries_and_size_per_url_name(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_categories'))
+        # Read before the next request resets the query log
+        query_count = len(queries)
+        self.client.get(reverse('api_categories'))
+        self.client.get('/no-such-page/')
+
+        views = get_request_metrics()['views']
+        categories = views['api_categories']
+        self.assertEqual(categories['requests'], 2)
+        self.assertEqual(categories['errors'], 0)
+        self.assertEqual(categories['queries']['max'], query_count)
+        self.assertEqual(categories['response_bytes']['max'], len(response.content))
+        self.assertEqual(categories['wall_ms']['count'], 2)
+        self.assertEqual(views['<unresolved>']['requests'], 1)
+
+    def test_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('api_request_metrics')).status_code, 403)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        data = self.client.get(reverse('api_request_metrics')).json()
+        self.assertEqual(data['views']['api_request_metrics']['requests'], 1)
+        self.assertIn('dashboard', data['cache'])
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram((10, 100))
+        for value in (1, 2, 3, 50, 500):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(0.5), 10)
+        self.assertEqual(histogram.percentile(0.8), 100)
+        self.assertEqual(histogram.percentile(0.95), 500)
+        self.assertEqual(histogram.as_dict()['buckets'], {'<=10': 3, '<=100': 1, '>100': 1})
+
+class LoggingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='logging', password='complexpassword123')
+        self.client.login(username='logging', password='complexpassword123')
+
+    def test_create_transaction_logs_instead_of_printing(self):
+        stdout = StringIO()
+        with redirect_stdout(stdout), self.assertLogs('finances.views', 'DEBUG') as logs:
+            response = self.client.post(reverse('create_transaction_api'), {
+                'title': 'Lunch', 'amount': '12.50', 'date': '2024-05-01', 'type': 'expense',
+            })
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn(f"created transaction {response.json()['transaction_id']}", logs.output[-1])
+
+    def test_queue_handler_writes_formatted_records(self):
+        stream = StringIO()
+        handler = QueueLogHandler(stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(name)s %(message)s'))
+        logger = logging.getLogger('finances.tests.queue')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            logger.warning('Balance of %s is %s', 'Wallet', 5)
+        finally:
+            logger.removeHandler(handler)
+            # Closing waits for the listener thread to write the queued records
+            handler.close()
+        self.assertEqual(stream.getvalue(), 'WARNING finances.tests.queue Balance of Wallet is 5\n')
+
+class SQLiteConnectionTest(TestCase):
+    def test_new_connections_use_wal_and_a_busy_timeout(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = SQLiteDatabaseWrapper(
+                {**connection.settings_dict, 'NAME': os.path.join(directory, 'wal.sqlite3')}, alias='wal'
+            )
+            # Connecting sends connection_created
+            wrapper.ensure_connection()
+            def pragma(name):
+                return wrapper.connection.execute(f'PRAGMA {name}').fetchone()[0]
+            try:
+                self.assertEqual(pragma('journal_mode'), 'wal')
+                self.assertEqual(pragma('synchronous'), 1)  # NORMAL
+                self.assertEqual(pragma('busy_timeout'), settings.SQLITE_BUSY_TIMEOUT)
+            finally:
+                wrapper.close()
+
+class BalanceConcurrencyTest(TransactionTestCase):
+    THREADS = 8
+    CHANGES_PER_THREAD = 25
+
+    def test_concurrent_changes_are_not_lost(self):
+        """Test that many threads hammering one account end on the exact balance"""
+        user = User.objects.create_user(username='hammer', password='complexpassword123')
+        wallet = Wallet.objects.create(user=user, name='Cash', balance=Decimal('1000.00'))
+        
+        def worker(transaction_type):
+            try:
+                for _ in range(self.CHANGES_PER_THREAD):
+                    while True:
+                        try:
+                            apply_balance_change(wallet, transaction_type, Decimal('1.50'))
+                            break
+                        except OperationalError:
+                            # SQLite reports a locked table instead of waiting for it
+                            time.sleep(0.001)
+            finally:
+                connections.close_all()
+        
+        threads = [
+            threading.Thread(target=worker, args=('expense' if i % 4 else 'income',))
+            for i in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # 6 threads spend and 2 threads earn 25 x 1.50 each
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal('1000.00') - 4 * self.CHANGES_PER_THREAD * Decimal('1.50'))
@@ -19,6 +19,7 @@ urlpatterns = [
     path('scheduled/edit/<int:pk>/', views.edit_scheduled_transaction, name='edit_scheduled_transaction'),
     path('scheduled/delete/<int:pk>/', views.delete_scheduled_transaction, name='delete_scheduled_transaction'),
     path('scheduled/resolve/<int:pk>/', views.resolve_scheduled_transaction, name='resolve_scheduled_transaction'),
+    path('api/scheduled/failures/', views.api_scheduled_failures, name='api_scheduled_failures'),
     path('categories/', views.categories, name='categories'),
     path('api/categories/', views.api_categories, name='api_categories'),
     path('api/categories/add/', views.api_add_category, name='api_add_category'),
@@ -53,6 +54,7 @@ urlpatterns = [
     path('transactions/api/batch-delete/', views.batch_delete_transactions_api, name='batch_delete_transactions_api'),
     path('api/accounts/', views.api_accounts, name='api_accounts'),
     path('api/accounts/<int:account_id>/balance/', views.api_account_balance, name='api_account_balance'),
+    path('api/metrics/', views.api_request_metrics, name='api_request_metrics'),
     # Dashboard
     path('', views.dashboard, name='dashboard'),
     path('save-dashboard-preferences/', views.save_dashboard_preferences, name='save_dashboard_preferences'),
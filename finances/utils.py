@@ -1,14 +1,167 @@
-from datetime import datetime, timedelta
+from datetime import datetime, date, time, timedelta
+import base64
+import calendar
+import logging
+from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
-from .models import ScheduledTransaction, Transaction
-from django.db.models import Q
+from .models import ScheduledTransaction, Transaction, DailyRollup, Budget, DebitAccount, CreditAccount, Wallet
+from .cache import invalidate_user_cache
+from django.db import transaction as db_transaction
+from django.db.models import Q, Sum, Count, F, Value, DecimalField
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, Coalesce, Greatest, Least
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKET_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Page size of the transactions API, and the most a client may ask for
+TRANSACTION_PAGE_SIZE = 100
+MAX_TRANSACTION_PAGE_SIZE = 500
+
+# Columns read by serialize_transaction_row, joined in the same query
+TRANSACTION_LIST_FIELDS = (
+    'id', 'title', 'amount', 'date', 'time', 'type', 'notes',
+    'category_id', 'category__name', 'category__icon',
+    'subcategory_id', 'subcategory__name', 'subcategory__icon',
+    'transaction_account_id', 'transaction_account__name',
+)
+
+class InsufficientFundsError(Exception):
+    """Raised when an account can't cover an outgoing amount."""
+    
+    MESSAGES = {
+        'debit': 'Insufficient balance in debit account.',
+        'credit': 'Credit limit would be exceeded.',
+        'wallet': 'Insufficient balance in wallet.',
+    }
+    
+    def __init__(self, account_type):
+        self.account_type = account_type
+        super().__init__(self.MESSAGES.get(account_type, 'Insufficient funds.'))
+
+def apply_balance_change(account, transaction_type, amount, revert=False, check_funds=False):
+    """
+    Apply (or revert) the effect of a transaction on an account balance.
+    
+    The change is written as a single UPDATE with F() expressions, so concurrent
+    requests never overwrite each other's balance. With check_funds, the funds
+    check is part of the same UPDATE and the change is only made if the account
+    can cover it; otherwise InsufficientFundsError is raised and nothing changes.
+    
+    Args:
+        account: The Account (or concrete account subtype) to update
+        transaction_type: 'expense' or 'income'
+        amount: The transaction amount
+        revert: Undo the effect of the transaction instead of applying it
+        check_funds: Refuse outgoing amounts the account can't cover
+    """
+    account_type = account.get_account_type()
+    amount = Decimal(str(amount))
+    zero = Value(Decimal('0'), output_field=DecimalField())
+    # Money leaves the account for expenses, and when an income is reverted
+    outgoing = (transaction_type == 'expense') != revert
+    
+    if account_type == 'debit':
+        accounts = DebitAccount.objects.filter(pk=account.pk)
+        if outgoing and check_funds:
+            accounts = accounts.filter(balance__gte=Coalesce(F('maintaining_balance'), zero) + amount)
+        updated = accounts.update(balance=F('balance') - amount if outgoing else F('balance') + amount)
+    elif account_type == 'credit':
+        accounts = CreditAccount.objects.filter(pk=account.pk)
+        if outgoing and check_funds:
+            accounts = accounts.filter(current_usage__lte=F('credit_limit') - amount)
+        if not outgoing:
+            # Usage never drops below zero
+            current_usage = Greatest(F('current_usage') - amount, zero)
+        elif revert:
+            # Reverted payments never push usage over the limit
+            current_usage = Least(F('current_usage') + amount, F('credit_limit'))
+        else:
+            current_usage = F('current_usage') + amount
+        updated = accounts.update(current_usage=current_usage)
+    elif account_type == 'wallet':
+        accounts = Wallet.objects.filter(pk=account.pk)
+        if outgoing and check_funds:
+            accounts = accounts.filter(balance__gte=amount)
+        updated = accounts.update(balance=F('balance') - amount if outgoing else F('balance') + amount)
+    else:
+        return
+    
+    if not updated and check_funds:
+        raise InsufficientFundsError(account_type)
+    # Queryset updates send no signals
+    invalidate_user_cache(account.user_id)
+
+def get_occurrence_date(anchor, repeat_type, index):
+    """
+    Return the date of the index-th (0-based) occurrence of a schedule.
+    
+    Computed directly from the first occurrence, without stepping through the
+    ones before it. Monthly and yearly occurrences keep the anchor's day and
+    are clamped to the end of shorter months.
+    """
+    if repeat_type == 'daily':
+        return anchor + timedelta(days=index)
+    if repeat_type == 'weekly':
+        return anchor + timedelta(weeks=index)
+    if repeat_type == 'monthly':
+        return add_months(anchor, index)
+    if repeat_type == 'yearly':
+        return add_months(anchor, 12 * index)
+    return anchor
+
+def get_first_occurrence_index(anchor, repeat_type, start):
+    """Return the index of the first occurrence of a schedule at or after start."""
+    if start <= anchor:
+        return 0
+    if repeat_type in ('daily', 'weekly'):
+        step = timedelta(days=1) if repeat_type == 'daily' else timedelta(weeks=1)
+        index, remainder = divmod(start - anchor, step)
+        return index + 1 if remainder else index
+    if repeat_type in ('monthly', 'yearly'):
+        months = (start.year - anchor.year) * 12 + start.month - anchor.month
+        index = months // (1 if repeat_type == 'monthly' else 12)
+        # Same month (or year) as start but earlier in it
+        if get_occurrence_date(anchor, repeat_type, index) < start:
+            index += 1
+        return index
+    return 0
+
+def get_occurrence_details(scheduled, date, occurrence_number):
+    """Describe one occurrence of a scheduled transaction for the calendar and projections"""
+    return {
+        'id': scheduled.id,
+        'title': scheduled.name,
+        'amount': float(scheduled.amount),
+        'date': date,
+        'type': scheduled.transaction_type,
+        'category': scheduled.category.name if scheduled.category else None,
+        'subcategory': scheduled.subcategory.name if scheduled.subcategory else None,
+        'account': scheduled.account.name if scheduled.account else None,
+        'note': scheduled.note,
+        'status': scheduled.status,
+        'is_scheduled': True,
+        'scheduled_id': scheduled.id,
+        'repeat_type': scheduled.repeat_type,
+        'repeats': scheduled.repeats,
+        'occurrence_number': occurrence_number
+    }
 
 def generate_scheduled_transactions(user, start_date, end_date):
     """
     Generate all scheduled transactions for a user within a given date range.
     Returns a list of dictionaries containing transaction details.
     
+    Recurring schedules jump straight to their first occurrence in the range,
+    so the cost depends on the number of occurrences in the range, not on how
+    long ago the schedule started. Related objects and completed occurrence
+    counts are loaded in the same query as the schedules.
+    
     Args:
         user: The user to generate transactions for
         start_date: The start date of the range (timezone-aware datetime)
@@ -17,106 +170,46 @@ def generate_scheduled_transactions(user, start_date, end_date):
     Returns:
         List of dictionaries with transaction details
     """
+    finished = Q(status__in=['completed', 'failed'])
     scheduled_transactions = ScheduledTransaction.objects.filter(
         user=user,
         date_scheduled__lte=end_date
+    ).filter(
+        # Finished schedules only show their own occurrence, if it's in range
+        ~finished | Q(date_scheduled__gte=start_date)
+    ).select_related(
+        'category', 'subcategory', 'account', 'parent_transaction'
+    ).annotate(
+        completed_count=Count(
+            'child_transactions',
+            filter=Q(child_transactions__status__in=['completed', 'failed'])
+        )
     ).order_by('date_scheduled')
 
     generated_transactions = []
     
     for scheduled in scheduled_transactions:
-        # If status is completed or failed, only show the actual occurrence if in range
-        if scheduled.status in ('completed', 'failed'):
-            if scheduled.date_scheduled >= start_date and scheduled.date_scheduled <= end_date:
-                generated_transactions.append({
-                    'id': scheduled.id,
-                    'title': scheduled.name,
-                    'amount': float(scheduled.amount),
-                    'date': scheduled.date_scheduled,
-                    'type': scheduled.transaction_type,
-                    'category': scheduled.category.name if scheduled.category else None,
-                    'subcategory': scheduled.subcategory.name if scheduled.subcategory else None,
-                    'account': scheduled.account.name if scheduled.account else None,
-                    'note': scheduled.note,
-                    'status': scheduled.status,
-                    'is_scheduled': True,
-                    'scheduled_id': scheduled.id,
-                    'repeat_type': scheduled.repeat_type,
-                    'repeats': scheduled.repeats,
-                    'occurrence_number': 1
-                })
-            continue
-
-        # For recurring transactions, count completed/failed child occurrences
-        completed_count = ScheduledTransaction.objects.filter(
-            parent_transaction=scheduled,
-            status__in=['completed', 'failed']
-        ).count()
-        # For one-time transactions, just add them if they're within the date range
-        if scheduled.repeat_type == 'once':
-            if scheduled.date_scheduled >= start_date and scheduled.date_scheduled <= end_date:
-                generated_transactions.append({
-                    'id': scheduled.id,
-                    'title': scheduled.name,
-                    'amount': float(scheduled.amount),
-                    'date': scheduled.date_scheduled,
-                    'type': scheduled.transaction_type,
-                    'category': scheduled.category.name if scheduled.category else None,
-                    'subcategory': scheduled.subcategory.name if scheduled.subcategory else None,
-                    'account': scheduled.account.name if scheduled.account else None,
-                    'note': scheduled.note,
-                    'status': scheduled.status,
-                    'is_scheduled': True,
-                    'scheduled_id': scheduled.id,
-                    'repeat_type': scheduled.repeat_type,
-                    'repeats': scheduled.repeats,
-                    'occurrence_number': 1
-                })
+        # Completed, failed and one-time transactions only have their own occurrence
+        if scheduled.status in ('completed', 'failed') or scheduled.repeat_type == 'once':
+            if start_date <= scheduled.date_scheduled <= end_date:
+                generated_transactions.append(get_occurrence_details(scheduled, scheduled.date_scheduled, 1))
             continue
 
-        # For recurring transactions, generate up to (repeats - completed_count) occurrences (unless repeats==0)
-        current_date = scheduled.date_scheduled
-        occurrence_count = 0
+        # Recurring transactions have (repeats - completed_count) occurrences left, or no end if repeats == 0
         if scheduled.repeats > 0:
-            max_occurrences = scheduled.repeats - completed_count
-            if max_occurrences < 0:
-                max_occurrences = 0
+            max_occurrences = max(scheduled.repeats - scheduled.completed_count, 0)
         else:
-            max_occurrences = 1000  # safety cap for infinite
-        while occurrence_count < max_occurrences:
+            max_occurrences = None
+        
+        # Later occurrences of a series count from the series' first occurrence
+        anchor, first_index = get_schedule_anchor(scheduled)
+        index = max(get_first_occurrence_index(anchor, scheduled.repeat_type, start_date), first_index)
+        while max_occurrences is None or index < first_index + max_occurrences:
+            current_date = get_occurrence_date(anchor, scheduled.repeat_type, index)
             if current_date > end_date:
                 break
-            if current_date >= start_date and current_date <= end_date:
-                generated_transactions.append({
-                    'id': scheduled.id,
-                    'title': scheduled.name,
-                    'amount': float(scheduled.amount),
-                    'date': current_date,
-                    'type': scheduled.transaction_type,
-                    'category': scheduled.category.name if scheduled.category else None,
-                    'subcategory': scheduled.subcategory.name if scheduled.subcategory else None,
-                    'account': scheduled.account.name if scheduled.account else None,
-                    'note': scheduled.note,
-                    'status': scheduled.status,
-                    'is_scheduled': True,
-                    'scheduled_id': scheduled.id,
-                    'repeat_type': scheduled.repeat_type,
-                    'repeats': scheduled.repeats,
-                    'occurrence_number': completed_count + occurrence_count + 1
-                })
-            occurrence_count += 1
-            # Calculate next occurrence based on repeat type
-            if scheduled.repeat_type == 'daily':
-                current_date += timedelta(days=1)
-            elif scheduled.repeat_type == 'weekly':
-                current_date += timedelta(weeks=1)
-            elif scheduled.repeat_type == 'monthly':
-                if current_date.month == 12:
-                    current_date = current_date.replace(year=current_date.year + 1, month=1)
-                else:
-                    current_date = current_date.replace(month=current_date.month + 1)
-            elif scheduled.repeat_type == 'yearly':
-                current_date = current_date.replace(year=current_date.year + 1)
+            generated_transactions.append(get_occurrence_details(scheduled, current_date, scheduled.completed_count + index + 1))
+            index += 1
 
     return generated_transactions
 
@@ -137,7 +230,7 @@ def get_transactions_with_scheduled(user, start_date, end_date):
         user=user,
         date__gte=start_date.date(),
         date__lte=end_date.date()
-    )
+    ).select_related('category', 'transaction_account')
     
     # Convert actual transactions to the same format as scheduled
     transactions = []
@@ -160,4 +253,405 @@ def get_transactions_with_scheduled(user, start_date, end_date):
     all_transactions = transactions + scheduled_transactions
     all_transactions.sort(key=lambda x: x['date'])
     
-    return all_transactions 
\ No newline at end of file
+    return all_transactions 
+
+def add_months(value, months):
+    """Shift a date or datetime by a number of months, clamping the day to the month's end"""
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+def get_bucket_start(value, interval):
+    """Return the first day of the day/week/month bucket that contains value"""
+    if interval == 'week':
+        return value - timedelta(days=value.weekday())
+    if interval == 'month':
+        return value.replace(day=1)
+    return value
+
+def get_next_bucket_start(value, interval):
+    """Return the first day of the bucket following the one starting at value"""
+    if interval == 'week':
+        return value + timedelta(weeks=1)
+    if interval == 'month':
+        return add_months(value, 1)
+    return value + timedelta(days=1)
+
+def get_cash_flow_buckets(user, start_date, end_date, interval='day'):
+    """
+    Get income and expense totals for every day, week or month between two dates
+    using a single grouped query over the daily rollups. Buckets without
+    transactions are filled with zeros.
+
+    Args:
+        user: The user to aggregate transactions for
+        start_date: The first date of the range (date)
+        end_date: The last date of the range, inclusive (date)
+        interval: 'day', 'week' (starting Monday) or 'month'
+
+    Returns:
+        List of dictionaries with 'period' (first day of the bucket), 'income'
+        and 'expenses', ordered by period
+    """
+    if interval not in TIME_BUCKET_FUNCTIONS:
+        raise ValueError(f"Unsupported interval: {interval}")
+
+    rows = DailyRollup.objects.filter(
+        user=user,
+        date__gte=start_date,
+        date__lte=end_date
+    ).annotate(
+        period=TIME_BUCKET_FUNCTIONS[interval]('date')
+    ).values('period').annotate(
+        income=Sum('amount', filter=Q(type='income')),
+        expenses=Sum('amount', filter=Q(type='expense'))
+    ).order_by('period')
+
+    totals = {row['period']: row for row in rows}
+
+    buckets = []
+    period = get_bucket_start(start_date, interval)
+    while period <= end_date:
+        row = totals.get(period, {})
+        buckets.append({
+            'period': period,
+            'income': row.get('income') or Decimal('0'),
+            'expenses': row.get('expenses') or Decimal('0'),
+        })
+        period = get_next_bucket_start(period, interval)
+
+    return buckets
+
+def get_period_totals(user, start_date=None, end_date=None):
+    """
+    Get the income and expense totals of a user between two dates (both inclusive,
+    open ended when None) from the daily rollups.
+
+    Returns:
+        Tuple of (income, expenses) as Decimals
+    """
+    rollups = DailyRollup.objects.filter(user=user)
+    if start_date is not None:
+        rollups = rollups.filter(date__gte=start_date)
+    if end_date is not None:
+        rollups = rollups.filter(date__lte=end_date)
+    totals = rollups.aggregate(
+        income=Coalesce(Sum('amount', filter=Q(type='income')), Value(Decimal('0')), output_field=DecimalField()),
+        expenses=Coalesce(Sum('amount', filter=Q(type='expense')), Value(Decimal('0')), output_field=DecimalField()),
+    )
+    return totals['income'], totals['expenses']
+
+def get_category_breakdown(user, start_date=None, end_date=None, transaction_type=None,
+                           by_subcategory=False, top=None, other_label='Other'):
+    """
+    Get the totals of a user per category (or per category and subcategory)
+    between two dates with a single grouped query over the daily rollups.
+
+    Args:
+        user: The user to aggregate transactions for
+        start_date: The first date of the range, inclusive (date or None for no limit)
+        end_date: The last date of the range, inclusive (date or None for no limit)
+        transaction_type: 'income' or 'expense', or None for both
+        by_subcategory: Group by subcategory within each category as well
+        top: Keep only the largest top groups and add up the rest in one
+            group named other_label
+
+    Returns:
+        List of dictionaries with 'category_id', 'category' (both None for
+        uncategorized transactions, and for the other group), 'amount' and
+        'count', plus 'subcategory_id' and 'subcategory' when grouping by
+        subcategory, largest amount first
+    """
+    rollups = DailyRollup.objects.filter(user=user)
+    if start_date is not None:
+        rollups = rollups.filter(date__gte=start_date)
+    if end_date is not None:
+        rollups = rollups.filter(date__lte=end_date)
+    if transaction_type is not None:
+        rollups = rollups.filter(type=transaction_type)
+
+    fields = {'category_id': 'category_id', 'category': 'category__name'}
+    if by_subcategory:
+        fields.update(subcategory_id='subcategory_id', subcategory='subcategory__name')
+    rows = rollups.values(*fields.values()).annotate(
+        total=Sum('amount'),
+        transactions=Sum('count'),
+    ).order_by('-total', 'category__name', 'category_id')
+
+    breakdown = [
+        {**{key: row[field] for key, field in fields.items()}, 'amount': row['total'], 'count': row['transactions']}
+        for row in rows
+    ]
+
+    if top is not None and len(breakdown) > top:
+        rest = breakdown[top:]
+        breakdown = breakdown[:top]
+        breakdown.append({
+            **{key: None for key in fields},
+            'category': other_label,
+            'amount': sum(group['amount'] for group in rest),
+            'count': sum(group['count'] for group in rest),
+        })
+
+    return breakdown
+
+def get_budget_warnings(user, start_date, end_date, thresholds=None):
+    """
+    Get the budgets of a user overlapping a date range whose spend reached a
+    warning threshold.
+
+    Every budget's spend is taken from its own scope (its subcategory or
+    category, its account and its own start and end dates) by
+    Budget.objects.with_spent(), so all budgets are checked with one query.
+
+    Args:
+        user: The user whose budgets to check
+        start_date: The first date of the range, inclusive
+        end_date: The last date of the range, inclusive
+        thresholds: Percentages of the budget amount that trigger a warning,
+            settings.BUDGET_WARNING_THRESHOLDS by default
+
+    Returns:
+        List of dictionaries with 'budget_id', 'category' (including the
+        subcategory for subcategory budgets), 'account', 'budget', 'spent',
+        'percentage' and 'threshold' (the highest threshold reached), most
+        used budget first
+    """
+    thresholds = sorted(settings.BUDGET_WARNING_THRESHOLDS if thresholds is None else thresholds)
+    if not thresholds:
+        return []
+
+    budgets = Budget.objects.with_spent().filter(
+        user=user,
+        start_date__lte=end_date,
+        end_date__gte=start_date,
+        percentage_spent__gte=thresholds[0],
+    ).values(
+        'id', 'amount', 'spent_amount', 'percentage_spent',
+        'category__name', 'subcategory__name', 'subcategory__parent_category__name', 'account__name',
+    ).order_by('-percentage_spent', 'end_date', 'id')
+
+    warnings = []
+    for budget in budgets:
+        if budget['subcategory__name'] is not None:
+            name = f"{budget['subcategory__parent_category__name']} - {budget['subcategory__name']}"
+        else:
+            name = budget['category__name']
+        warnings.append({
+            'budget_id': budget['id'],
+            'category': name,
+            'account': budget['account__name'],
+            'budget': budget['amount'],
+            'spent': budget['spent_amount'],
+            'percentage': round(budget['percentage_spent']),
+            'threshold': max(threshold for threshold in thresholds if budget['percentage_spent'] >= threshold),
+        })
+    return warnings
+
+def get_cash_flow_series(user, start_date, end_date, interval='day', label_format='%d'):
+    """
+    Get chart-ready income and expense series for a date range.
+    Returns a dictionary with 'labels', 'income' and 'expenses' lists.
+    """
+    buckets = get_cash_flow_buckets(user, start_date, end_date, interval)
+    return {
+        'labels': [bucket['period'].strftime(label_format) for bucket in buckets],
+        'income': [float(bucket['income']) for bucket in buckets],
+        'expenses': [float(bucket['expenses']) for bucket in buckets],
+    }
+
+def get_schedule_anchor(scheduled):
+    """
+    Return the first occurrence of the series a scheduled transaction belongs
+    to, and the (0-based) index of the scheduled transaction in that series.
+
+    Every occurrence after the first points at the first one with
+    parent_transaction, so its date can be computed from the anchor with
+    get_occurrence_date() instead of from the occurrence before it, which
+    would lose the 31st after the first short month.
+    """
+    # Months are counted in local time, where the day of the month is the user's
+    if scheduled.parent_transaction_id is None:
+        return timezone.localtime(scheduled.date_scheduled), 0
+    return timezone.localtime(scheduled.parent_transaction.date_scheduled), scheduled.occurrence_number - 1
+
+def process_scheduled_transaction(scheduled):
+    """
+    Post a single due scheduled transaction to its account.
+
+    Marks the scheduled transaction as completed and returns the unsaved next
+    occurrence if it repeats. Raises InsufficientFundsError when the account
+    can't cover it.
+    """
+    # Raises InsufficientFundsError before anything is written
+    apply_balance_change(scheduled.account, scheduled.transaction_type, scheduled.amount, check_funds=True)
+    
+    Transaction.objects.create(
+        user_id=scheduled.user_id,
+        title=scheduled.name,
+        amount=scheduled.amount,
+        date=scheduled.date_scheduled.date(),
+        time=scheduled.date_scheduled.time(),
+        type=scheduled.transaction_type,
+        category_id=scheduled.category_id,
+        subcategory_id=scheduled.subcategory_id,
+        transaction_account_id=scheduled.account_id,
+        notes=f"Scheduled transaction: {scheduled.name} (ID: {scheduled.id})"
+    )
+    
+    scheduled.status = 'completed'
+    scheduled.save(update_fields=['status'])
+    
+    # Repeating transactions continue with one occurrence less (0 repeats forever)
+    if scheduled.repeats == 1 or scheduled.repeat_type == 'once':
+        return None
+    anchor, index = get_schedule_anchor(scheduled)
+    next_transaction = ScheduledTransaction(
+        user_id=scheduled.user_id,
+        name=scheduled.name,
+        category_id=scheduled.category_id,
+        subcategory_id=scheduled.subcategory_id,
+        transaction_type=scheduled.transaction_type,
+        account_id=scheduled.account_id,
+        amount=scheduled.amount,
+        date_scheduled=get_occurrence_date(anchor, scheduled.repeat_type, index + 1),
+        repeat_type=scheduled.repeat_type,
+        repeats=0 if scheduled.repeats == 0 else scheduled.repeats - 1,
+        note=scheduled.note,
+        status='scheduled',
+        parent_transaction_id=scheduled.parent_transaction_id or scheduled.id,
+        occurrence_number=index + 2,
+    )
+    next_transaction.calculate_next_occurrence()
+    return next_transaction
+
+def process_due_scheduled_transactions(user=None, batch_size=100, now=None):
+    """
+    Process every scheduled transaction that is due, in batches.
+
+    Each batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED so several
+    workers can run side by side without posting the same row twice. Every row
+    is processed in its own savepoint; a row that raises is marked as failed
+    without undoing the rest of the batch. Occurrences that become due while
+    catching up are picked up by the following batches.
+
+    Args:
+        user: Only process this user's transactions (all users when None)
+        batch_size: Number of rows claimed per database transaction
+        now: Process rows scheduled at or before this time (defaults to now)
+
+    Returns:
+        The number of scheduled transactions processed
+    """
+    now = now or timezone.now()
+    processed = 0
+    
+    while True:
+        with db_transaction.atomic():
+            due_transactions = ScheduledTransaction.objects.select_for_update(
+                skip_locked=True, of=('self',)
+            ).filter(
+                status='scheduled',
+                date_scheduled__lte=now
+            )
+            if user is not None:
+                due_transactions = due_transactions.filter(user=user)
+            batch = list(due_transactions.select_related('account', 'parent_transaction').order_by('date_scheduled', 'id')[:batch_size])
+            if not batch:
+                return processed
+            
+            next_transactions = []
+            for scheduled in batch:
+                try:
+                    with db_transaction.atomic():
+                        next_transaction = process_scheduled_transaction(scheduled)
+                except InsufficientFundsError:
+                    ScheduledTransaction.objects.filter(id=scheduled.id).update(status='failed')
+                    invalidate_user_cache(scheduled.user_id)
+                    continue
+                except Exception as e:
+                    ScheduledTransaction.objects.filter(id=scheduled.id).update(status='failed')
+                    invalidate_user_cache(scheduled.user_id)
+                    logger.error("Failed to process scheduled transaction %s: %s", scheduled.id, e)
+                    continue
+                if next_transaction is not None:
+                    next_transactions.append(next_transaction)
+            
+            # Skips model validation, which rejects dates that are already in the past
+            ScheduledTransaction.objects.bulk_create(next_transactions)
+        
+        processed += len(batch)
+
+def encode_transaction_cursor(row):
+    """Encode the (date, time, id) position of a transaction row as an opaque cursor."""
+    position = f"{row['date'].isoformat()}|{row['time'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_transaction_cursor(cursor):
+    """
+    Decode a cursor made by encode_transaction_cursor.
+    
+    Raises ValueError when the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_str, time_str, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return date.fromisoformat(date_str), time.fromisoformat(time_str), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def paginate_transactions(transactions, cursor=None, limit=TRANSACTION_PAGE_SIZE):
+    """
+    Fetch one page of transactions, newest first, using keyset pagination.
+    
+    Rows are ordered by (date, time, id) and the page starts right after the
+    cursor position, so every page costs the same no matter how deep it is.
+    
+    Args:
+        transactions: Filtered Transaction queryset
+        cursor: Cursor returned with the previous page (None for the first page)
+        limit: Maximum number of rows in the page
+    
+    Returns:
+        A (rows, next_cursor) tuple where rows are dicts of TRANSACTION_LIST_FIELDS
+        and next_cursor is None on the last page
+    """
+    if cursor:
+        cursor_date, cursor_time, cursor_id = decode_transaction_cursor(cursor)
+        transactions = transactions.filter(
+            Q(date__lt=cursor_date) |
+            Q(date=cursor_date, time__lt=cursor_time) |
+            Q(date=cursor_date, time=cursor_time, id__lt=cursor_id)
+        )
+    
+    # Fetch one extra row to know whether there is another page
+    rows = list(transactions.order_by('-date', '-time', '-id').values(*TRANSACTION_LIST_FIELDS)[:limit + 1])
+    next_cursor = encode_transaction_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def serialize_transaction_row(row):
+    """Turn a row from paginate_transactions into the transactions API format."""
+    category_icon = row['category__icon'] if row['category_id'] else 'bi bi-tag'
+    subcategory_icon = (row['subcategory__icon'] or category_icon) if row['subcategory_id'] else None
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'amount': float(row['amount']),
+        'date': row['date'].isoformat(),
+        'time': row['time'].strftime('%H:%M') if row['time'] else None,
+        'type': row['type'],
+        'category': row['category_id'],
+        'subcategory': row['subcategory_id'],
+        'transaction_account': row['transaction_account_id'],
+        'category_name': row['category__name'],
+        'category_icon': category_icon,
+        'subcategory_name': row['subcategory__name'],
+        'subcategory_icon': subcategory_icon,
+        'account_name': row['transaction_account__name'],
+        # Use subcategory info if it exists, otherwise use category info
+        'display_name': row['subcategory__name'] or row['category__name'] or 'Uncategorized',
+        'display_icon': subcategory_icon or category_icon or 'bi bi-tag',
+        'notes': row['notes'] or '',
+    }
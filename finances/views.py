@@ -2,24 +2,35 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum, Q, F, ExpressionWrapper, DecimalField, Avg
-from django.http import HttpResponse, JsonResponse
+from django.http import JsonResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login, logout, authenticate
 from datetime import timedelta, datetime, date
 import calendar
-import csv
+from collections import defaultdict
+import hashlib
 import json
 import logging
-from .models import Transaction, Category, Budget, Account, DebitAccount, CreditAccount, Wallet, SubCategory, Debt, ScheduledTransaction, DashboardPreference
+from .models import Transaction, DailyRollup, Category, Budget, Account, DebitAccount, CreditAccount, Wallet, SubCategory, Debt, ScheduledTransaction, DashboardPreference
 from .forms import ExportForm, ImportForm, TransactionForm, CategoryForm, BudgetForm, DateRangeForm, DebitAccountForm, CreditAccountForm, WalletForm, SubCategoryForm, DebtForm, ScheduledTransactionForm
 from django import forms
 from django.contrib.auth.models import User
 from django.db import models
+from django.db import transaction as db_transaction
 from decimal import Decimal
-import openpyxl
 import decimal
-from .utils import get_transactions_with_scheduled, generate_scheduled_transactions
+from openpyxl.styles import Font, PatternFill
+from .cache import cached_aggregate, invalidate_user_cache, get_cache_stats
+from .defaults import provision_default_categories
+from .metrics import get_request_metrics
+from .projections import get_balance_projection, predict_schedule_failures, PROJECTION_INTERVALS
+from .exporter import TRANSACTION_EXPORT_FIELDS, iter_csv, iter_json, iter_values, streaming_attachment, write_xlsx, xlsx_attachment
+from .importer import EXPORT_COLUMNS, TransactionImporter, iter_file_rows
+from .utils import generate_scheduled_transactions, get_cash_flow_series, get_period_totals, get_category_breakdown, get_budget_warnings, add_months, process_due_scheduled_transactions, process_scheduled_transaction, apply_balance_change, InsufficientFundsError, paginate_transactions, serialize_transaction_row, TRANSACTION_PAGE_SIZE, MAX_TRANSACTION_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
 
 def home(request):
     return render(request, 'index.html')
@@ -65,38 +76,9 @@ def signup(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            
-            # Create default income categories
-            income_categories = [
-                {'name': 'Salary/Wages', 'icon': 'bi-cash-coin', 'type': 'income'},
-                {'name': 'Business Income', 'icon': 'bi-shop', 'type': 'income'},
-                {'name': 'Investments', 'icon': 'bi-graph-up-arrow', 'type': 'income'},
-                {'name': 'Other Income', 'icon': 'bi-wallet2', 'type': 'income'},
-            ]
-            
-            # Create default expense categories
-            expense_categories = [
-                {'name': 'Housing', 'icon': 'bi-house', 'type': 'expense'},
-                {'name': 'Utilities', 'icon': 'bi-lightning', 'type': 'expense'},
-                {'name': 'Food', 'icon': 'bi-cup-hot', 'type': 'expense'},
-                {'name': 'Transportation', 'icon': 'bi-truck', 'type': 'expense'},
-                {'name': 'Insurance', 'icon': 'bi-shield', 'type': 'expense'},
-                {'name': 'Entertainment', 'icon': 'bi-music-note-beamed', 'type': 'expense'},
-                {'name': 'Healthcare', 'icon': 'bi-heart-pulse', 'type': 'expense'},
-                {'name': 'Debt Payments', 'icon': 'bi-credit-card', 'type': 'expense'},
-                {'name': 'Savings/Investments', 'icon': 'bi-piggy-bank', 'type': 'expense'},
-                {'name': 'Miscellaneous', 'icon': 'bi-three-dots', 'type': 'expense'},
-            ]
-            
-            # Create all categories
-            for category_data in income_categories + expense_categories:
-                Category.objects.create(
-                    name=category_data['name'],
-                    icon=category_data['icon'],
-                    type=category_data['type'],
-                    user=user
-                )
+            with db_transaction.atomic():
+                user = form.save()
+                provision_default_categories([user])
             
             login(request, user)
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
@@ -444,70 +426,58 @@ def delete_debt(request, pk):
     
     return render(request, 'finances/confirm_delete_debt.html', {'debt': debt})
 
+@login_required
 def update_payment(request, pk):
-    debt = get_object_or_404(Debt, pk=pk)
+    debt = get_object_or_404(Debt, pk=pk, user=request.user)
     
     if request.method == 'POST':
         paid_amount = Decimal(request.POST.get('paid_amount'))
         account_id = request.POST.get('account')
         
-        # account = None
-        account3 = Wallet.objects.filter(id=account_id).first()
-        account1 = DebitAccount.objects.filter(id=account_id).first()
-        account2 = CreditAccount.objects.filter(id=account_id).first()
+        account = Account.objects.filter(id=account_id, user=request.user).first()
         
         if paid_amount > debt.residual_amount:
             messages.error(request, "The payment amount exceeds the residual amount.")
             return redirect('debts_list')        
         
-        if account1:
-            if (account1.balance - paid_amount) < account1.maintaining_balance:
-                messages.error(request, "Balance after deduction is below the maintaining balance.")
-                return redirect('debts_list')
-            # account = account1
-            if debt.debt_type.lower() == 'credit':
-                account1.balance += paid_amount
-            else:
-                account1.balance -= paid_amount
-            account1.save()
-        elif account2:
-            if debt.debt_type.lower() == 'credit':
-                messages.error(request, "Credit accounts cannot accept payments for credit-type debts.")
-                return redirect('debts_list')
-            if (account2.current_usage + paid_amount) > account2.credit_limit:
-                messages.error(request, "Payment exceeds credit limit.")
-                return redirect('debts_list')
-            # account = account2
-            account2.current_usage += paid_amount
-            account2.save()
-        elif account3:
-            if account3.balance < paid_amount:
-                messages.error(request, "Insufficient balance in wallet.")
-                return redirect('debts_list')
-            # account = account3
-            if debt.debt_type.lower() == 'credit':
-                account3.balance += paid_amount
-            else:
-                account3.balance -= paid_amount
-            account3.save()        
-        else:
+        if account is None:
             messages.error(request, "Account not found.")
             return redirect('debts_list')
         
-        debt.paid += paid_amount
-        debt.save()
-            
-        Transaction.objects.create(
-            title="Debt Payment",
-            amount=paid_amount,
-            type="expense" if debt.debt_type == 'debt' else "income",
-            category=None,
-            subcategory=None,
-            user=request.user,
-            notes=f"Payment for debt with {debt.person}",
-            # account=account
-        )
-
+        account_type = account.get_account_type()
+        if account_type == 'credit' and debt.debt_type.lower() == 'credit':
+            messages.error(request, "Credit accounts cannot accept payments for credit-type debts.")
+            return redirect('debts_list')
+        
+        # Money comes in for credit-type debts and goes out for everything else
+        payment_type = 'income' if debt.debt_type.lower() == 'credit' else 'expense'
+        
+        try:
+            with db_transaction.atomic():
+                # Only pay what is still owed, even with concurrent payments
+                if not Debt.objects.filter(pk=debt.pk, amount__gte=F('paid') + paid_amount).update(paid=F('paid') + paid_amount):
+                    messages.error(request, "The payment amount exceeds the residual amount.")
+                    return redirect('debts_list')
+                apply_balance_change(account, payment_type, paid_amount, check_funds=True)
+                
+                Transaction.objects.create(
+                    title="Debt Payment",
+                    amount=paid_amount,
+                    type="expense" if debt.debt_type == 'debt' else "income",
+                    category=None,
+                    subcategory=None,
+                    user=request.user,
+                    notes=f"Payment for debt with {debt.person}",
+                    # account=account
+                )
+        except InsufficientFundsError as e:
+            messages.error(request, {
+                'debit': "Balance after deduction is below the maintaining balance.",
+                'credit': "Payment exceeds credit limit.",
+                'wallet': "Insufficient balance in wallet.",
+            }.get(e.account_type, str(e)))
+            return redirect('debts_list')
+        
         messages.success(request, "Payment successfully updated!")
         return redirect('debts_list')
     
@@ -620,128 +590,10 @@ def delete_account(request, account_id):
     account.delete()
     return redirect('accounts_list')
 
-def process_scheduled_transactions(user):
-    now = timezone.now()
-    
-    due_transactions = ScheduledTransaction.objects.filter(
-        user=user,
-        date_scheduled__lte=now,
-        status='scheduled'
-    )
-    
-    for scheduled in due_transactions:
-        try:
-            # Validate account balance before processing
-            account = scheduled.account
-            amount_decimal = Decimal(str(scheduled.amount))
-            
-            if hasattr(account, 'debitaccount'):
-                debit = account.debitaccount
-                if scheduled.transaction_type == 'expense' and debit.balance - amount_decimal < (debit.maintaining_balance or 0):
-                    scheduled.status = 'failed'
-                    scheduled.save(update_fields=['status'])
-                    continue
-            elif hasattr(account, 'creditaccount'):
-                credit = account.creditaccount
-                if scheduled.transaction_type == 'expense' and credit.current_usage + amount_decimal > credit.credit_limit:
-                    scheduled.status = 'failed'
-                    scheduled.save(update_fields=['status'])
-                    continue
-            elif hasattr(account, 'wallet'):
-                wallet = account.wallet
-                if scheduled.transaction_type == 'expense' and wallet.balance < amount_decimal:
-                    scheduled.status = 'failed'
-                    scheduled.save(update_fields=['status'])
-                    continue
-            
-            # Create the transaction
-            transaction = Transaction.objects.create(
-                user=user,
-                title=scheduled.name,
-                amount=scheduled.amount,
-                date=scheduled.date_scheduled.date(),
-                time=scheduled.date_scheduled.time(),
-                type=scheduled.transaction_type,
-                category=scheduled.category,
-                subcategory=scheduled.subcategory,
-                transaction_account=scheduled.account,
-                notes=f"Scheduled transaction: {scheduled.name} (ID: {scheduled.id})"
-            )
-            
-            # Update account balance/usage
-            if hasattr(account, 'debitaccount'):
-                debit = account.debitaccount
-                if scheduled.transaction_type == 'expense':
-                    debit.balance -= amount_decimal
-                else:  # income
-                    debit.balance += amount_decimal
-                debit.save()
-            elif hasattr(account, 'creditaccount'):
-                credit = account.creditaccount
-                if scheduled.transaction_type == 'expense':
-                    credit.current_usage += amount_decimal
-                else:  # income (rare)
-                    credit.current_usage -= amount_decimal
-                    if credit.current_usage < 0:
-                        credit.current_usage = 0
-                credit.save()
-            elif hasattr(account, 'wallet'):
-                wallet = account.wallet
-                if scheduled.transaction_type == 'expense':
-                    wallet.balance -= amount_decimal
-                else:  # income
-                    wallet.balance += amount_decimal
-                wallet.save()
-            
-            # Update the scheduled transaction status to completed
-            scheduled.status = 'completed'
-            scheduled.save(update_fields=['status'])
-            
-            # If this is a recurring transaction, create the next occurrence
-            if scheduled.repeats != 1:
-                if scheduled.repeats == 0:
-                    next_repeats = 0
-                elif scheduled.repeats > 1:
-                    next_repeats = scheduled.repeats - 1
-                else:
-                    next_repeats = None
-                if next_repeats is not None:
-                    next_date = scheduled.date_scheduled
-                    if scheduled.repeat_type == 'daily':
-                        next_date += timedelta(days=1)
-                    elif scheduled.repeat_type == 'weekly':
-                        next_date += timedelta(weeks=1)
-                    elif scheduled.repeat_type == 'monthly':
-                        if next_date.month == 12:
-                            next_date = next_date.replace(year=next_date.year + 1, month=1)
-                        else:
-                            next_date = next_date.replace(month=next_date.month + 1)
-                    elif scheduled.repeat_type == 'yearly':
-                        next_date = next_date.replace(year=next_date.year + 1)
-                    ScheduledTransaction.objects.create(
-                        user=user,
-                        name=scheduled.name,
-                        category=scheduled.category,
-                        subcategory=scheduled.subcategory,
-                        transaction_type=scheduled.transaction_type,
-                        account=scheduled.account,
-                        amount=scheduled.amount,
-                        date_scheduled=next_date,
-                        repeat_type=scheduled.repeat_type,
-                        repeats=next_repeats,
-                        note=scheduled.note,
-                        status='scheduled'
-                    )
-        except Exception as e:
-            # If transaction creation fails, mark as failed using direct SQL update
-            ScheduledTransaction.objects.filter(id=scheduled.id).update(status='failed')
-            # Log the error
-            logging.error(f"Failed to process scheduled transaction {scheduled.id}: {str(e)}")
-
 @login_required
 def dashboard(request):
     # Get user's active budgets
-    budgets = Budget.objects.filter(
+    budgets = Budget.objects.with_spent().filter(
         user=request.user,
         end_date__gte=timezone.now().date()
     ).select_related('category', 'subcategory').order_by('end_date')
@@ -750,35 +602,19 @@ def dashboard(request):
     weekly_budgets = []
     monthly_budgets = []
     for budget in budgets:
-        budget.spent = budget.get_spent_amount()
-        budget.percentage_used = (budget.spent / budget.amount * 100) if budget.amount > 0 else 0
         if budget.duration == '1 week':
             weekly_budgets.append(budget)
         elif budget.duration == '1 month':
             monthly_budgets.append(budget)
 
-    process_scheduled_transactions(request.user)
     dashboard_preference, created = DashboardPreference.objects.get_or_create(user=request.user)
 
     current_month = timezone.now().date().replace(day=1)
     prev_month = (current_month - timedelta(days=1)).replace(day=1)
     next_month = (current_month + timedelta(days=32)).replace(day=1)
 
-    # Account summaries
-    accounts_summary = calculate_account_summaries(request.user)
-    total_balance = Decimal('0.00')
-    for account_type in accounts_summary.values():
-        total_balance += account_type['balance']
-
-    # Month summaries
-    current_month_income, current_month_expenses = get_month_summary(request.user, current_month)
-    current_month_balance = current_month_income - current_month_expenses
-
-    prev_month_income, prev_month_expenses = get_month_summary(request.user, prev_month)
-    prev_month_balance = prev_month_income - prev_month_expenses
-
     # Budget warnings
-    budget_warnings = get_budget_warnings(request.user, current_month, current_month.replace(day=1, month=current_month.month+1) - timedelta(days=1))
+    budget_warnings = get_budget_warnings(request.user, current_month, next_month - timedelta(days=1))
 
     # Recent transactions
     recent_transactions = Transaction.objects.filter(user=request.user).order_by('-date', '-time')[:5]
@@ -796,122 +632,63 @@ def dashboard(request):
         paid=False
     ).order_by('date_payback')[:5]  # Limit to 5 unpaid debts
     
-    # Get last 7 days data for balance chart
     today = timezone.now().date()
-    week_ago = today - timezone.timedelta(days=7)
-    
-    last_7_days_data = {
-        'labels': [],
-        'income': [],
-        'expenses': []
-    }
     
-    # Generate data for each day
-    for i in range(7):
-        current_date = week_ago + timezone.timedelta(days=i+1)
-        last_7_days_data['labels'].append(current_date.strftime('%a'))
-        
-        # Get transactions for this day
-        day_transactions = Transaction.objects.filter(user=request.user, date=current_date)
-        
-        # Calculate income and expenses for this day
-        day_income = sum(t.amount for t in day_transactions if t.type == 'income')
-        day_expenses = sum(t.amount for t in day_transactions if t.type == 'expense')
-        
-        last_7_days_data['income'].append(float(day_income))
-        last_7_days_data['expenses'].append(float(day_expenses))
+    def build_dashboard_aggregates():
+        # Account summaries
+        accounts_summary = calculate_account_summaries(request.user)
+        total_balance = Decimal('0.00')
+        for account_type in accounts_summary.values():
+            total_balance += account_type['balance']
+
+        # Month summaries
+        current_month_income, current_month_expenses = get_month_summary(request.user, current_month)
+        current_month_balance = current_month_income - current_month_expenses
+
+        prev_month_income, prev_month_expenses = get_month_summary(request.user, prev_month)
+        prev_month_balance = prev_month_income - prev_month_expenses
+
+        # Get last 7 days data for balance chart
+        week_ago = today - timezone.timedelta(days=7)
     
-    # Get future projection data (next 30 days)
-    future_balance_data = {
-        'labels': [],
-        'values': []
-    }
+        last_7_days_data = get_cash_flow_series(
+            request.user, week_ago + timezone.timedelta(days=1), today, 'day', '%a'
+        )
     
-    # Calculate starting balance
-    current_balance = Decimal('0')
-    for account in Account.objects.filter(user=request.user):
-        if hasattr(account, 'debitaccount'):
-            current_balance += account.debitaccount.balance
-        elif hasattr(account, 'wallet'):
-            current_balance += account.wallet.balance
-        elif hasattr(account, 'creditaccount'):
-            current_balance -= account.creditaccount.current_usage
-    
-    # Get scheduled transactions for next 30 days
-    end_date = today + timezone.timedelta(days=30)
-    scheduled_txns = ScheduledTransaction.objects.filter(
-        user=request.user,
-        status='scheduled',
-        date_scheduled__gte=today,
-        date_scheduled__lte=end_date
-    ).order_by('date_scheduled')
-    
-    # Prepare projection
-    projection_days = 30
-    daily_amounts = [0] * projection_days
-    
-    # Add scheduled transactions to daily amounts
-    for txn in scheduled_txns:
-        day_index = (txn.date_scheduled.date() - today).days
-        if 0 <= day_index < projection_days:
-            if txn.transaction_type == 'income':
-                daily_amounts[day_index] += float(txn.amount)
-            else:
-                daily_amounts[day_index] -= float(txn.amount)
+        # Projected total balance for the next 30 days
+        projection = get_balance_projection(request.user, today, today + timezone.timedelta(days=29), 'day')
+        future_balance_data = {
+            'labels': [day.strftime('%d %b') for day in projection['periods']],
+            'values': projection['total'],
+        }
     
-    # Generate labels and calculate running balance
-    balance = float(current_balance)
-    for i in range(projection_days):
-        future_date = today + timezone.timedelta(days=i)
-        future_balance_data['labels'].append(future_date.strftime('%d %b'))
+        # Get category data for pie chart (last 30 days): the top 5 expense categories and the rest
+        month_ago = today - timezone.timedelta(days=30)
+        categories_data = [
+            {'category': row['category'] or 'Uncategorized', 'amount': float(row['amount'])}
+            for row in get_category_breakdown(request.user, month_ago, transaction_type='expense', top=5)
+        ]
         
-        balance += daily_amounts[i]
-        future_balance_data['values'].append(balance)
-    
-    # Get category data for pie chart (last 30 days)
-    month_ago = today - timezone.timedelta(days=30)
-    categories_data = []
-    
-    # Get expense transactions for the last 30 days
-    expense_transactions = Transaction.objects.filter(
-        user=request.user,
-        type='expense',
-        date__gte=month_ago
-    ).select_related('category')
-    
-    # Group transactions by category
-    category_totals = {}
-    for transaction in expense_transactions:
-        category_name = transaction.category.name if transaction.category else 'Uncategorized'
-        if category_name in category_totals:
-            category_totals[category_name] += float(transaction.amount)
-        else:
-            category_totals[category_name] = float(transaction.amount)
-    
-    # Convert to list format for the chart
-    for category, amount in category_totals.items():
-        categories_data.append({
-            'category': category,
-            'amount': amount
-        })
-    
-    # Sort by amount (descending)
-    categories_data.sort(key=lambda x: x['amount'], reverse=True)
+        return {
+            'accounts_summary': accounts_summary,
+            'total_balance': total_balance,
+            'current_month_income': current_month_income,
+            'current_month_expenses': current_month_expenses,
+            'current_month_balance': current_month_balance,
+            'prev_month_income': prev_month_income,
+            'prev_month_expenses': prev_month_expenses,
+            'prev_month_balance': prev_month_balance,
+            'last_7_days_data': json.dumps(last_7_days_data),
+            'future_balance_data': json.dumps(future_balance_data),
+            'categories_data': json.dumps(categories_data),
+        }
     
-    # Limit to top 5 categories
-    categories_data = categories_data[:5]
+    aggregates = cached_aggregate(request.user, 'dashboard', today, build_dashboard_aggregates)
 
     context = {
-        'accounts_summary': accounts_summary,
-        'total_balance': total_balance,
+        **aggregates,
         'current_month': current_month,
-        'current_month_income': current_month_income,
-        'current_month_expenses': current_month_expenses,
-        'current_month_balance': current_month_balance,
         'prev_month': prev_month,
-        'prev_month_income': prev_month_income,
-        'prev_month_expenses': prev_month_expenses,
-        'prev_month_balance': prev_month_balance,
         'budget_warnings': budget_warnings,
         'recent_transactions': recent_transactions,
         'dashboard_preference': dashboard_preference,
@@ -920,9 +697,6 @@ def dashboard(request):
         'monthly_budgets': monthly_budgets,
         'upcoming_scheduled_transactions': upcoming_scheduled_transactions,
         'debts': debts,
-        'last_7_days_data': json.dumps(last_7_days_data),
-        'future_balance_data': json.dumps(future_balance_data),
-        'categories_data': json.dumps(categories_data),
     }
     
     return render(request, 'finances/dashboard.html', context)
@@ -1022,39 +796,22 @@ def monthly_summary(request):
         date__lte=end_date
     ).order_by('-date')
     
-    # Calculate totals
-    income = Transaction.objects.filter(
-        user=request.user,
-        type='income',
-        date__gte=start_date,
-        date__lte=end_date
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    def build_summary():
+        # Calculate totals
+        income, expenses = get_period_totals(request.user, start_date, end_date)
     
-    expenses = Transaction.objects.filter(
-        user=request.user,
-        type='expense',
-        date__gte=start_date,
-        date__lte=end_date
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    # Get expenses by category for pie chart
-    categories = Category.objects.filter(user=request.user)
-    expenses_by_category = []
-    
-    for category in categories:
-        amount = Transaction.objects.filter(
-            user=request.user,
-            type='expense',
-            category=category,
-            date__gte=start_date,
-            date__lte=end_date
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        # Get expenses by category for pie chart
+        expenses_by_category = [
+            {'category': row['category'], 'amount': float(row['amount'])}
+            for row in get_category_breakdown(request.user, start_date, end_date, 'expense')
+            if row['category_id'] is not None and row['amount'] > 0
+        ]
         
-        if amount > 0:
-            expenses_by_category.append({
-                'category': category.name,
-                'amount': float(amount)
-            })
+        return income, expenses, expenses_by_category
+    
+    income, expenses, expenses_by_category = cached_aggregate(
+        request.user, 'monthly_summary', (start_date, end_date), build_summary
+    )
     
     context = {
         'form': form,
@@ -1148,23 +905,17 @@ def export_csv(request):
                 date__lte=end_date
             ).order_by('-date')
             
-            # Create CSV response
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = f'attachment; filename="transactions_{start_date}_{end_date}.csv"'
-            
-            writer = csv.writer(response)
-            writer.writerow(['Title', 'Amount', 'Date', 'Type', 'Category', 'Notes'])
-            
-            for transaction in transactions:
-                category_name = transaction.category.name if transaction.category else 'Uncategorized'
-                writer.writerow([
-                    transaction.title,
-                    transaction.amount,
-                    transaction.date,
-                    transaction.type,
-                    category_name,
-                    transaction.notes or ''
-                ])
+            rows = (
+                (title, amount, date, transaction_type, category_name or 'Uncategorized', notes or '')
+                for title, amount, date, transaction_type, category_name, notes in iter_values(
+                    transactions, ['title', 'amount', 'date', 'type', 'category__name', 'notes']
+                )
+            )
+            response = streaming_attachment(
+                iter_csv(['Title', 'Amount', 'Date', 'Type', 'Category', 'Notes'], rows),
+                'csv',
+                f'transactions_{start_date}_{end_date}.csv',
+            )
             
             return response
     else:
@@ -1181,7 +932,7 @@ def manage_budget(request):
     
     today = timezone.now().date()
     # Get all active budgets (those that include today's date)
-    budgets = Budget.objects.select_related('subcategory', 'category').filter(
+    budgets = Budget.objects.with_spent().select_related('subcategory__parent_category', 'category', 'account').filter(
         user=request.user,
         start_date__lte=today,
         end_date__gte=today
@@ -1203,8 +954,8 @@ def manage_budget(request):
             'id': budget.id,
             'account': budget.account,
             'amount': budget.amount,
-            'spent': budget.get_spent_amount(),
-            'remaining': budget.get_remaining_amount(),
+            'spent': budget.spent_amount,
+            'remaining': budget.remaining_amount,
             'percentage_used': budget.get_percentage_spent(),
             'duration': budget.duration,
             'start_date': budget.start_date,
@@ -1265,6 +1016,7 @@ def update_budget(request):
             budget.end_date = next_month - timedelta(days=1)
 
         budget.save()
+        budget = Budget.objects.with_spent().select_related('subcategory').get(pk=budget.pk)
 
         # Return the updated budget data as JSON
         updated_budget = {
@@ -1280,18 +1032,15 @@ def update_budget(request):
 
     return JsonResponse({'success': False})
 
+@login_required
 def get_budgets(request):
-    budgets = Budget.objects.all().values(
-        'subcategory', 'amount', 'spent', 'start_date', 'end_date', 'duration'
+    budgets = Budget.objects.with_spent().filter(user=request.user).values(
+        'subcategory', 'amount', 'start_date', 'end_date', 'duration',
+        spent=F('spent_amount'),
+        remaining=F('remaining_amount')
     )
     
-    # Calculate 'remaining' dynamically for each budget
-    budget_list = []
-    for budget in budgets:
-        budget['remaining'] = budget['amount'] - budget['spent']
-        budget_list.append(budget)
-    
-    return JsonResponse(budget_list, safe=False)
+    return JsonResponse(list(budgets), safe=False)
 
 def custom_logout(request):
     logout(request)
@@ -1406,62 +1155,62 @@ def custom_logout(request):
 
 @login_required
 def api_categories(request):
-    """API endpoint to get categories"""
+    """
+    API endpoint to get the category tree of the user.
+
+    The response carries an ETag, so clients revalidating with If-None-Match
+    get a 304 while their categories haven't changed.
+    """
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
-    logger = logging.getLogger(__name__)
-    
-    # Get all categories for the user, ordered by the order field
-    categories = Category.objects.filter(user=request.user).order_by('order', 'name')
-    logger.info(f"User {request.user.username} has {categories.count()} categories")
-    
-    income_categories = []
-    expense_categories = []
-    
-    for category in categories:
-        try:
-            # Get subcategories for each category with explicit query to ensure they're loaded
-            subcategories = list(SubCategory.objects.filter(parent_category=category).values('id', 'name', 'icon'))
-            logger.info(f"Category {category.name} has {len(subcategories)} subcategories")
-            
-            category_data = {
-                'id': category.id,
-                'name': category.name,
-                'icon': category.icon,
-                'type': category.type,  # Include type in the response
-                'order': category.order,  # Include order in the response
-                'subcategories': subcategories
-            }
-            
-            # Classify based on the type field
-            if category.type == 'income':
-                income_categories.append(category_data)
-            else:
-                expense_categories.append(category_data)
-                
-            logger.info(f"Categorized {category.name} as {category.type}")
-        except Exception as e:
-            # Log the error but continue with other categories
-            logger.error(f"Error processing category {category.name}: {str(e)}")
-            continue
-    
-    # Get list of Bootstrap icons
-    available_icons = get_available_icons()
-    
-    response_data = {
-        'income': income_categories,
-        'expenses': expense_categories,
-        'availableIcons': available_icons
-    }
+    def build_category_tree():
+        income_categories = []
+        expense_categories = []
+        
+        # One row per subcategory (or one per category without any), in category order
+        rows = Category.objects.filter(user=request.user).values(
+            'id', 'name', 'icon', 'type', 'order',
+            'subcategories__id', 'subcategories__name', 'subcategories__icon',
+        ).order_by('order', 'name', 'id', 'subcategories__id')
+        
+        category_data = None
+        for row in rows:
+            if category_data is None or category_data['id'] != row['id']:
+                category_data = {
+                    'id': row['id'],
+                    'name': row['name'],
+                    'icon': row['icon'],
+                    'type': row['type'],
+                    'order': row['order'],
+                    'subcategories': [],
+                }
+                # Classify based on the type field
+                if row['type'] == 'income':
+                    income_categories.append(category_data)
+                else:
+                    expense_categories.append(category_data)
+            if row['subcategories__id'] is not None:
+                category_data['subcategories'].append({
+                    'id': row['subcategories__id'],
+                    'name': row['subcategories__name'],
+                    'icon': row['subcategories__icon'],
+                })
+        
+        response_data = {
+            'income': income_categories,
+            'expenses': expense_categories,
+            'availableIcons': get_available_icons()
+        }
+        etag = '"%s"' % hashlib.md5(json.dumps(response_data, sort_keys=True).encode()).hexdigest()
+        return response_data, etag
     
-    # Log sample of the response for debugging
-    if income_categories:
-        logger.info(f"Sample income category: {income_categories[0]['name']} with {len(income_categories[0]['subcategories'])} subcategories")
-    if expense_categories:
-        logger.info(f"Sample expense category: {expense_categories[0]['name']} with {len(expense_categories[0]['subcategories'])} subcategories")
+    response_data, etag = cached_aggregate(request.user, 'categories', None, build_category_tree)
     
-    return JsonResponse(response_data)
+    response = get_conditional_response(request, etag=etag) or JsonResponse(response_data)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 def api_add_category(request):
     """API endpoint to add a category"""
@@ -1471,10 +1220,6 @@ def api_add_category(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'POST request required'}, status=400)
     
-    # Debug output to see what's being received
-    print(f"Adding category with POST data: {request.POST}")
-    print(f"Type field value: {request.POST.get('type', 'not provided')}")
-    
     form = CategoryForm(request.POST)
     if form.is_valid():
         category = form.save(commit=False)
@@ -1485,20 +1230,16 @@ def api_add_category(request):
             category_type = request.POST['type']
             if category_type == 'income':
                 category.type = 'income'
-                print("Setting category type to income")
             elif category_type == 'expense':
                 category.type = 'expense'
-                print("Setting category type to expense")
             else:
-                print(f"Unrecognized type value: {category_type}, defaulting to expense")
+                logger.debug("Unrecognized category type %r, defaulting to expense", category_type)
                 category.type = 'expense'
         else:
-            print("No type provided, defaulting to expense")
             category.type = 'expense'
             
         category.save()
-        
-        print(f"Category saved with type: {category.type}")
+        logger.debug("User %s added %s category %s", request.user.pk, category.type, category.pk)
         
         return JsonResponse({
             'success': True,
@@ -1511,7 +1252,7 @@ def api_add_category(request):
             }
         })
     else:
-        print(f"Form validation errors: {form.errors}")
+        logger.debug("Invalid category form: %s", form.errors.get_json_data())
         return JsonResponse({'error': 'Invalid form data', 'errors': form.errors}, status=400)
     
 def api_subcategories(request, category_id):
@@ -1523,10 +1264,6 @@ def api_subcategories(request, category_id):
         category = Category.objects.get(id=category_id, user=request.user)
         subcategories = SubCategory.objects.filter(parent_category=category)
         
-        # Debug info
-        print(f"User {request.user.username} requested subcategories for category {category.name} (ID: {category_id})")
-        print(f"Found {subcategories.count()} subcategories")
-        
         subcategories_data = []
         for subcategory in subcategories:
             subcategories_data.append({
@@ -1534,11 +1271,9 @@ def api_subcategories(request, category_id):
                 'name': subcategory.name,
                 'icon': subcategory.icon
             })
-            print(f"  - Subcategory: {subcategory.name} (ID: {subcategory.id})")
         
         return JsonResponse(subcategories_data, safe=False)
     except Category.DoesNotExist:
-        print(f"Category with ID {category_id} not found for user {request.user.username}")
         return JsonResponse({'error': 'Category not found'}, status=404)
     
 # API endpoint to get a single subcategory details
@@ -1769,7 +1504,13 @@ def get_available_icons():
 
 @login_required
 def api_reorder_categories(request):
-    """API endpoint to update the order of categories"""
+    """
+    API endpoint to update the order of categories.
+
+    Accepts either the complete new order as category_ids, or a single move as
+    {"move": {"category_id": ..., "to_index": ...}}. Only the categories whose
+    position changes are written.
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
@@ -1778,32 +1519,58 @@ def api_reorder_categories(request):
         data = json.loads(request.body)
         category_type = data.get('category_type')
         category_ids = data.get('category_ids', [])
+        move = data.get('move')
         
         # Validate data
-        if not category_type or not category_ids:
+        if not category_type or not (category_ids or move):
             return JsonResponse({'error': 'Missing required data'}, status=400)
         
         if category_type not in ['income', 'expense']:
             return JsonResponse({'error': 'Invalid category type'}, status=400)
         
-        # Check if all category ids belong to the user
-        categories = Category.objects.filter(
-            user=request.user, 
-            id__in=category_ids,
-            type=category_type
-        )
-        
-        # Check if we found all the categories
-        if categories.count() != len(category_ids):
-            return JsonResponse({'error': 'One or more categories not found'}, status=404)
-        
-        # Update the order for each category
-        for index, category_id in enumerate(category_ids):
-            category = categories.get(id=category_id)
-            category.order = index
-            category.save()
+        try:
+            if move:
+                moved_id = int(move['category_id'])
+                to_index = int(move['to_index'])
+            else:
+                category_ids = [int(category_id) for category_id in category_ids]
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({'error': 'Invalid category order'}, status=400)
         
-        return JsonResponse({'success': True})
+        with db_transaction.atomic():
+            # The categories of this type in the order api_categories lists them
+            categories = list(Category.objects.select_for_update().filter(
+                user=request.user,
+                type=category_type
+            ).order_by('order', 'name', 'id').only('id', 'order'))
+            categories_by_id = {category.id: category for category in categories}
+            
+            if move:
+                if moved_id not in categories_by_id:
+                    return JsonResponse({'error': 'One or more categories not found'}, status=404)
+                if not 0 <= to_index < len(categories):
+                    return JsonResponse({'error': 'Invalid category order'}, status=400)
+                category_ids = [category.id for category in categories if category.id != moved_id]
+                category_ids.insert(to_index, moved_id)
+            
+            # Check if all category ids belong to the user
+            elif len(set(category_ids)) != len(category_ids) or not all(category_id in categories_by_id for category_id in category_ids):
+                return JsonResponse({'error': 'One or more categories not found'}, status=404)
+            
+            # Update the order of the categories that moved, in a single query
+            changed = []
+            for index, category_id in enumerate(category_ids):
+                category = categories_by_id[category_id]
+                if category.order != index:
+                    category.order = index
+                    changed.append(category)
+            Category.objects.bulk_update(changed, ['order'])
+        
+        # bulk_update sends no signals
+        if changed:
+            invalidate_user_cache(request.user.pk)
+        
+        return JsonResponse({'success': True, 'updated': len(changed)})
     
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
@@ -1860,19 +1627,7 @@ def transactions(request):
     transactions = transactions_query.order_by('-date')
     
     # Calculate total
-    income = Transaction.objects.filter(
-        user=request.user,
-        type='income',
-        date__gte=start_date,
-        date__lte=end_date
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    expenses = Transaction.objects.filter(
-        user=request.user,
-        type='expense',
-        date__gte=start_date,
-        date__lte=end_date
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    income, expenses = get_period_totals(request.user, start_date, end_date)
     
     total_balance = income - expenses
     
@@ -1905,11 +1660,23 @@ def transactions(request):
 
 @login_required
 def transactions_api(request):
-    """API endpoint for fetching transactions with filters"""
+    """
+    API endpoint for fetching transactions with filters.
+    
+    Transactions are returned newest first, one page at a time. Pass `limit` to
+    set the page size and the `next_cursor` of a response as `cursor` to get the
+    following page. Totals are computed in the database for the whole filtered
+    set and only included with the first page. Use `month=all` to list every
+    month at once.
+    """
     
     # Get parameters from request
     month_param = request.GET.get('month')
-    if month_param and '-' in month_param:
+    all_months = month_param == 'all'
+    if all_months:
+        current_month = None
+        current_year = None
+    elif month_param and '-' in month_param:
         try:
             year, month = map(int, month_param.split('-'))
             current_month = month
@@ -1926,20 +1693,21 @@ def transactions_api(request):
     search_term = request.GET.get('search', '')
     types_param = request.GET.get('types', 'expense,income')
     types = types_param.split(',') if types_param else ['expense', 'income']
+    cursor = request.GET.get('cursor') or None
     
-    # Get start and end date for the selected month
-    start_date = timezone.datetime(current_year, current_month, 1).date()
-    if current_month == 12:
-        end_date = timezone.datetime(current_year + 1, 1, 1).date() - timedelta(days=1)
-    else:
-        end_date = timezone.datetime(current_year, current_month + 1, 1).date() - timedelta(days=1)
+    try:
+        limit = int(request.GET.get('limit', TRANSACTION_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    limit = max(1, min(limit, MAX_TRANSACTION_PAGE_SIZE))
     
-    # Filter transactions and use select_related to fetch category and subcategory in a single query
-    transactions = Transaction.objects.filter(
-        user=request.user,
-        date__gte=start_date,
-        date__lte=end_date
-    ).select_related('category', 'subcategory', 'transaction_account')
+    transactions = Transaction.objects.filter(user=request.user)
+    
+    # Restrict to the selected month
+    if not all_months:
+        start_date = timezone.datetime(current_year, current_month, 1).date()
+        end_date = add_months(start_date, 1) - timedelta(days=1)
+        transactions = transactions.filter(date__gte=start_date, date__lte=end_date)
     
     # Apply type filter if specified
     if types and 'all' not in types:
@@ -1959,100 +1727,52 @@ def transactions_api(request):
             models.Q(notes__icontains=search_term)
         )
     
-    # Order by date (newest first)
-    transactions = transactions.order_by('-date')
-    
-    # Calculate totals
-    income = 0
-    expenses = 0
-    for t in transactions:
-        try:
-            if t.type == 'income':
-                income += float(t.amount)
-            elif t.type == 'expense':
-                expenses += float(t.amount)
-        except (ValueError, decimal.InvalidOperation):
-            # Skip transactions with invalid amount values
-            continue
-    
-    total = income - expenses
-    
-    # Format month name for response
-    month_names = ['January', 'February', 'March', 'April', 'May', 'June', 
-                  'July', 'August', 'September', 'October', 'November', 'December']
-    current_month_name = month_names[current_month - 1]
-    
-    # Prepare data for JSON response
-    transactions_data = []
-    for transaction in transactions:
-        # Get category information
-        category_name = transaction.category.name if transaction.category else None
-        category_icon = transaction.category.icon if transaction.category else 'bi bi-tag'
-        
-        # Get subcategory information
-        subcategory_name = None
-        subcategory_icon = None
-        if transaction.subcategory:
-            subcategory_name = transaction.subcategory.name
-            subcategory_icon = transaction.subcategory.icon or category_icon
-        
-        # Get account information
-        account_name = transaction.transaction_account.name if transaction.transaction_account else None
-        
-        # Use subcategory info if it exists, otherwise use category info
-        display_name = subcategory_name or category_name or 'Uncategorized'
-        display_icon = subcategory_icon or category_icon or 'bi bi-tag'
-        
-        # Format time if available
-        time_str = None
-        if hasattr(transaction, 'time') and transaction.time:
-            time_str = transaction.time.strftime('%H:%M')
-        
-        transactions_data.append({
-            'id': transaction.id,
-            'title': transaction.title,
-            'amount': float(transaction.amount),
-            'date': transaction.date.isoformat(),
-            'time': time_str,
-            'type': transaction.type,
-            'category': transaction.category_id if transaction.category else None,
-            'subcategory': transaction.subcategory_id if transaction.subcategory else None,
-            'transaction_account': transaction.transaction_account_id if transaction.transaction_account else None,
-            'category_name': category_name,
-            'category_icon': category_icon,
-            'subcategory_name': subcategory_name,
-            'subcategory_icon': subcategory_icon,
-            'account_name': account_name,
-            'display_name': display_name,
-            'display_icon': display_icon,
-            'notes': transaction.notes or '',
-        })
+    try:
+        rows, next_cursor = paginate_transactions(transactions, cursor, limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    # Return complete data
-    return JsonResponse({
-        'transactions': transactions_data,
-        'total': total,
-        'income': income,
-        'expenses': expenses,
+    data = {
+        'transactions': [serialize_transaction_row(row) for row in rows],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+        'limit': limit,
         'current_month': current_month,
         'current_year': current_year,
-        'current_month_name': current_month_name,
+        'current_month_name': calendar.month_name[current_month] if current_month else None,
         'filters': {
             'category': category_id,
             'subcategory': subcategory_id,
             'search': search_term,
             'types': types
         }
-    })
+    }
+    
+    # Calculate totals for the whole filtered set along with the first page
+    if cursor is None:
+        totals = transactions.aggregate(
+            count=models.Count('id'),
+            income=Sum('amount', filter=Q(type='income')),
+            expenses=Sum('amount', filter=Q(type='expense')),
+        )
+        income = float(totals['income'] or 0)
+        expenses = float(totals['expenses'] or 0)
+        data.update({
+            'count': totals['count'],
+            'total': income - expenses,
+            'income': income,
+            'expenses': expenses,
+            'total_income': income,
+            'total_expenses': expenses,
+        })
+    
+    return JsonResponse(data)
 
 @login_required
 def transaction_detail_api(request, transaction_id):
     """API endpoint for getting a single transaction's details"""
-    print(f"Fetching details for transaction ID: {transaction_id}")
-    
     try:
         transaction = get_object_or_404(Transaction, id=transaction_id, user=request.user)
-        print(f"Transaction found: {transaction}")
         
         # Load the related objects to ensure they're available
         if transaction.category:
@@ -2092,10 +1812,9 @@ def transaction_detail_api(request, transaction_id):
             'notes': transaction.notes or '',
         }
         
-        print(f"Returning transaction data: {data}")
         return JsonResponse(data)
     except Exception as e:
-        print(f"Error fetching transaction details: {e}")
+        logger.warning("Error fetching transaction %s: %s", transaction_id, e)
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
@@ -2103,9 +1822,6 @@ def create_transaction_api(request):
     """API endpoint for creating a transaction"""
     if request.method == 'POST':
         try:
-            # Debug: Print out all POST data
-            print("Creating transaction with POST data:", request.POST)
-            
             title = request.POST.get('title')
             amount = request.POST.get('amount')
             date_str = request.POST.get('date')
@@ -2115,10 +1831,6 @@ def create_transaction_api(request):
             transaction_account_id = request.POST.get('transaction_account') or None
             notes = request.POST.get('notes', '')
             
-            # Debug: Print all parameters
-            print(f"Title: {title}, Amount: {amount}, Date: {date_str}, Type: {transaction_type}")
-            print(f"Category ID: {category_id}, Subcategory ID: {subcategory_id}, Notes: {notes}")
-            
             # Validate required fields
             if not title or not amount or not date_str or not transaction_type:
                 return JsonResponse({'success': False, 'error': 'Missing required fields'})
@@ -2144,60 +1856,32 @@ def create_transaction_api(request):
                     category = get_object_or_404(Category, id=category_id, user=request.user)
                     transaction.category = category
                 except Exception as e:
-                    print(f"Error getting category: {e}")
+                    logger.debug("Ignoring category %s: %s", category_id, e)
             
             if subcategory_id and subcategory_id != 'null' and subcategory_id != '':
                 try:
                     subcategory = get_object_or_404(SubCategory, id=subcategory_id, parent_category__user=request.user)
                     transaction.subcategory = subcategory
                 except Exception as e:
-                    print(f"Error getting subcategory: {e}")
+                    logger.debug("Ignoring subcategory %s: %s", subcategory_id, e)
             
             if transaction_account_id and transaction_account_id != 'null' and transaction_account_id != '':
                 try:
                     account = get_object_or_404(Account, id=transaction_account_id, user=request.user)
                     transaction.transaction_account = account
                 except Exception as e:
-                    print(f"Error getting account: {e}")
+                    logger.debug("Ignoring account %s: %s", transaction_account_id, e)
             
-            transaction.save()
-            print(f"Transaction created successfully with ID: {transaction.id}")
-
-            # --- Update account balance/usage if transaction_account is set ---
-            if transaction.transaction_account:
-                account = transaction.transaction_account
-                amount_decimal = Decimal(str(transaction.amount))
-                # Debit Account
-                if hasattr(account, 'debitaccount'):
-                    debit = account.debitaccount
-                    if transaction.type == 'expense':
-                        debit.balance -= amount_decimal
-                    else:  # income
-                        debit.balance += amount_decimal
-                    debit.save()
-                # Credit Account
-                elif hasattr(account, 'creditaccount'):
-                    credit = account.creditaccount
-                    if transaction.type == 'expense':
-                        credit.current_usage += amount_decimal
-                    else:  # income (rare)
-                        credit.current_usage -= amount_decimal
-                        if credit.current_usage < 0:
-                            credit.current_usage = 0
-                    credit.save()
-                # Wallet
-                elif hasattr(account, 'wallet'):
-                    wallet = account.wallet
-                    if transaction.type == 'expense':
-                        wallet.balance -= amount_decimal
-                    else:  # income
-                        wallet.balance += amount_decimal
-                    wallet.save()
-            # --- End account update logic ---
+            # Save the transaction and update the account balance/usage together
+            with db_transaction.atomic():
+                transaction.save()
+                if transaction.transaction_account:
+                    apply_balance_change(transaction.transaction_account, transaction.type, transaction.amount)
+            logger.debug("User %s created transaction %s", request.user.pk, transaction.pk)
 
             return JsonResponse({'success': True, 'transaction_id': transaction.id})
         except Exception as e:
-            print(f"Error creating transaction: {e}")
+            logger.exception("Error creating a transaction for user %s", request.user.pk)
             return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
@@ -2209,9 +1893,6 @@ def update_transaction_api(request, transaction_id):
     
     if request.method == 'POST':
         try:
-            # Debug: Print out all POST data
-            print(f"Updating transaction {transaction_id} with POST data:", request.POST)
-            
             title = request.POST.get('title')
             amount = request.POST.get('amount')
             date_str = request.POST.get('date')
@@ -2221,11 +1902,6 @@ def update_transaction_api(request, transaction_id):
             transaction_account_id = request.POST.get('transaction_account') or None
             notes = request.POST.get('notes', '')
             
-            # Debug: Print all parameters
-            print(f"Title: {title}, Amount: {amount}, Date: {date_str}, Type: {transaction_type}")
-            print(f"Category ID: {category_id}, Subcategory ID: {subcategory_id}, Notes: {notes}")
-            print(f"Transaction Account ID: {transaction_account_id}")
-            
             # Validate required fields
             if not title or not amount or not date_str or not transaction_type:
                 return JsonResponse({'success': False, 'error': 'Missing required fields'})
@@ -2249,7 +1925,7 @@ def update_transaction_api(request, transaction_id):
                     category = get_object_or_404(Category, id=category_id, user=request.user)
                     transaction.category = category
                 except Exception as e:
-                    print(f"Error updating category: {e}")
+                    logger.debug("Ignoring category %s: %s", category_id, e)
             else:
                 transaction.category = None
             
@@ -2259,7 +1935,7 @@ def update_transaction_api(request, transaction_id):
                     subcategory = get_object_or_404(SubCategory, id=subcategory_id, parent_category__user=request.user)
                     transaction.subcategory = subcategory
                 except Exception as e:
-                    print(f"Error updating subcategory: {e}")
+                    logger.debug("Ignoring subcategory %s: %s", subcategory_id, e)
             else:
                 transaction.subcategory = None
             
@@ -2269,81 +1945,26 @@ def update_transaction_api(request, transaction_id):
                     account = get_object_or_404(Account, id=transaction_account_id, user=request.user)
                     transaction.transaction_account = account
                 except Exception as e:
-                    print(f"Error updating account: {e}")
+                    logger.debug("Ignoring account %s: %s", transaction_account_id, e)
             else:
                 transaction.transaction_account = None
             
-            transaction.save()
-            print(f"Transaction updated successfully with ID: {transaction.id}")
-            
-            # --- Update account balance/usage after updating transaction ---
-            # First, revert the previous impact on the account
-            old_transaction = get_object_or_404(Transaction, id=transaction_id, user=request.user)
-            old_account = old_transaction.transaction_account
-            old_amount = Decimal(str(old_transaction.amount))
-            
-            if old_account:
-                # Revert the previous transaction's effect
-                if hasattr(old_account, 'debitaccount'):
-                    debit = old_account.debitaccount
-                    if old_transaction.type == 'expense':
-                        debit.balance += old_amount  # Add back the expense amount
-                    else:  # income
-                        debit.balance -= old_amount  # Subtract the income amount
-                    debit.save()
-                elif hasattr(old_account, 'creditaccount'):
-                    credit = old_account.creditaccount
-                    if old_transaction.type == 'expense':
-                        credit.current_usage -= old_amount  # Reduce the usage
-                    else:  # income
-                        credit.current_usage += old_amount  # Increase the usage
-                        if credit.current_usage > credit.credit_limit:
-                            credit.current_usage = credit.credit_limit
-                    credit.save()
-                elif hasattr(old_account, 'wallet'):
-                    wallet = old_account.wallet
-                    if old_transaction.type == 'expense':
-                        wallet.balance += old_amount  # Add back the expense amount
-                    else:  # income
-                        wallet.balance -= old_amount  # Subtract the income amount
-                    wallet.save()
-            
-            # Now apply the updated transaction to the selected account
-            if transaction.transaction_account:
-                account = transaction.transaction_account
-                amount_decimal = Decimal(str(transaction.amount))
-                
-                # Debit Account
-                if hasattr(account, 'debitaccount'):
-                    debit = account.debitaccount
-                    if transaction.type == 'expense':
-                        debit.balance -= amount_decimal
-                    else:  # income
-                        debit.balance += amount_decimal
-                    debit.save()
-                # Credit Account
-                elif hasattr(account, 'creditaccount'):
-                    credit = account.creditaccount
-                    if transaction.type == 'expense':
-                        credit.current_usage += amount_decimal
-                    else:  # income (rare)
-                        credit.current_usage -= amount_decimal
-                        if credit.current_usage < 0:
-                            credit.current_usage = 0
-                    credit.save()
-                # Wallet
-                elif hasattr(account, 'wallet'):
-                    wallet = account.wallet
-                    if transaction.type == 'expense':
-                        wallet.balance -= amount_decimal
-                    else:  # income
-                        wallet.balance += amount_decimal
-                    wallet.save()
-            # --- End account update logic ---
+            # Revert the previous impact on the account and apply the updated one.
+            # The stored row is locked so concurrent edits can't revert it twice.
+            with db_transaction.atomic():
+                old_transaction = Transaction.objects.select_for_update().select_related(
+                    'transaction_account'
+                ).get(pk=transaction.pk)
+                transaction.save()
+                if old_transaction.transaction_account:
+                    apply_balance_change(old_transaction.transaction_account, old_transaction.type, old_transaction.amount, revert=True)
+                if transaction.transaction_account:
+                    apply_balance_change(transaction.transaction_account, transaction.type, transaction.amount)
+            logger.debug("User %s updated transaction %s", request.user.pk, transaction.pk)
             
             return JsonResponse({'success': True, 'transaction_id': transaction.id})
         except Exception as e:
-            print(f"Error updating transaction: {e}")
+            logger.exception("Error updating transaction %s", transaction_id)
             return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
@@ -2355,40 +1976,12 @@ def delete_transaction_api(request, transaction_id):
     
     if request.method == 'POST':
         try:
-            # --- Revert the effect on account balance/usage before deleting ---
-            account = transaction.transaction_account
-            if account:
-                amount_decimal = Decimal(str(transaction.amount))
-                
-                # Debit Account
-                if hasattr(account, 'debitaccount'):
-                    debit = account.debitaccount
-                    if transaction.type == 'expense':
-                        debit.balance += amount_decimal  # Add back the expense amount
-                    else:  # income
-                        debit.balance -= amount_decimal  # Subtract the income amount
-                    debit.save()
-                # Credit Account
-                elif hasattr(account, 'creditaccount'):
-                    credit = account.creditaccount
-                    if transaction.type == 'expense':
-                        credit.current_usage -= amount_decimal  # Reduce the usage
-                    else:  # income (rare)
-                        credit.current_usage += amount_decimal  # Increase the usage
-                        if credit.current_usage > credit.credit_limit:
-                            credit.current_usage = credit.credit_limit
-                    credit.save()
-                # Wallet
-                elif hasattr(account, 'wallet'):
-                    wallet = account.wallet
-                    if transaction.type == 'expense':
-                        wallet.balance += amount_decimal  # Add back the expense amount
-                    else:  # income
-                        wallet.balance -= amount_decimal  # Subtract the income amount
-                    wallet.save()
-            # --- End account update logic ---
-                
-            transaction.delete()
+            # Revert the effect on account balance/usage along with the delete,
+            # only if this request is the one that actually deleted the row
+            with db_transaction.atomic():
+                deleted, _ = Transaction.objects.filter(pk=transaction.pk).delete()
+                if deleted and transaction.transaction_account:
+                    apply_balance_change(transaction.transaction_account, transaction.type, transaction.amount, revert=True)
             return JsonResponse({'success': True})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
@@ -2398,69 +1991,53 @@ def delete_transaction_api(request, transaction_id):
 @login_required
 def api_accounts(request):
     transaction_type = request.GET.get('transaction_type', 'expense')
-    accounts = Account.objects.filter(user=request.user)
+    accounts = Account.objects.filter(user=request.user).with_subtypes()
     
     # For income transactions, exclude credit accounts
     if transaction_type == 'income':
-        accounts = accounts.exclude(creditaccount__isnull=False)
+        accounts = accounts.exclude(account_type='credit')
     
     account_data = []
     for account in accounts:
-        # Get the specific account type instance
-        try:
-            if hasattr(account, 'debitaccount'):
-                account_instance = account.debitaccount
-                balance = account_instance.balance
-                account_data.append({
-                    'id': account.id,
-                    'name': account.name,
-                    'type': 'debit',
-                    'balance': float(balance),
-                    'maintaining_balance': float(account_instance.maintaining_balance) if account_instance.maintaining_balance is not None else 0
-                })
-            elif hasattr(account, 'creditaccount'):
-                account_instance = account.creditaccount
-                available_balance = account_instance.credit_limit - account_instance.current_usage
-                account_data.append({
-                    'id': account.id,
-                    'name': account.name,
-                    'type': 'credit',
-                    'balance': float(available_balance),
-                    'credit_limit': float(account_instance.credit_limit),
-                    'current_usage': float(account_instance.current_usage)
-                })
-            elif hasattr(account, 'wallet'):
-                account_instance = account.wallet
-                balance = account_instance.balance
-                account_data.append({
-                    'id': account.id,
-                    'name': account.name,
-                    'type': 'wallet',
-                    'balance': float(balance)
-                })
-            else:
-                continue  # Skip if not a valid account type
-        except Exception as e:
-            print(f"Error processing account {account.id}: {e}")
-            continue  # Skip if there's any error getting the account details
+        account_instance = account.concrete
+        if account.account_type == 'debit':
+            account_data.append({
+                'id': account.id,
+                'name': account.name,
+                'type': 'debit',
+                'balance': float(account_instance.balance),
+                'maintaining_balance': float(account_instance.maintaining_balance) if account_instance.maintaining_balance is not None else 0
+            })
+        elif account.account_type == 'credit':
+            available_balance = account_instance.credit_limit - account_instance.current_usage
+            account_data.append({
+                'id': account.id,
+                'name': account.name,
+                'type': 'credit',
+                'balance': float(available_balance),
+                'credit_limit': float(account_instance.credit_limit),
+                'current_usage': float(account_instance.current_usage)
+            })
+        elif account.account_type == 'wallet':
+            account_data.append({
+                'id': account.id,
+                'name': account.name,
+                'type': 'wallet',
+                'balance': float(account_instance.balance)
+            })
     
     return JsonResponse(account_data, safe=False)
 
 @login_required
 def api_account_balance(request, account_id):
     try:
-        account = Account.objects.get(id=account_id, user=request.user)
+        account = Account.objects.with_subtypes().get(id=account_id, user=request.user)
+        account_instance = account.concrete
         
-        # Get the specific account type instance
-        if hasattr(account, 'debitaccount'):
-            account_instance = account.debitaccount
+        if account.account_type in ('debit', 'wallet'):
             balance = account_instance.balance
-        elif hasattr(account, 'creditaccount'):
-            account_instance = account.creditaccount
+        elif account.account_type == 'credit':
             balance = account_instance.credit_limit - account_instance.current_usage
-        elif hasattr(account, 'wallet'):
-            account_instance = account.wallet
-            balance = account_instance.balance
         else:
             return JsonResponse({'error': 'Invalid account type'}, status=400)
             
@@ -2468,6 +2045,13 @@ def api_account_balance(request, account_id):
     except Account.DoesNotExist:
         return JsonResponse({'error': 'Account not found'}, status=404)
 
+@login_required
+def api_request_metrics(request):
+    """Per-view request histograms of this process and the aggregate cache counters, for staff"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    return JsonResponse({**get_request_metrics(), 'cache': get_cache_stats()})
+
 @login_required
 def charts_view(request):
     # Get the current date and calculate date ranges
@@ -2475,77 +2059,44 @@ def charts_view(request):
     start_of_month = today.replace(day=1)
     start_of_year = today.replace(month=1, day=1)
     
-    # Categories Analysis Data
-    categories = Category.objects.filter(user=request.user)
-    category_data = []
-    
-    for category in categories:
-        total = Transaction.objects.filter(
-            user=request.user,
-            category=category,
-            date__gte=start_of_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
+    def build_chart_data():
+        # Categories Analysis Data
+        category_data = [
+            {'category': row['category'], 'amount': float(row['amount'])}
+            for row in get_category_breakdown(request.user, start_of_month)
+            if row['category_id'] is not None and row['amount'] != 0  # Only include categories with transactions
+        ]
         
-        if total != 0:  # Only include categories with transactions
-            category_data.append({
-                'category': category.name,
-                'amount': float(total)
-            })
-    
-    # Time Analysis Data (Last 6 months)
-    time_data = {
-        'labels': [],
-        'income': [],
-        'expenses': []
-    }
-    
-    for i in range(6):
-        month = today.replace(day=1) - timedelta(days=30*i)
-        month_name = month.strftime('%b %Y')
-        time_data['labels'].insert(0, month_name)
+        # Time Analysis Data (Last 6 months)
+        time_data = get_cash_flow_series(request.user, add_months(start_of_month, -5), today, 'month', '%b %Y')
         
-        # Get income for the month
-        income = Transaction.objects.filter(
-            user=request.user,
-            type='income',
-            date__year=month.year,
-            date__month=month.month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        time_data['income'].insert(0, float(income))
+        # Future Projections Data (Next 6 months)
+        future_data = {
+            'labels': [],
+            'projected': []
+        }
         
-        # Get expenses for the month
-        expenses = Transaction.objects.filter(
+        # Calculate average monthly income and expenses from the last 3 months
+        last_3_months = DailyRollup.objects.filter(
             user=request.user,
-            type='expense',
-            date__year=month.year,
-            date__month=month.month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        time_data['expenses'].insert(0, float(expenses))
-    
-    # Future Projections Data (Next 6 months)
-    future_data = {
-        'labels': [],
-        'projected': []
-    }
-    
-    # Calculate average monthly income and expenses from the last 3 months
-    last_3_months_avg = Transaction.objects.filter(
-        user=request.user,
-        date__gte=today - timedelta(days=90)
-    ).aggregate(avg=Avg('amount'))['avg'] or 0
-    
-    # Project next 6 months
-    for i in range(1, 7):
-        month = today.replace(day=1) + timedelta(days=30*i)
-        month_name = month.strftime('%b %Y')
-        future_data['labels'].append(month_name)
-        future_data['projected'].append(float(last_3_months_avg))
+            date__gte=today - timedelta(days=90)
+        ).aggregate(total=Sum('amount'), count=Sum('count'))
+        last_3_months_avg = last_3_months['total'] / last_3_months['count'] if last_3_months['count'] else 0
+        
+        # Project next 6 months
+        for i in range(1, 7):
+            month = today.replace(day=1) + timedelta(days=30*i)
+            month_name = month.strftime('%b %Y')
+            future_data['labels'].append(month_name)
+            future_data['projected'].append(float(last_3_months_avg))
+        
+        return {
+            'category_data': json.dumps(category_data),
+            'time_data': json.dumps(time_data),
+            'future_data': json.dumps(future_data)
+        }
     
-    context = {
-        'category_data': json.dumps(category_data),
-        'time_data': json.dumps(time_data),
-        'future_data': json.dumps(future_data)
-    }
+    context = cached_aggregate(request.user, 'charts', today, build_chart_data)
     
     return render(request, 'finances/charts.html', context)
 
@@ -2557,160 +2108,103 @@ def charts_data_time(request):
     interval = request.GET.get('interval', 'day')
     
     today = timezone.now().date()
-    data = {
-        'labels': [],
-        'income': [],
-        'expenses': []
-    }
     
-    if range_param == 'week':
-        # Last 7 days
-        for i in range(7):
-            date = today - timedelta(days=i)
-            data['labels'].insert(0, date.strftime('%a %d'))
-            
-            # Get income for the day
-            income = Transaction.objects.filter(
-                user=request.user,
-                type='income',
-                date=date
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            data['income'].insert(0, float(income))
-            
-            # Get expenses for the day
-            expenses = Transaction.objects.filter(
-                user=request.user,
-                type='expense',
-                date=date
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            data['expenses'].insert(0, float(expenses))
-            
-    elif range_param == 'month':
-        if interval == 'day':
-            # Last 30 days
-            for i in range(30):
-                date = today - timedelta(days=i)
-                data['labels'].insert(0, date.strftime('%d'))
-                
-                # Get income for the day
-                income = Transaction.objects.filter(
-                    user=request.user,
-                    type='income',
-                    date=date
-                ).aggregate(total=Sum('amount'))['total'] or 0
-                data['income'].insert(0, float(income))
-                
-                # Get expenses for the day
-                expenses = Transaction.objects.filter(
-                    user=request.user,
-                    type='expense',
-                    date=date
-                ).aggregate(total=Sum('amount'))['total'] or 0
-                data['expenses'].insert(0, float(expenses))
-                
-        elif interval == 'week':
-            # Last 4 weeks
-            for i in range(4):
-                end_date = today - timedelta(weeks=i)
-                start_date = end_date - timedelta(days=6)
-                data['labels'].insert(0, f'Week {4-i}')
-                
-                # Get income for the week
-                income = Transaction.objects.filter(
-                    user=request.user,
-                    type='income',
-                    date__gte=start_date,
-                    date__lte=end_date
-                ).aggregate(total=Sum('amount'))['total'] or 0
-                data['income'].insert(0, float(income))
-                
-                # Get expenses for the week
-                expenses = Transaction.objects.filter(
-                    user=request.user,
-                    type='expense',
-                    date__gte=start_date,
-                    date__lte=end_date
-                ).aggregate(total=Sum('amount'))['total'] or 0
-                data['expenses'].insert(0, float(expenses))
+    def build_time_data():
+        data = {
+            'labels': [],
+            'income': [],
+            'expenses': []
+        }
+        
+        if range_param == 'week':
+            # Last 7 days
+            data = get_cash_flow_series(request.user, today - timedelta(days=6), today, 'day', '%a %d')
                 
-    elif range_param == 'year':
-        # Last 12 months
-        for i in range(12):
-            month = today.replace(day=1) - timedelta(days=30*i)
-            data['labels'].insert(0, month.strftime('%b'))
-            
-            # Get income for the month
-            income = Transaction.objects.filter(
-                user=request.user,
-                type='income',
-                date__year=month.year,
-                date__month=month.month
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            data['income'].insert(0, float(income))
-            
-            # Get expenses for the month
-            expenses = Transaction.objects.filter(
-                user=request.user,
-                type='expense',
-                date__year=month.year,
-                date__month=month.month
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            data['expenses'].insert(0, float(expenses))
+        elif range_param == 'month':
+            if interval == 'day':
+                # Last 30 days
+                data = get_cash_flow_series(request.user, today - timedelta(days=29), today, 'day', '%d')
+                    
+            elif interval == 'week':
+                # Last 4 weeks (Monday to Sunday, the current week included)
+                start_date = today - timedelta(days=today.weekday(), weeks=3)
+                data = get_cash_flow_series(request.user, start_date, today, 'week')
+                data['labels'] = [f'Week {i + 1}' for i in range(len(data['labels']))]
+                    
+        elif range_param == 'year':
+            # Last 12 months
+            start_date = add_months(today.replace(day=1), -11)
+            data = get_cash_flow_series(request.user, start_date, today, 'month', '%b')
+        
+        return data
     
+    data = cached_aggregate(request.user, 'charts_time', (range_param, interval, today), build_time_data)
     return JsonResponse(data)
 
 @login_required
 def charts_data_future(request):
-    # Get the current date and calculate date ranges
-    today = timezone.now()
-    start_date = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    # Calculate end date (6 months from now)
-    if start_date.month + 6 > 12:
-        end_date = start_date.replace(year=start_date.year + 1, month=start_date.month + 6 - 12)
-    else:
-        end_date = start_date.replace(month=start_date.month + 6)
-    end_date = end_date.replace(day=1) - timedelta(days=1)
-    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Get all transactions (actual and scheduled) for the period
-    transactions = get_transactions_with_scheduled(request.user, start_date, end_date)
-    # Sort transactions by date
-    transactions.sort(key=lambda t: t['date'])
-
-    # Prepare labels (dates as strings)
-    dates = [start_date.strftime('%Y-%m-%d')]
-    for t in transactions:
-        dates.append(t['date'].strftime('%Y-%m-%d'))
-
-    # Calculate projected balance trend
-    balances = []
-    current_balance = Decimal('0')
-    for account in Account.objects.filter(user=request.user):
-        if hasattr(account, 'debitaccount'):
-            current_balance += account.debitaccount.balance
-        elif hasattr(account, 'wallet'):
-            current_balance += account.wallet.balance
-        elif hasattr(account, 'creditaccount'):
-            current_balance -= account.creditaccount.current_usage
-    balances.append(float(current_balance))
-    for t in transactions:
-        if t['type'] == 'income':
-            current_balance += Decimal(str(t['amount']))
-        else:
-            current_balance -= Decimal(str(t['amount']))
-        balances.append(float(current_balance))
+    """Projected balances, in total and per account, until the end of the sixth month (or ?months=1-12)"""
+    interval = request.GET.get('interval', 'week')
+    if interval not in PROJECTION_INTERVALS:
+        return JsonResponse({'error': 'Invalid interval'}, status=400)
+    try:
+        months = min(max(int(request.GET.get('months', 6)), 1), 12)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid number of months'}, status=400)
+
+    today = timezone.localdate()
+    end_date = add_months(today.replace(day=1), months) - timedelta(days=1)
+
+    def build_future_data():
+        projection = get_balance_projection(request.user, today, end_date, interval)
+        zeros = [0] * len(projection['periods'])
+        return {
+            'labels': [period.strftime('%Y-%m-%d') for period in projection['periods']],
+            'future_transactions': zeros,
+            'scheduled_transactions': projection['flows'],
+            'debts_credits': zeros,
+            'credit_card_payments': zeros,
+            'projected': projection['total'],
+            'accounts': projection['accounts'],
+        }
+    
+    data = cached_aggregate(request.user, 'charts_future', (today, interval, months), build_future_data)
+    return JsonResponse(data)
 
-    # For now, fill other arrays with zeros (same length as labels)
-    n = len(dates)
-    zeros = [0] * n
-    data = {
-        'labels': dates,
-        'future_transactions': zeros,
-        'scheduled_transactions': zeros,
-        'debts_credits': zeros,
-        'credit_card_payments': zeros,
-        'projected': balances,
-    }
+@login_required
+def api_scheduled_failures(request):
+    """
+    Predict which pending scheduled transactions would fail to post, and when,
+    over the next ?days=1-366 days (90 by default).
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 90)), 1), 366)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid number of days'}, status=400)
+
+    today = timezone.localdate()
+    end_date = today + timedelta(days=days - 1)
+
+    def build_prediction():
+        prediction = predict_schedule_failures(request.user, end_date, today)
+        return {
+            'until': end_date.isoformat(),
+            'failures': [
+                {**failure, 'date': failure['date'].isoformat(), 'amount': float(failure['amount'])}
+                for failure in prediction['failures']
+            ],
+            'accounts': [
+                {
+                    **account,
+                    'balance': float(account['balance']),
+                    'lowest_balance': float(account['lowest_balance']),
+                    'first_failure': account['first_failure'] and account['first_failure'].isoformat(),
+                }
+                for account in prediction['accounts']
+            ],
+        }
+
+    data = cached_aggregate(request.user, 'schedule_failures', (today, days), build_prediction)
     return JsonResponse(data)
 
 def calculate_account_summaries(user):
@@ -2752,46 +2246,7 @@ def get_month_summary(user, month_date):
     first_day = month_date
     last_day = (month_date.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
     
-    # Get month's transactions
-    month_income = Transaction.objects.filter(
-        user=user,
-        type='income',
-        date__gte=first_day,
-        date__lte=last_day
-    ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    
-    month_expenses = Transaction.objects.filter(
-        user=user,
-        type='expense',
-        date__gte=first_day,
-        date__lte=last_day
-    ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    
-    return month_income, month_expenses
-
-def get_budget_warnings(user, start_date, end_date):
-    """Get budget warnings for a given date range."""
-    budgets = Budget.objects.filter(user=user, start_date__lte=end_date, end_date__gte=start_date)
-    budget_warnings = []
-    
-    for budget in budgets:
-        spent = Transaction.objects.filter(
-            user=user,
-            type='expense',
-            category=budget.category,
-            date__gte=start_date,
-            date__lte=end_date
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-        
-        if spent > float(budget.amount) * 0.8:  # Warning at 80% of budget
-            budget_warnings.append({
-                'category': budget.category.name,
-                'budget': budget.amount,
-                'spent': spent,
-                'percentage': round((spent / budget.amount) * 100)
-            })
-    
-    return budget_warnings
+    return get_period_totals(user, first_day, last_day)
 
 @login_required
 def batch_delete_transactions_api(request):
@@ -2808,20 +2263,29 @@ def batch_delete_transactions_api(request):
         if not transaction_ids:
             return JsonResponse({'error': 'No transaction IDs provided'}, status=400)
         
-        # Get transactions that belong to this user
-        transactions = Transaction.objects.filter(
-            user=request.user,
-            id__in=transaction_ids
-        )
-        
-        if not transactions:
-            return JsonResponse({'error': 'No valid transactions found to delete'}, status=404)
-        
-        # Count how many were found
-        found_count = transactions.count()
-        
-        # Delete the transactions
-        transactions.delete()
+        with db_transaction.atomic():
+            # Locked, so a concurrent delete can't revert the same transactions again
+            transactions = list(Transaction.objects.select_for_update(of=('self',)).filter(
+                user=request.user,
+                id__in=transaction_ids
+            ).select_related('transaction_account'))
+            
+            if not transactions:
+                return JsonResponse({'error': 'No valid transactions found to delete'}, status=404)
+            
+            # Revert the effect on account balance/usage, one update per account
+            # and type (the clamping of credit usage adds up the same way)
+            reverted = defaultdict(Decimal)
+            accounts = {}
+            for transaction in transactions:
+                if transaction.transaction_account_id:
+                    accounts[transaction.transaction_account_id] = transaction.transaction_account
+                    reverted[(transaction.transaction_account_id, transaction.type)] += transaction.amount
+            for (account_id, transaction_type), amount in reverted.items():
+                apply_balance_change(accounts[account_id], transaction_type, amount, revert=True)
+            
+            found_count = len(transactions)
+            Transaction.objects.filter(pk__in=[transaction.pk for transaction in transactions]).delete()
         
         return JsonResponse({
             'success': True,
@@ -2885,7 +2349,7 @@ def test_scheduled_transactions(request):
     # Check if the scheduled time has passed
     if timezone.now() >= scheduled.date_scheduled:
         # Process scheduled transactions
-        process_scheduled_transactions(request.user)
+        process_due_scheduled_transactions(user=request.user)
         
         # Get the updated scheduled transaction
         scheduled.refresh_from_db()
@@ -2926,127 +2390,23 @@ def resolve_scheduled_transaction(request, pk):
         })
     
     try:
-        # First validate if the transaction can be processed with the current account state
-        account = scheduled.account
-        amount_decimal = Decimal(str(scheduled.amount))
-        
-        # Validate account balance/limits based on account type
-        if hasattr(account, 'debitaccount'):
-            debit = account.debitaccount
-            if scheduled.transaction_type == 'expense':
-                # Check if balance would go below maintaining balance
-                if debit.balance - amount_decimal < (debit.maintaining_balance or 0):
-                    scheduled.status = 'failed'
-                    scheduled.save(update_fields=['status'])
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'Insufficient balance in debit account.'
-                    })
-        elif hasattr(account, 'creditaccount'):
-            credit = account.creditaccount
-            if scheduled.transaction_type == 'expense':
-                # Check if credit limit would be exceeded
-                if credit.current_usage + amount_decimal > credit.credit_limit:
-                    scheduled.status = 'failed'
-                    scheduled.save(update_fields=['status'])
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'Credit limit would be exceeded.'
-                    })
-        elif hasattr(account, 'wallet'):
-            wallet = account.wallet
-            if scheduled.transaction_type == 'expense' and wallet.balance < amount_decimal:
-                scheduled.status = 'failed'
-                scheduled.save(update_fields=['status'])
+        # Post it against the current account state, the same way the scheduler does
+        with db_transaction.atomic():
+            # Claim the row so a concurrent resolve can't post it twice
+            if not ScheduledTransaction.objects.filter(pk=scheduled.pk, status='failed').update(status='completed'):
                 return JsonResponse({
                     'success': False,
-                    'error': 'Insufficient balance in wallet.'
+                    'error': 'Only failed transactions can be resolved.'
                 })
-        
-        # If validation passes, create the transaction
-        transaction = Transaction.objects.create(
-            user=request.user,
-            title=scheduled.name,
-            amount=scheduled.amount,
-            date=scheduled.date_scheduled.date(),
-            time=scheduled.date_scheduled.time(),
-            type=scheduled.transaction_type,
-            category=scheduled.category,
-            subcategory=scheduled.subcategory,
-            transaction_account=scheduled.account,
-            notes=f"Scheduled transaction: {scheduled.name} (ID: {scheduled.id})"
-        )
-        
-        # Update account balance/usage
-        if hasattr(account, 'debitaccount'):
-            debit = account.debitaccount
-            if scheduled.transaction_type == 'expense':
-                debit.balance -= amount_decimal
-            else:  # income
-                debit.balance += amount_decimal
-            debit.save()
-        elif hasattr(account, 'creditaccount'):
-            credit = account.creditaccount
-            if scheduled.transaction_type == 'expense':
-                credit.current_usage += amount_decimal
-            else:  # income (rare)
-                credit.current_usage -= amount_decimal
-                if credit.current_usage < 0:
-                    credit.current_usage = 0
-            credit.save()
-        elif hasattr(account, 'wallet'):
-            wallet = account.wallet
-            if scheduled.transaction_type == 'expense':
-                wallet.balance -= amount_decimal
-            else:  # income
-                wallet.balance += amount_decimal
-            wallet.save()
-        
-        # Update the scheduled transaction status to completed
-        scheduled.status = 'completed'
-        scheduled.save(update_fields=['status'])
-        
-        # If this is a recurring transaction, create the next occurrence
-        if scheduled.repeats != 1:
-            # Only create next if repeats is infinite or > 1
-            if scheduled.repeats == 0:
-                next_repeats = 0
-            elif scheduled.repeats > 1:
-                next_repeats = scheduled.repeats - 1
-            else:
-                next_repeats = None
-            if next_repeats is not None:
-                next_date = scheduled.date_scheduled
-                if scheduled.repeat_type == 'daily':
-                    next_date += timedelta(days=1)
-                elif scheduled.repeat_type == 'weekly':
-                    next_date += timedelta(weeks=1)
-                elif scheduled.repeat_type == 'monthly':
-                    if next_date.month == 12:
-                        next_date = next_date.replace(year=next_date.year + 1, month=1)
-                    else:
-                        next_date = next_date.replace(month=next_date.month + 1)
-                elif scheduled.repeat_type == 'yearly':
-                    next_date = next_date.replace(year=next_date.year + 1)
-                ScheduledTransaction.objects.create(
-                    user=request.user,
-                    name=scheduled.name,
-                    category=scheduled.category,
-                    subcategory=scheduled.subcategory,
-                    transaction_type=scheduled.transaction_type,
-                    account=scheduled.account,
-                    amount=scheduled.amount,
-                    date_scheduled=next_date,
-                    repeat_type=scheduled.repeat_type,
-                    repeats=next_repeats,
-                    note=scheduled.note,
-                    status='scheduled'
-                )
+            next_transaction = process_scheduled_transaction(scheduled)
+            if next_transaction is not None:
+                # Skips model validation, which rejects dates that are already in the past
+                ScheduledTransaction.objects.bulk_create([next_transaction])
+    except InsufficientFundsError as e:
         return JsonResponse({
-            'success': True,
-            'message': 'Transaction resolved successfully.'
+            'success': False,
+            'error': str(e)
         })
-        
     except Exception as e:
         # If any error occurs, mark the transaction as failed
         scheduled.status = 'failed'
@@ -3060,6 +2420,11 @@ def resolve_scheduled_transaction(request, pk):
             'debts_credits': [],
             'credit_card_payments': []
         }, status=500)
+    
+    return JsonResponse({
+        'success': True,
+        'message': 'Transaction resolved successfully.'
+    })
 
 @login_required
 def export_data(request):
@@ -3069,151 +2434,40 @@ def export_data(request):
             start_date = form.cleaned_data['start_date']
             end_date = form.cleaned_data['end_date']
             format = form.cleaned_data['format']
-            include_fields = form.cleaned_data['include_fields']
+            include_fields = form.cleaned_data.get('include_fields') or list(TRANSACTION_EXPORT_FIELDS)
             
-            # Get transactions with related fields
             transactions = Transaction.objects.filter(
                 user=request.user,
                 date__gte=start_date,
                 date__lte=end_date
-            ).select_related('category', 'subcategory', 'transaction_account').order_by('-date')
+            ).order_by('-date')
             
+            def rows():
+                photo_index = include_fields.index('photo') if 'photo' in include_fields else None
+                photo_storage = Transaction._meta.get_field('photo').storage
+                for values in iter_values(transactions, [TRANSACTION_EXPORT_FIELDS[field] for field in include_fields]):
+                    if photo_index is not None:
+                        values = list(values)
+                        photo = values[photo_index]
+                        values[photo_index] = request.build_absolute_uri(photo_storage.url(photo)) if photo else None
+                    yield values
+            
+            filename = f'transactions_{start_date}_{end_date}.{format}'
             if format == 'csv':
-                response = HttpResponse(content_type='text/csv')
-                response['Content-Disposition'] = f'attachment; filename="transactions_{start_date}_{end_date}.csv"'
-                
-                writer = csv.writer(response)
-                writer.writerow(include_fields)  # Write header row
-                
-                for transaction in transactions:
-                    row = []
-                    for field in include_fields:
-                        if field == 'id':
-                            row.append(transaction.id)
-                        elif field == 'title':
-                            row.append(transaction.title)
-                        elif field == 'amount':
-                            row.append(transaction.amount)
-                        elif field == 'currency':
-                            row.append(transaction.currency)
-                        elif field == 'date':
-                            row.append(transaction.date)
-                        elif field == 'time':
-                            row.append(transaction.time)
-                        elif field == 'type':
-                            row.append(transaction.type)
-                        elif field == 'category':
-                            row.append(transaction.category.name if transaction.category else '')
-                        elif field == 'subcategory':
-                            row.append(transaction.subcategory.name if transaction.subcategory else '')
-                        elif field == 'account':
-                            row.append(transaction.transaction_account.name if transaction.transaction_account else '')
-                        elif field == 'notes':
-                            row.append(transaction.notes or '')
-                        elif field == 'photo':
-                            row.append(request.build_absolute_uri(transaction.photo.url) if transaction.photo else '')
-                    writer.writerow(row)
-                
-                return response
+                return streaming_attachment(iter_csv(include_fields, rows()), 'csv', filename)
             
-            elif format == 'json':
-                data = []
-                for transaction in transactions:
-                    transaction_data = {}
-                    for field in include_fields:
-                        if field == 'id':
-                            transaction_data['id'] = transaction.id
-                        elif field == 'title':
-                            transaction_data['title'] = transaction.title
-                        elif field == 'amount':
-                            transaction_data['amount'] = float(transaction.amount)
-                        elif field == 'currency':
-                            transaction_data['currency'] = transaction.currency
-                        elif field == 'date':
-                            transaction_data['date'] = transaction.date.isoformat()
-                        elif field == 'time':
-                            transaction_data['time'] = transaction.time.strftime('%H:%M:%S')
-                        elif field == 'type':
-                            transaction_data['type'] = transaction.type
-                        elif field == 'category':
-                            transaction_data['category'] = transaction.category.name if transaction.category else None
-                        elif field == 'subcategory':
-                            transaction_data['subcategory'] = transaction.subcategory.name if transaction.subcategory else None
-                        elif field == 'account':
-                            transaction_data['account'] = transaction.transaction_account.name if transaction.transaction_account else None
-                        elif field == 'notes':
-                            transaction_data['notes'] = transaction.notes
-                        elif field == 'photo':
-                            transaction_data['photo'] = request.build_absolute_uri(transaction.photo.url) if transaction.photo else None
-                    data.append(transaction_data)
-                
-                response = HttpResponse(json.dumps(data, indent=2), content_type='application/json')
-                response['Content-Disposition'] = f'attachment; filename="transactions_{start_date}_{end_date}.json"'
-                return response
+            elif format in ('json', 'ndjson'):
+                records = (dict(zip(include_fields, values)) for values in rows())
+                return streaming_attachment(iter_json(records, ndjson=format == 'ndjson'), format, filename)
             
             elif format == 'xlsx':
-                import openpyxl
-                from openpyxl.styles import Font, PatternFill
-                
-                wb = openpyxl.Workbook()
-                ws = wb.active
-                ws.title = 'Transactions'
-                
-                # Write header row with styling
-                header_font = Font(bold=True)
-                header_fill = PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid')
-                
-                for col, field in enumerate(include_fields, 1):
-                    cell = ws.cell(row=1, column=col, value=field)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                
-                # Write data rows
-                for row, transaction in enumerate(transactions, 2):
-                    for col, field in enumerate(include_fields, 1):
-                        if field == 'id':
-                            value = transaction.id
-                        elif field == 'title':
-                            value = transaction.title
-                        elif field == 'amount':
-                            value = float(transaction.amount)
-                        elif field == 'currency':
-                            value = transaction.currency
-                        elif field == 'date':
-                            value = transaction.date
-                        elif field == 'time':
-                            value = transaction.time
-                        elif field == 'type':
-                            value = transaction.type
-                        elif field == 'category':
-                            value = transaction.category.name if transaction.category else ''
-                        elif field == 'subcategory':
-                            value = transaction.subcategory.name if transaction.subcategory else ''
-                        elif field == 'account':
-                            value = transaction.transaction_account.name if transaction.transaction_account else ''
-                        elif field == 'notes':
-                            value = transaction.notes or ''
-                        elif field == 'photo':
-                            value = request.build_absolute_uri(transaction.photo.url) if transaction.photo else ''
-                        ws.cell(row=row, column=col, value=value)
-                
-                # Auto-adjust column widths
-                for col in ws.columns:
-                    max_length = 0
-                    column = col[0].column_letter
-                    for cell in col:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = (max_length + 2)
-                    ws.column_dimensions[column].width = adjusted_width
-                
-                response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                response['Content-Disposition'] = f'attachment; filename="transactions_{start_date}_{end_date}.xlsx"'
-                wb.save(response)
-                return response
+                output = write_xlsx(
+                    include_fields,
+                    rows(),
+                    header_font=Font(bold=True),
+                    header_fill=PatternFill(start_color='CCCCCC', end_color='CCCCCC', fill_type='solid'),
+                )
+                return xlsx_attachment(output, filename)
     else:
         today = timezone.now().date()
         start_date = today.replace(day=1)
@@ -3222,144 +2476,57 @@ def export_data(request):
     
     return render(request, 'finances/export_data.html', {'form': form})
 
+def _import_transactions(request, import_form):
+    """
+    Import the file of a valid ImportForm and report the outcome.
+
+    AJAX requests get the import report as JSON; otherwise the outcome is
+    reported with messages and None is returned.
+    """
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    importer = TransactionImporter(
+        request.user,
+        duplicate_handling=import_form.cleaned_data['duplicate_handling'],
+    )
+
+    try:
+        report = importer.run(iter_file_rows(import_form.cleaned_data['file']))
+    except ValueError as ve:
+        if is_ajax:
+            return JsonResponse({'error': str(ve)}, status=400)
+        messages.error(request, str(ve))
+        return None
+    except Exception as e:
+        logger.exception("Error importing transactions for user %s", request.user.pk)
+        if is_ajax:
+            return JsonResponse({'error': f'Error processing file: {str(e)}'}, status=400)
+        messages.error(request, f'Error processing file: {str(e)}')
+        return None
+
+    if is_ajax:
+        return JsonResponse(report.as_dict())
+
+    imported = report.created + report.updated
+    if report.error_count > 0:
+        messages.warning(request, f'Import completed with {imported} successful imports and {report.error_count} errors.')
+        messages.error(request, 'Errors: ' + ', '.join(f"row {error['row']}: {error['error']}" for error in report.errors))
+    else:
+        messages.success(request, f'Successfully imported {imported} transactions.')
+    if report.skipped:
+        messages.info(request, f'{report.skipped} duplicate transactions were skipped.')
+    if report.unknown_accounts:
+        messages.warning(request, 'These accounts do not exist, their transactions were imported without an account: ' + ', '.join(sorted(report.unknown_accounts)))
+    return None
+
 @login_required
 def import_data(request):
     if request.method == 'POST':
         form = ImportForm(request.POST, request.FILES)
         if form.is_valid():
-            file = request.FILES['file']
-            format = form.cleaned_data['format']
-            duplicate_handling = form.cleaned_data['duplicate_handling']
-            date_format = form.cleaned_data['date_format'] or '%Y-%m-%d'
-            
-            try:
-                if format == 'csv':
-                    decoded_file = file.read().decode('utf-8')
-                    csv_data = csv.reader(decoded_file.splitlines(), delimiter=',')
-                    headers = next(csv_data)  # Skip header row
-                    
-                    # Process each row
-                    for row in csv_data:
-                        if len(row) >= 5:  # Ensure minimum required fields
-                            title = row[0]
-                            amount = float(row[1])
-                            date = datetime.strptime(row[2], date_format).date()
-                            transaction_type = row[3]
-                            category_name = row[4]
-                            notes = row[5] if len(row) > 5 else ''
-                            
-                            # Get or create category
-                            category = None
-                            if category_name:
-                                category, _ = Category.objects.get_or_create(
-                                    user=request.user,
-                                    name=category_name,
-                                    type=transaction_type
-                                )
-                            
-                            # Handle duplicates based on user preference
-                            if duplicate_handling == 'skip':
-                                if Transaction.objects.filter(
-                                    user=request.user,
-                                    title=title,
-                                    amount=amount,
-                                    date=date,
-                                    type=transaction_type
-                                ).exists():
-                                    continue
-                            
-                            # Create transaction
-                            Transaction.objects.create(
-                                user=request.user,
-                                title=title,
-                                amount=amount,
-                                date=date,
-                                type=transaction_type,
-                                category=category,
-                                notes=notes
-                            )
-                    
-                elif format == 'json':
-                    data = json.loads(file.read().decode('utf-8'))
-                    for item in data:
-                        # Handle duplicates based on user preference
-                        if duplicate_handling == 'skip':
-                            if Transaction.objects.filter(
-                                user=request.user,
-                                title=item['title'],
-                                amount=item['amount'],
-                                date=datetime.strptime(item['date'], date_format).date(),
-                                type=item['type']
-                            ).exists():
-                                continue
-                        
-                        # Get or create category
-                        category = None
-                        if 'category' in item and item['category']:
-                            category, _ = Category.objects.get_or_create(
-                                user=request.user,
-                                name=item['category'],
-                                type=item['type']
-                            )
-                        
-                        # Create transaction
-                        Transaction.objects.create(
-                            user=request.user,
-                            title=item['title'],
-                            amount=item['amount'],
-                            date=datetime.strptime(item['date'], date_format).date(),
-                            time=datetime.strptime(item['time'], '%H:%M:%S').time() if 'time' in item else None,
-                            type=item['type'],
-                            category=category,
-                            notes=item.get('notes', '')
-                        )
-                
-                elif format == 'xlsx':
-                    import openpyxl
-                    wb = openpyxl.load_workbook(file)
-                    ws = wb.active
-                    headers = [cell.value for cell in ws[1]]
-                    
-                    for row in ws.iter_rows(min_row=2):
-                        row_data = {headers[i]: cell.value for i, cell in enumerate(row)}
-                        
-                        # Handle duplicates based on user preference
-                        if duplicate_handling == 'skip':
-                            if Transaction.objects.filter(
-                                user=request.user,
-                                title=row_data['title'],
-                                amount=float(row_data['amount']),
-                                date=datetime.strptime(row_data['date'], date_format).date(),
-                                type=row_data['type']
-                            ).exists():
-                                continue
-                        
-                        # Get or create category
-                        category = None
-                        if 'category' in row_data and row_data['category']:
-                            category, _ = Category.objects.get_or_create(
-                                user=request.user,
-                                name=row_data['category'],
-                                type=row_data['type']
-                            )
-                        
-                        # Create transaction
-                        Transaction.objects.create(
-                            user=request.user,
-                            title=row_data['title'],
-                            amount=float(row_data['amount']),
-                            date=datetime.strptime(row_data['date'], date_format).date(),
-                            time=datetime.strptime(row_data['time'], '%H:%M:%S').time() if 'time' in row_data else None,
-                            type=row_data['type'],
-                            category=category,
-                            notes=row_data.get('notes', '')
-                        )
-                
-                messages.success(request, 'Transactions imported successfully!')
-                return redirect('transactions')
-            
-            except Exception as e:
-                messages.error(request, f'Error importing file: {str(e)}')
+            response = _import_transactions(request, form)
+            if response is not None:
+                return response
+            return redirect('transactions')
     else:
         form = ImportForm()
     
@@ -3407,176 +2574,30 @@ def import_export_data(request):
                 
                 transactions = Transaction.objects.filter(**transaction_filter).order_by('date')
                 
-                # Prepare headers and data
-                headers = ['Date', 'Title', 'Amount', 'Type', 'Category', 'Account', 'Notes']
+                # Columns of the export, in the format the import reads back
+                headers = list(EXPORT_COLUMNS)
+                fields = [TRANSACTION_EXPORT_FIELDS[EXPORT_COLUMNS[header]] for header in headers]
+                filename = f'transactions_{start_date}_{end_date}.{format}'
                 
                 if format == 'csv':
-                    response = HttpResponse(content_type='text/csv')
-                    response['Content-Disposition'] = f'attachment; filename="transactions_{start_date}_{end_date}.csv"'
-                    
-                    writer = csv.writer(response, delimiter=separator)
-                    writer.writerow(headers)
-                    
-                    for transaction in transactions:
-                        writer.writerow([
-                            transaction.date,
-                            transaction.title,
-                            transaction.amount,
-                            transaction.type,
-                            transaction.category.name if transaction.category else '',
-                            transaction.transaction_account.name if transaction.transaction_account else '',
-                            transaction.notes or ''
-                        ])
-                    
-                    return response
+                    return streaming_attachment(iter_csv(headers, iter_values(transactions, fields), delimiter=separator), 'csv', filename)
+                
+                elif format in ('json', 'ndjson'):
+                    keys = [EXPORT_COLUMNS[header] for header in headers]
+                    records = (dict(zip(keys, values)) for values in iter_values(transactions, fields))
+                    return streaming_attachment(iter_json(records, ndjson=format == 'ndjson'), format, filename)
                     
                 elif format == 'xlsx':
-                    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                    response['Content-Disposition'] = f'attachment; filename="transactions_{start_date}_{end_date}.xlsx"'
-                    
-                    wb = openpyxl.Workbook()
-                    ws = wb.active
-                    ws.title = 'Transactions'
-                    
-                    # Write headers
-                    for col, header in enumerate(headers, 1):
-                        ws.cell(row=1, column=col, value=header)
-                    
-                    # Write data
-                    for row, transaction in enumerate(transactions, 2):
-                        ws.cell(row=row, column=1, value=transaction.date)
-                        ws.cell(row=row, column=2, value=transaction.title)
-                        ws.cell(row=row, column=3, value=float(transaction.amount))
-                        ws.cell(row=row, column=4, value=transaction.type)
-                        ws.cell(row=row, column=5, value=transaction.category.name if transaction.category else '')
-                        ws.cell(row=row, column=6, value=transaction.transaction_account.name if transaction.transaction_account else '')
-                        ws.cell(row=row, column=7, value=transaction.notes or '')
-                    
-                    # Auto-adjust column widths
-                    for column in ws.columns:
-                        max_length = 0
-                        column = [cell for cell in column]
-                        for cell in column:
-                            try:
-                                if len(str(cell.value)) > max_length:
-                                    max_length = len(str(cell.value))
-                            except:
-                                pass
-                        adjusted_width = (max_length + 2)
-                        ws.column_dimensions[column[0].column_letter].width = adjusted_width
-                    
-                    wb.save(response)
-                    return response
+                    return xlsx_attachment(write_xlsx(headers, iter_values(transactions, fields)), filename)
                     
         elif operation == 'import':
             import_form = ImportForm(request.POST, request.FILES)
             if import_form.is_valid():
-                file = import_form.cleaned_data['file']
-                duplicate_handling = import_form.cleaned_data['duplicate_handling']
-                
-                try:
-                    # Determine file format from extension
-                    file_format = file.name.split('.')[-1].lower()
-                    
-                    if file_format == 'csv':
-                        decoded_file = file.read().decode('utf-8').splitlines()
-                        reader = csv.DictReader(decoded_file)
-                        transactions_data = list(reader)
-                    elif file_format == 'xlsx':
-                        wb = openpyxl.load_workbook(file)
-                        ws = wb.active
-                        headers = [cell.value for cell in ws[1]]
-                        transactions_data = []
-                        for row in ws.iter_rows(min_row=2):
-                            transaction = {}
-                            for header, cell in zip(headers, row):
-                                transaction[header] = cell.value
-                            transactions_data.append(transaction)
-                    
-                    success_count = 0
-                    error_count = 0
-                    errors = []
-                    
-                    expected_headers = ['Date', 'Title', 'Amount', 'Type', 'Category', 'Account', 'Notes']
-                    if not all(header in (transactions_data[0].keys() if transactions_data else []) for header in expected_headers):
-                        raise ValueError('Invalid file format. This file does not match the export format from this system.')
-                    
-                    for data in transactions_data:
-                        try:
-                            # Parse date (our export format uses YYYY-MM-DD)
-                            date_str = str(data['Date'])  # Convert to string first
-                            # Handle both date and datetime formats
-                            try:
-                                date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                            except ValueError:
-                                # If the string includes time, try parsing with time
-                                date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').date()
-                            
-                            # Get or create category if provided
-                            category = None
-                            if data['Category']:
-                                category, _ = Category.objects.get_or_create(
-                                    user=request.user,
-                                    name=data['Category'],
-                                    defaults={'type': data['Type']}
-                                )
-                            
-                            # Get or create account if provided
-                            account = None
-                            if data['Account']:
-                                account, _ = Account.objects.get_or_create(
-                                    user=request.user,
-                                    name=data['Account']
-                                )
-                            
-                            # Check for duplicates
-                            existing_transaction = Transaction.objects.filter(
-                                user=request.user,
-                                title=data['Title'],
-                                amount=Decimal(str(data['Amount'])),
-                                date=date
-                            ).first()
-                            
-                            if existing_transaction:
-                                if duplicate_handling == 'skip':
-                                    continue
-                                elif duplicate_handling == 'update':
-                                    existing_transaction.type = data['Type']
-                                    existing_transaction.category = category
-                                    existing_transaction.transaction_account = account
-                                    existing_transaction.notes = data['Notes']
-                                    existing_transaction.save()
-                                    success_count += 1
-                                    continue
-                            
-                            # Create new transaction
-                            Transaction.objects.create(
-                                user=request.user,
-                                title=data['Title'],
-                                amount=Decimal(str(data['Amount'])),
-                                date=date,
-                                type=data['Type'],
-                                category=category,
-                                transaction_account=account,
-                                notes=data['Notes']
-                            )
-                            success_count += 1
-                            
-                        except Exception as e:
-                            error_count += 1
-                            errors.append(str(e))
-                    
-                    if error_count > 0:
-                        messages.warning(request, f'Import completed with {success_count} successful imports and {error_count} errors.')
-                        if errors:
-                            messages.error(request, 'Errors: ' + ', '.join(errors))
-                    else:
-                        messages.success(request, f'Successfully imported {success_count} transactions.')
-                    
-                except ValueError as ve:
-                    messages.error(request, str(ve))
-                except Exception as e:
-                    messages.error(request, f'Error processing file: {str(e)}')
+                response = _import_transactions(request, import_form)
+                if response is not None:
+                    return response
+            elif request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'errors': import_form.errors}, status=400)
     
     return render(request, 'finances/import_export.html', {
         'export_form': export_form,
@@ -647,9 +647,10 @@ const Categories = () => {
           'X-CSRFToken': window.csrfToken,
           'X-Requested-With': 'XMLHttpRequest'
         },
+        // Only send the move, so the backend rewrites just the categories in between
         body: JSON.stringify({
           category_type: activeTab === 'expenses' ? 'expense' : 'income',
-          category_ids: items.map(item => item.id)
+          move: { category_id: removed.id, to_index: destination.index }
         })
       });
       
@@ -349,8 +349,10 @@ function navigateMonth(direction) {
 
 /**
  * Load transactions based on current state
+ * @param {number} retryCount - Number of retries already made
+ * @param {string|null} cursor - Cursor of the next page to append, or null to reload the list
  */
-function loadTransactions() {
+function loadTransactions(retryCount = 0, cursor = null) {
     // Get query string from state object
     const queryString = window.transactionState.getApiQueryString();
     console.log('Loading transactions with query string:', queryString);
@@ -368,7 +370,8 @@ function loadTransactions() {
     
     // Create the URL with cache-busting parameter and include summary data
     const timestamp = new Date().getTime();
-    const fetchUrl = `/finances/transactions/api/?${queryString}${queryString ? '&' : ''}include_summary=true&cache_bust=${timestamp}`;
+    const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+    const fetchUrl = `/finances/transactions/api/?${queryString}${queryString ? '&' : ''}include_summary=true${cursorParam}&cache_bust=${timestamp}`;
     console.log('Fetching transactions from URL:', fetchUrl);
     
     // Fetch transactions data
@@ -403,9 +406,14 @@ function loadTransactions() {
             window.transactionState.year = data.current_year;
         }
         
-        // Update UI components
-        updateTransactionList(data);
-        updateTransactionSummary(data);
+        // Update UI components (later pages are appended and carry no totals)
+        if (cursor) {
+            appendTransactionList(data);
+        } else {
+            updateTransactionList(data);
+            updateTransactionSummary(data);
+        }
+        updateLoadMoreButton(data.next_cursor);
         updateMonthDisplay();
         
         // Re-attach event listeners for transaction actions
@@ -430,7 +438,7 @@ function loadTransactions() {
         if (retryCount < 2) {
             console.log(`Retrying (${retryCount + 1}/2)...`);
             setTimeout(() => {
-                loadTransactions(retryCount + 1);
+                loadTransactions(retryCount + 1, cursor);
             }, 1000);
         } else {
             // Show error message
@@ -560,12 +568,65 @@ function updateTransactionList(data) {
     let transactionsHTML = '';
     
     data.transactions.forEach(transaction => {
-        // Format the date for display
-        const transactionDate = new Date(transaction.date);
-        const formattedDate = transactionDate.toLocaleDateString();
-        
-        // Build the HTML for each transaction
-        transactionsHTML += `
+        transactionsHTML += buildTransactionItemHTML(transaction);
+    });
+    
+    // Update the transaction list
+    transactionList.innerHTML = transactionsHTML;
+}
+
+/**
+ * Append the next page of transactions to the list
+ * @param {Object} data - Transaction data from API
+ */
+function appendTransactionList(data) {
+    const transactionList = document.querySelector('.list-group-flush');
+    if (!transactionList || !data.transactions) return;
+    
+    let transactionsHTML = '';
+    data.transactions.forEach(transaction => {
+        transactionsHTML += buildTransactionItemHTML(transaction);
+    });
+    transactionList.insertAdjacentHTML('beforeend', transactionsHTML);
+}
+
+/**
+ * Show a "Load more" button below the list while there are more pages
+ * @param {string|null} nextCursor - Cursor of the next page, or null on the last page
+ */
+function updateLoadMoreButton(nextCursor) {
+    const transactionList = document.querySelector('.list-group-flush');
+    if (!transactionList) return;
+    
+    let loadMoreButton = document.getElementById('load-more-transactions');
+    if (!nextCursor) {
+        if (loadMoreButton) loadMoreButton.remove();
+        return;
+    }
+    
+    if (!loadMoreButton) {
+        loadMoreButton = document.createElement('button');
+        loadMoreButton.id = 'load-more-transactions';
+        loadMoreButton.type = 'button';
+        loadMoreButton.className = 'btn btn-outline-secondary w-100 mt-3';
+        loadMoreButton.textContent = 'Load more';
+        transactionList.insertAdjacentElement('afterend', loadMoreButton);
+    }
+    loadMoreButton.onclick = () => loadTransactions(0, nextCursor);
+}
+
+/**
+ * Build the list item HTML for a single transaction
+ * @param {Object} transaction - Transaction from the API
+ * @returns {string} HTML of the list item
+ */
+function buildTransactionItemHTML(transaction) {
+    // Format the date for display
+    const transactionDate = new Date(transaction.date);
+    const formattedDate = transactionDate.toLocaleDateString();
+    
+    // Build the HTML for each transaction
+    return `
             <div class="list-group-item d-flex justify-content-between align-items-center transaction-item position-relative">
                 <div class="d-flex align-items-center">
                     <div class="custom-checkbox me-2">
@@ -610,10 +671,6 @@ function updateTransactionList(data) {
                 <div class="position-absolute top-0 bottom-0 end-0 transaction-indicator ${transaction.type === 'income' ? 'bg-success' : 'bg-danger'}" style="width: 4px;"></div>
             </div>
         `;
-    });
-    
-    // Update the transaction list
-    transactionList.innerHTML = transactionsHTML;
 }
 
 /**
@@ -624,7 +681,12 @@ function updateTransactionSummary(data) {
     // Update transaction count
     const transactionCountElement = document.getElementById('transaction-count');
     if (transactionCountElement) {
-        transactionCountElement.textContent = data.transactions ? data.transactions.length : 0;
+        // The API counts every matching transaction, not just the first page
+        if (data.count !== undefined) {
+            transactionCountElement.textContent = data.count;
+        } else {
+            transactionCountElement.textContent = data.transactions ? data.transactions.length : 0;
+        }
     }
     
     // If API doesn't provide summary data, calculate it from the transactions